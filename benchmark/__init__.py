@@ -0,0 +1,2 @@
+from .generate import NetworkShape, road_network
+from .suite import CONFIGURATIONS, SCALES, aggregation_columns, measure, report, run_suite
@@ -0,0 +1,33 @@
+"""Run the benchmark suite from the command line:
+
+    python -m benchmark run --scales tiny small --configurations batch batch-overlapping
+    python -m benchmark report
+"""
+import argparse
+from pathlib import Path
+
+import pandas as pd
+
+from .suite import CONFIGURATIONS, SCALES, report, run_suite
+
+DEFAULT_RESULTS = Path("benchmark_results.jsonl")
+
+parser = argparse.ArgumentParser(prog="python -m benchmark")
+commands = parser.add_subparsers(dest="command", required=True)
+
+run_parser = commands.add_parser("run", help="measure and append the results to the results file")
+run_parser.add_argument("--scales",         nargs="+", choices=list(SCALES),         default=["tiny", "small"])
+run_parser.add_argument("--configurations", nargs="+", choices=list(CONFIGURATIONS), default=list(CONFIGURATIONS))
+run_parser.add_argument("--repeat",  type=int,  default=3)
+run_parser.add_argument("--seed",    type=int,  default=0)
+run_parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+
+report_parser = commands.add_parser("report", help="summarise the results file by scale, configuration and revision")
+report_parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+
+arguments = parser.parse_args()
+if arguments.command == "run":
+    run_suite(arguments.scales, arguments.configurations, arguments.repeat, arguments.seed, arguments.results)
+else:
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(report(arguments.results))
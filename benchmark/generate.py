@@ -0,0 +1,90 @@
+"""Synthetic road networks shaped like the data in `noodle.ipynb`.
+
+Each road has two carriageways ("L" and "R"). Both sides cut every
+carriageway into consecutive segments independently of each other, so their
+boundaries rarely line up, and some segments are followed by a gap that no
+segment of that side covers.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class NetworkShape:
+    """Size and texture of a generated network"""
+    # number of roads; each has two carriageways
+    roads             :int
+    # left segments per carriageway
+    segments_per_road :int
+    # right segments per left segment; 1.0 segments both sides at about the same length
+    overlap_density   :float = 1.0
+    # fraction of segments followed by a gap in the data
+    gap_ratio         :float = 0.1
+    # mean left segment length, in metres
+    segment_length    :int   = 100
+
+
+_CARRIAGEWAYS = ("L", "R")
+_CATEGORIES   = np.array(list("ABCDEFGH"), dtype=object)
+
+
+def _segments(
+    random       :np.random.Generator,
+    count        :int,
+    mean_length  :float,
+    gap_ratio    :float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """`from` and `to` of `count` consecutive segments starting at 0, some followed by a gap"""
+    lengths = np.maximum(1, np.rint(random.exponential(mean_length, count))).astype(np.int64)
+    gaps    = np.where(
+        random.random(count) < gap_ratio,
+        np.maximum(1, np.rint(random.exponential(mean_length, count))).astype(np.int64),
+        0,
+    )
+    starts = np.concatenate([[0], np.cumsum(lengths + gaps)[:-1]])
+    return starts, starts + lengths
+
+
+def road_network(shape:NetworkShape, seed:int=0) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Left and right frames with columns like the notebook example:
+
+    - left:  road, cwy, slk_from, slk_to, left_measure, left_category
+    - right: road, cwy, slk_from, slk_to, right_measure, right_category
+
+    Both frames are sorted by (road, cwy, slk_from).
+    """
+    random = np.random.default_rng(seed)
+    right_count  = max(1, round(shape.segments_per_road * shape.overlap_density))
+    right_length = shape.segment_length / max(shape.overlap_density, 1e-9)
+
+    left_parts:list[pd.DataFrame]  = []
+    right_parts:list[pd.DataFrame] = []
+    for road_number in range(shape.roads):
+        road = f"H{road_number:04d}"
+        for cwy in _CARRIAGEWAYS:
+            slk_from, slk_to = _segments(random, shape.segments_per_road, shape.segment_length, shape.gap_ratio)
+            left_parts.append(pd.DataFrame({
+                "road"          : road,
+                "cwy"           : cwy,
+                "slk_from"      : slk_from,
+                "slk_to"        : slk_to,
+                "left_measure"  : random.integers(0, 100, len(slk_from)),
+                "left_category" : random.choice(_CATEGORIES, len(slk_from)),
+            }))
+            slk_from, slk_to = _segments(random, right_count, right_length, shape.gap_ratio)
+            right_parts.append(pd.DataFrame({
+                "road"           : road,
+                "cwy"            : cwy,
+                "slk_from"       : slk_from,
+                "slk_to"         : slk_to,
+                "right_measure"  : np.round(random.uniform(0, 10, len(slk_from)), 1),
+                "right_category" : random.choice(_CATEGORIES, len(slk_from)),
+            }))
+
+    return (
+        pd.concat(left_parts,  ignore_index=True),
+        pd.concat(right_parts, ignore_index=True),
+    )
@@ -0,0 +1,171 @@
+"""Time `merge_on_intervals` on generated networks and keep the results.
+
+Every measurement is one JSON object per line in a results file, so results
+from different engines, machines and revisions of the repository can be
+collected in one place and compared with `report`.
+"""
+from __future__ import annotations
+from dataclasses import asdict
+import datetime
+import gc
+import json
+import platform
+import subprocess
+from time import perf_counter
+import tracemalloc
+import warnings
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from merge import AST, merge_on_intervals
+from .generate import NetworkShape, road_network
+
+
+SCALES:dict[str, NetworkShape] = {
+    "tiny"   : NetworkShape(roads=2,   segments_per_road=50),
+    "small"  : NetworkShape(roads=10,  segments_per_road=200),
+    "medium" : NetworkShape(roads=50,  segments_per_road=500),
+    "large"  : NetworkShape(roads=200, segments_per_road=1000),
+}
+
+# keyword arguments of `merge_on_intervals` for each configuration
+CONFIGURATIONS:dict[str, dict[str, Any]] = {
+    "row"               : dict(engine="row",   right_rows="all"),
+    "row-overlapping"   : dict(engine="row",   right_rows="overlapping"),
+    "row-auto"          : dict(engine="row",   right_rows="auto"),
+    "batch"             : dict(engine="batch", right_rows="all"),
+    "batch-overlapping" : dict(engine="batch", right_rows="overlapping"),
+    "batch-auto"        : dict(engine="batch", right_rows="auto"),
+}
+
+JOIN_LEFT_ON = ["road", "cwy"]
+FROM_TO      = ("slk_from", "slk_to")
+
+
+def aggregation_columns() -> list[AST]:
+    """The aggregations used in `noodle.ipynb`"""
+    overlapping = AST.length_of_overlap() > 0
+    return [
+        AST.right_column("right_measure").filter(overlapping).sum().alias("sum"),
+        (
+            AST.right_column("right_measure") / AST.length_of_right() * AST.length_of_overlap()
+        ).filter(overlapping).sum().alias("proportional sum"),
+        (
+            (AST.right_column("right_measure").filter(overlapping) * AST.length_of_overlap()).sum()
+            / AST.length_of_overlap().filter(overlapping).sum()
+        ).alias("length weighted average"),
+        AST.right_column("right_measure").at_index(
+            AST.length_of_overlap().filter(overlapping).index_of_max()
+        ).alias("keep longest"),
+        AST.right_column("right_category").at_index(
+            AST.length_of_overlap().filter(overlapping).index_of_max()
+        ).alias("keep longest category"),
+    ]
+
+
+def _revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd            = Path(__file__).parent,
+            capture_output = True,
+            text           = True,
+            check          = True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(
+    left_data  :pd.DataFrame,
+    right_data :pd.DataFrame,
+    columns    :list[AST],
+    options    :dict[str, Any],
+    repeat     :int = 3,
+) -> dict[str, Any]:
+    """Best wall time of `repeat` merges, and the peak memory allocated by one more merge.
+
+    Memory is traced in a separate run because tracing slows allocation down.
+    """
+    def run() -> pd.DataFrame:
+        with warnings.catch_warnings():
+            # 0/0 for left rows without overlaps is expected
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return merge_on_intervals(left_data, right_data, JOIN_LEFT_ON, FROM_TO, columns, **options)
+
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        run()
+        times.append(perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"seconds": min(times), "seconds_all": times, "peak_bytes": peak}
+
+
+def run_suite(
+    scales         :Iterable[str] = ("tiny", "small"),
+    configurations :Iterable[str] = tuple(CONFIGURATIONS),
+    repeat         :int = 3,
+    seed           :int = 0,
+    results_path   :Optional[Path] = None,
+) -> list[dict[str, Any]]:
+    """Measure every configuration at every scale; each result is appended to `results_path` as it finishes"""
+    common = {
+        "revision"  : _revision(),
+        "timestamp" : datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "machine"   : platform.node(),
+        "python"    : platform.python_version(),
+        "numpy"     : np.__version__,
+        "pandas"    : pd.__version__,
+    }
+    columns = aggregation_columns()
+    results = []
+    for scale in scales:
+        shape = SCALES[scale]
+        left_data, right_data = road_network(shape, seed)
+        for configuration in configurations:
+            result = {
+                **common,
+                "scale"         : scale,
+                "shape"         : asdict(shape),
+                "left_rows"     : len(left_data),
+                "right_rows"    : len(right_data),
+                "configuration" : configuration,
+                "options"       : CONFIGURATIONS[configuration],
+                **measure(left_data, right_data, columns, CONFIGURATIONS[configuration], repeat),
+            }
+            results.append(result)
+            print(f"{scale:<8} {configuration:<20} {result['seconds']:10.3f} s {result['peak_bytes']/2**20:10.1f} MiB", flush=True)
+            if results_path is not None:
+                with open(results_path, "a", encoding="utf-8") as file:
+                    file.write(json.dumps(result) + "\n")
+    return results
+
+
+def load_results(results_path:Path) -> pd.DataFrame:
+    with open(results_path, encoding="utf-8") as file:
+        return pd.DataFrame([json.loads(line) for line in file if line.strip()])
+
+
+def report(results_path:Path) -> pd.DataFrame:
+    """Best time and peak memory per (scale, configuration) for each revision, for spotting regressions"""
+    results = load_results(results_path)
+    results["peak_mib"] = results["peak_bytes"] / 2**20
+    return (
+        results
+        .fillna({"revision": "unknown"})
+        .groupby(["scale", "configuration", "revision"], sort=False)
+        .agg(seconds=("seconds", "min"), peak_mib=("peak_mib", "max"), runs=("seconds", "size"))
+    )
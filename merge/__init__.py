@@ -1,2 +1,9 @@
 from ._ast import AST
-from ._merge import merge_on_intervals
\ No newline at end of file
+from ._merge import merge_on_intervals
+from ._stream import iter_merge_on_intervals
+from ._profile import MergeProfile
+from ._plan_cache import PlanCache
+from ._incremental import IncrementalMerge
+from ._service import MergeService, MergeClient
+from ._multi import merge_many_on_intervals
+from ._right_index import RightIndex
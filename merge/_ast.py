@@ -1,14 +1,17 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from re import S
-from typing import Any, Iterator, Literal, TypeVar, Union, Generator
-import itertools
-from xmlrpc.client import Boolean
+from typing import TYPE_CHECKING, Any, Callable, Hashable, Iterable, Iterator, Literal, Mapping, Optional, Union
+import threading
+import weakref
+from time import perf_counter
+import numpy as np
 import pandas as pd
 from collections import deque
 
 from ._util.nicks_itertools import is_last
 
+if TYPE_CHECKING:
+    from ._profile import MergeProfile
+
 
 Action = Literal[
     "left_column",
@@ -19,6 +22,8 @@ Action = Literal[
     "/",
     ">",
     "<",
+    ">=",
+    "<=",
     "==",
     "and",
     "or",
@@ -46,7 +51,12 @@ Action = Literal[
     "logical_not",
     "isna",
     "hstack",
-    "groupby"
+    "groupby",
+    "outputs",
+    "output",
+    "masked_dot",
+    "value_at_max",
+    "dominant",
 
 ]
 ASTChild = Union["AST", float, int, bool, str, slice]
@@ -54,6 +64,97 @@ ASTChild = Union["AST", float, int, bool, str, slice]
 Path_Value = tuple[list[int], ASTChild]
 
 
+def _index_of_max(series:pd.Series):
+    """The label of the largest value of `series`, the first of equal maxima.
+
+    Missing values are skipped, and the result is missing when no value is
+    left, like the batch engine and `_value_at_max`.
+    """
+    if series.empty or not series.notna().any():
+        return pd.NA
+    return series.idxmax()
+
+
+def _at_index(series:pd.Series, index:Any):
+    """The value of `series` at the label `index`, missing when there is no such label"""
+    try:
+        return series.loc[index]
+    except KeyError:
+        return pd.NA
+
+
+def _masked_dot(left:pd.Series, right:pd.Series, mask:pd.Series):
+    """Same as `(left.loc[mask] * right.loc[mask]).sum()`, without building the intermediate Series"""
+    if len(left) == len(right) == len(mask):
+        # equal length Series of one right group share the same index
+        left_values, right_values, keep = left.to_numpy(), right.to_numpy(), mask.to_numpy()
+        if left_values.dtype.kind in "biuf" and right_values.dtype.kind in "biuf" and keep.dtype == bool:
+            product = left_values[keep] * right_values[keep]
+            if product.dtype.kind == "f":
+                # skip NaN the way pandas does, by summing zeros in their place
+                return np.where(np.isnan(product), 0, product).sum()
+            return product.sum()
+    return (left.loc[mask] * right.loc[mask]).sum()
+
+
+def _value_at_max(series:pd.Series, key:pd.Series, mask:Union[pd.Series, bool]=True):
+    """Same as `series.at_index(key.loc[mask].index_of_max())`, without building the filtered Series.
+
+    The maximum is taken over the keys that are kept and not missing; ties go
+    to the first of them. The result is missing when no key is left, or when
+    `series` has no value at the chosen row.
+    """
+    if isinstance(mask, pd.Series):
+        if mask.dtype != bool or not key.index.equals(mask.index):
+            return _value_at_max(series, key.loc[mask])
+        keep = mask.to_numpy()
+    else:
+        keep = None
+    values = key.to_numpy()
+    if values.dtype.kind not in "biuf":
+        kept = key if keep is None else key[keep]
+        kept = kept[kept.notna()]
+        if kept.empty:
+            return pd.NA
+        position = key.index.get_loc(kept.idxmax())
+    else:
+        valid = np.ones(len(values), dtype=bool) if keep is None else keep
+        if values.dtype.kind == "f":
+            valid = valid & ~np.isnan(values)
+        if not valid.any():
+            return pd.NA
+        # argmax gives the first of equal maxima, like idxmax
+        candidates = np.flatnonzero(valid)
+        position = candidates[values[candidates].argmax()]
+    if series.index is key.index:
+        return series.iloc[position]
+    try:
+        return series.loc[key.index[position]]
+    except KeyError:
+        return pd.NA
+
+
+def _dominant(categories:pd.Series, weight:pd.Series):
+    """Same as `weight.groupby(categories).sum().index_of_max()`: the category with the largest total weight.
+
+    Missing categories are left out and missing weights count as zero; ties
+    go to the smallest category.
+    """
+    labels, weights = categories.to_numpy(), weight.to_numpy()
+    if labels.dtype.kind in "biuf" and weights.dtype.kind in "biuf" and categories.index.equals(weight.index):
+        valid = ~np.isnan(labels) if labels.dtype.kind == "f" else np.ones(len(labels), dtype=bool)
+        if not valid.any():
+            return pd.NA
+        uniques, inverse = np.unique(labels[valid], return_inverse=True)
+        kept = weights[valid].astype(float)
+        totals = np.bincount(inverse, np.where(np.isnan(kept), 0, kept), minlength=len(uniques))
+        return uniques[totals.argmax()]
+    totals = weight.groupby(categories).sum()
+    if totals.empty:
+        return pd.NA
+    return totals.idxmax()
+
+
 class AST_Slice_Maker:
     host:AST
     def __init__(self, host:AST) -> None:
@@ -69,15 +170,142 @@ class AST_Slice_Integer_Maker(AST_Slice_Maker):
     def __getitem__(self, slicer:slice) -> AST:
         return AST("slice_integer", (self.host, slicer))
 
-@dataclass(frozen=True)
+def evaluate_bottom_up(plan:ASTChild, apply:Callable[[AST, list[Any]], Any], profile:Optional[MergeProfile]=None) -> Any:
+    """`apply(node, values of its children)` for every node of `plan`, children first and left to right.
+
+    This is the walk of a recursive evaluator, including evaluating a shared
+    subtree each time it occurs, but with an explicit stack so that deep
+    plans do not hit the recursion limit. Literal children are their own
+    value. With a `profile`, the time of every node, inclusive of its
+    children, is recorded.
+    """
+    if not isinstance(plan, AST):
+        return plan
+    # node, its remaining children, the values of the children done so far, and when the node was entered
+    stack:list[tuple[AST, Iterator[ASTChild], list[Any], float]] = [(plan, iter(plan.children), [], perf_counter())]
+    try:
+        while True:
+            node, children, values, start = stack[-1]
+            for child in children:
+                if isinstance(child, AST):
+                    stack.append((child, iter(child.children), [], perf_counter()))
+                    break
+                values.append(child)
+            else:
+                result = apply(node, values)
+                stack.pop()
+                if profile is not None:
+                    profile.record(node, perf_counter() - start)
+                if not stack:
+                    return result
+                stack[-1][2].append(result)
+    except BaseException:
+        # like the `finally` of each level of a recursive walk
+        if profile is not None:
+            end = perf_counter()
+            for node, _children, _values, start in stack:
+                profile.record(node, end - start)
+        raise
+
+
+def _unpickle(table:list[tuple[Action, tuple[ASTChild, ...], tuple[tuple[int, int], ...]]]) -> AST:
+    """Rebuild the last node of a table made by `AST.__reduce__`"""
+    nodes:list[AST] = []
+    for action, literals, references in table:
+        children = list(literals)
+        for index, position in references:
+            children[index] = nodes[position]
+        nodes.append(AST(action, tuple(children)))
+    return nodes[-1]
+
+
+def _literal_key(value:ASTChild) -> Hashable:
+    """Key identifying a literal child; the type is included so that `1`, `1.0` and `True` stay distinct"""
+    if isinstance(value, slice):
+        # slices are not hashable before python 3.12
+        return ("slice", _literal_key(value.start), _literal_key(value.stop), _literal_key(value.step))
+    if isinstance(value, float):
+        # `-0.0 == 0.0`, but they give different results (`1 / -0.0`), so floats are told apart by repr
+        return (type(value).__name__, repr(value))
+    return (type(value).__name__, value)
+
+
 class AST:
+    """An immutable, interned node of a merge expression.
+
+    Nodes are hash-consed: building a node that is structurally equal to a
+    live node returns that same object. Structural equality of two nodes is
+    therefore identity (`a is b`), and the structural hash is computed once
+    when the node is built. Note that `==` builds an `"=="` node instead of
+    comparing.
+    """
+    __slots__ = ("action", "children", "_hash", "__weakref__")
+
     action:Action
     children:tuple[ASTChild, ...]
-    
-    # def __post_init__(self):
-    #     self.loc  = AST_Slice_Label_Maker  (self)
-    #     self.iloc = AST_Slice_Integer_Maker(self)
-    
+    _hash:int
+
+    _interned:weakref.WeakValueDictionary[Hashable, AST] = weakref.WeakValueDictionary()
+    _interned_lock = threading.Lock()
+
+    def __new__(cls, action:Action, children:Iterable[ASTChild]) -> AST:
+        children = tuple(children)
+        try:
+            # interned children are unique, so their identity stands in for their structure
+            key:Optional[Hashable] = (action, *(
+                ("AST", id(child)) if isinstance(child, AST) else _literal_key(child)
+                for child in children
+            ))
+            hash(key)
+        except TypeError:
+            # a literal we cannot hash; this node is simply not shared
+            key = None
+
+        with cls._interned_lock:
+            if key is not None:
+                existing = cls._interned.get(key)
+                if existing is not None:
+                    return existing
+            node = super().__new__(cls)
+            object.__setattr__(node, "action", action)
+            object.__setattr__(node, "children", children)
+            object.__setattr__(node, "_hash", hash((action, *(
+                child._hash if isinstance(child, AST) else id(child) if key is None else _literal_key(child)
+                for child in children
+            ))))
+            if key is not None:
+                cls._interned[key] = node
+            return node
+
+    def __setattr__(self, name:str, value:Any) -> None:
+        raise AttributeError("AST nodes are immutable")
+
+    def __delattr__(self, name:str) -> None:
+        raise AttributeError("AST nodes are immutable")
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self):
+        # rebuilding through the constructor re-interns the node in the receiving process;
+        # the nodes go as a flat table, children first, so that deep plans do not make pickle recurse
+        positions:dict[int, int] = {}
+        table:list[tuple[Action, tuple[ASTChild, ...], tuple[tuple[int, int], ...]]] = []
+        for node in AST._post_order(self):
+            positions[id(node)] = len(table)
+            table.append((
+                node.action,
+                tuple(None if isinstance(child, AST) else child for child in node.children),
+                tuple((index, positions[id(child)]) for index, child in enumerate(node.children) if isinstance(child, AST)),
+            ))
+        return (_unpickle, (table,))
+
+    def __copy__(self) -> AST:
+        return self
+
+    def __deepcopy__(self, memo:dict) -> AST:
+        return self
+
     def __repr__(self):
         return f"⟨AST {self.action}" + (
             f" {self.children[0]}⟩"
@@ -85,7 +313,7 @@ class AST:
             else "⟩"
         )
 
-    def to_string(self, indent:str="", is_parents_last=False)->str:
+    def to_string(self, indent:str="", is_parents_last=False, annotate:Optional[Callable[[AST], str]]=None)->str:
         if len(indent) != 0:
             modified_indent = indent[:-3]+" ┠╴"
             if is_parents_last:
@@ -95,11 +323,13 @@ class AST:
         
 
         out = f"\n{modified_indent}⟨{self.action}⟩"
+        if annotate is not None:
+            out += annotate(self)
         if len(self.children)>0:
             *children_tail, children_head = self.children
             for islast, child in is_last(iter(self.children)):
                 if isinstance(child, AST):
-                    out+=child.to_string(indent+(" ┃ " if not islast else "   "), islast)
+                    out+=child.to_string(indent+(" ┃ " if not islast else "   "), islast, annotate)
                 elif isinstance(child, str):
                     out+=f'\n{indent+(" ┖╴" if islast else " ┠╴")}"{child}"'
                 else:
@@ -111,9 +341,8 @@ class AST:
 
     @staticmethod
     def clone(myast:ASTChild) -> ASTChild:
-        if not isinstance(myast, AST):
-            return myast
-        return AST(myast.action, tuple(map(AST.clone, myast.children)))
+        # nodes are immutable and interned, so a clone is the node itself
+        return myast
 
     @staticmethod
     def left_column(name:str) -> AST:
@@ -175,6 +404,12 @@ class AST:
 
     def __lt__(self, other:ASTChild) -> AST:
         return AST("<",(self, other))
+
+    def __ge__(self, other:ASTChild) -> AST:
+        return AST(">=",(self, other))
+
+    def __le__(self, other:ASTChild) -> AST:
+        return AST("<=",(self, other))
     
     def __eq__(self, other:ASTChild) -> AST:
         return AST("==",(self, other))
@@ -223,6 +458,9 @@ class AST:
     def at_index(self, idx:ASTChild) -> AST:
         return AST("at_index",(self, idx))
     
+    def dominant(self, weight:ASTChild) -> AST:
+        return AST("dominant", (self, weight))
+
     def astype(self, typ:str) -> AST:
         return AST("astype",(self, typ))
     
@@ -241,31 +479,39 @@ class AST:
     def refer(name:str) -> AST:
         return AST("refer", (name,))
 
+    @staticmethod
+    def outputs(named:Iterable[tuple[str, ASTChild]]) -> AST:
+        """Several named values computed together; evaluates to a tuple holding one value per output"""
+        return AST("outputs", tuple(AST("output", (name, value)) for name, value in named))
+
+    @staticmethod
+    def output_names(plan:ASTChild) -> list[str]:
+        """Names of the outputs of a plan built by `AST.outputs` or `AST.optimize_columns`"""
+        if isinstance(plan, AST) and plan.action == "execute":
+            plan = plan.children[-1]
+        if not isinstance(plan, AST) or plan.action != "outputs":
+            raise Exception(f"Expected a plan with named outputs, found {plan!r}")
+        return [output.children[0] for output in plan.children]  # type: ignore[union-attr]
+
     @staticmethod
     def evaluate(
         myast:AST,
-        left_columns      :pd.Series,    # one row of the left dataframe, as a series where the index are the column names of the left dataframe
+        left_columns      :Mapping[str, Any],    # one row of the left data; a series or dict keyed by the column names of the left data
         length_of_left    :float,
-        right_columns     :pd.DataFrame,
+        right_columns     :Mapping[str, pd.Series],  # the right rows; a dataframe or dict of series sharing one index
         length_of_right   :pd.Series,
         length_of_overlap :pd.Series,
+        profile           :Optional[MergeProfile] = None,
     ):
+        """Evaluate `myast` for one left row.
+
+        If a `MergeProfile` is given, the time spent in and the number of
+        calls to every node are added to it.
+        """
         
         context:dict[str,Any] = {}
 
-        def walker(myast:ASTChild):
-
-            nonlocal right_columns
-            nonlocal left_columns
-            nonlocal length_of_left
-            nonlocal right_columns
-            nonlocal length_of_right
-            nonlocal length_of_overlap
-
-            nonlocal context
-
-            if not isinstance(myast, AST):
-                return myast
+        def apply(myast:AST, walker_children:list[Any]):
 
             if myast.action == "left_column":
                 return left_columns[myast.children[0]]
@@ -288,18 +534,23 @@ class AST:
             if myast.action == "fraction_of_right":
                 return length_of_right / length_of_overlap
 
-            # walk children in advance to help with future error checking
-            walker_children = [walker(child) for child in myast.children]
+            if myast.action == "execute":
+                # the declarations have been evaluated in order, before the final expression
+                return walker_children[-1]
 
             if myast.action == "filter":
                 series, mask = walker_children
-                # todo: the checks below are not good
-                if not isinstance(series, (pd.Series, pd.DataFrame)):
-                    raise Exception(f"Unable to filter object {series} that is not a Series or DataFrame")
-                if not mask.dtype == bool:
-                    raise Exception(f"Filter mask is not a boolean series {mask}")
                 return series.loc[mask]
 
+            if myast.action == "masked_dot":
+                return _masked_dot(*walker_children)
+
+            if myast.action == "value_at_max":
+                return _value_at_max(*walker_children)
+
+            if myast.action == "dominant":
+                return _dominant(*walker_children)
+
             if myast.action == "sum":
                 #if not isinstance(walker_children[0], (pd.Series, pd.DataFrame, pd.Gro)):
                 #    raise Exception(f"Unable to sum object {walker_children[0]} which is not Series or DataFrame")
@@ -323,6 +574,12 @@ class AST:
             if myast.action == "<":
                 return walker_children[0] < walker_children[1]
 
+            if myast.action == ">=":
+                return walker_children[0] >= walker_children[1]
+
+            if myast.action == "<=":
+                return walker_children[0] <= walker_children[1]
+
             if myast.action == "neg":
                 return -walker_children[0]
             
@@ -339,12 +596,7 @@ class AST:
                 return walker_children[0].astype(walker_children[1])
             
             if myast.action == "index_of_max":
-                series = walker_children[0]
-                if not isinstance(series, pd.Series):
-                    raise Exception(f"unable to find index of maximum for object that is not Series {series}")
-                if series.empty:
-                    return pd.NA
-                return series.idxmax()
+                return _index_of_max(walker_children[0])
             
             if myast.action == "isna":
                 return walker_children[0].isna()
@@ -353,18 +605,15 @@ class AST:
                 ser = walker_children[0]
                 return ser.loc[walker_children[1]]
             
-            if myast.action == "slice_index":
+            if myast.action == "slice_integer":
                 ser = walker_children[0]
                 return ser.iloc[walker_children[1]]
 
             if myast.action == "at_index":
-                try:
-                    return walker_children[0].loc[walker_children[1]]
-                except KeyError:
-                    return pd.NA
+                return _at_index(walker_children[0], walker_children[1])
             
             if myast.action == "hstack":
-                return pd.concat([walker(each_ast) for each_ast in myast.children], axis="columns")
+                return pd.concat(walker_children, axis="columns")
 
             if myast.action == "groupby":
                 return walker_children[0].groupby(walker_children[1])
@@ -379,44 +628,81 @@ class AST:
             if myast.action == "refer":
                 return context[walker_children[0]]
 
-            if myast.action == "execute":
-                *preliminary, last = myast.children
-                for item in preliminary:
-                    walker(item)
-                return walker(last)
-                
+            if myast.action == "outputs":
+                return tuple(walker_children)
+
+            if myast.action == "output":
+                return walker_children[1]
 
             raise Exception(f"Unexpected Node: {myast.action}")
 
-        return walker(myast)
+        return evaluate_bottom_up(myast, apply, profile)
     
+    @staticmethod
+    def compile(plan:ASTChild):
+        """Compile `plan` (usually the output of `AST.optimize`) into a Python function.
+
+        The function takes the same keyword arguments as `AST.evaluate`
+        (without `myast`) and returns the same result. Compiled functions
+        are cached while their plan is alive, so compiling an equal plan
+        again is cheap. Raises `NotImplementedError` for nodes that cannot be
+        compiled.
+        """
+        from ._compile import compile_plan
+        return compile_plan(plan)
+
+    @staticmethod
+    def plan_graph(plan:ASTChild):
+        """The declarations and outputs of an optimized plan with the declarations each depends on; see `merge._schedule`"""
+        from ._schedule import plan_graph
+        return plan_graph(plan)
+
+    @staticmethod
+    def infer_types(plan:ASTChild, left_dtypes:Optional[dict]=None, right_dtypes:Optional[dict]=None):
+        """The kind, dtype and nullability of every node of `plan`, keyed by `id(node)`; see `merge._types`.
+
+        Raises `PlanTypeError` for plans that cannot be evaluated, so that
+        `AST.evaluate` does not have to check on every row.
+        """
+        from ._types import infer_types
+        return infer_types(plan, left_dtypes, right_dtypes)
+
+    @staticmethod
+    def to_json(plan:ASTChild) -> str:
+        """Serialize `plan` (an AST or the output of `AST.optimize`) to versioned JSON; see `merge._serialize`"""
+        from ._serialize import dumps
+        return dumps(plan)
+
+    @staticmethod
+    def from_json(text:str) -> ASTChild:
+        """Rebuild a plan from `AST.to_json`"""
+        from ._serialize import loads
+        return loads(text)
+
     @staticmethod
     def compare_equal(left:ASTChild, right:ASTChild) -> bool:
         if isinstance(left, AST) and isinstance(right, AST):
-            if left.action == right.action and len(left.children)==len(right.children):
+            if left is right:
+                return True
+            # interned nodes only differ from a structurally equal node when they hold an unhashable literal
+            if left._hash == right._hash and left.action == right.action and len(left.children)==len(right.children):
                 return all(map(AST.compare_equal, left.children, right.children))
         elif not isinstance(left, AST) and not isinstance(right, AST):
-            return left == right
+            return _literal_key(left) == _literal_key(right)
         #else:
             # one of the two IS an AST
         return False
     
     @staticmethod          
     def columns_required(myast:ASTChild) -> tuple[set[str], set[str]]:
-        if not isinstance(myast, AST):
-            return (set(), set())
-        elif myast.action == "left_column":
-            column_name:str = myast.children[0]  # type: ignore
-            return ({column_name}, set())
-        elif myast.action=="right_column":
-            column_name:str = myast.children[0]  # type: ignore
-            return (set(), {column_name})
-        else:
-            result = [AST.columns_required(sub_ast) for sub_ast in myast.children]
-            return (
-                set().union(*(a for a,b in result)),
-                set().union(*(b for a,b in result))
-            )
+        left:set[str] = set()
+        right:set[str] = set()
+        for node in AST._post_order(myast):
+            if node.action == "left_column":
+                left.add(node.children[0])  # type: ignore
+            elif node.action == "right_column":
+                right.add(node.children[0])  # type: ignore
+        return (left, right)
 
     
     @staticmethod
@@ -447,31 +733,37 @@ class AST:
 
     @staticmethod
     def output_column_name_simple(myast:ASTChild):
-        def walker(myast:ASTChild, accumulator:list[str]) -> list[str]:
-            if not isinstance(myast, AST):
-                return accumulator
-            else:                
-                if myast.action == "left_column" or myast.action == "right_column":
-                    return [*accumulator, myast.children[0]]
-                elif len(myast.children) == 0:
-                    return [*accumulator, myast.action]
-                elif myast.action == "alias":
-                    return [*accumulator, myast.children[1]]
-                elif myast.action == "filter":
-                    return [*accumulator, *itertools.chain(walker(myast.children[0], []))]
-                else:
-                    return [*accumulator, *itertools.chain(*[walker(item, []) for item in myast.children])]
-
-        return walker(myast,[])[0]
+        # the first name found walking left to right, with an explicit stack so that deep plans do not hit the recursion limit
+        nodes_to_visit:list[ASTChild] = [myast]
+        while nodes_to_visit:
+            item = nodes_to_visit.pop()
+            if not isinstance(item, AST):
+                continue
+            if item.action == "left_column" or item.action == "right_column":
+                return item.children[0]
+            elif len(item.children) == 0:
+                return item.action
+            elif item.action == "alias":
+                return item.children[1]
+            elif item.action == "filter":
+                nodes_to_visit.append(item.children[0])
+            else:
+                nodes_to_visit.extend(reversed(item.children))
+        raise Exception(f"Unable to name a column without any column or length in it: {myast!r}")
     
     @staticmethod
     def equal_or_contains(left:ASTChild, right:ASTChild) -> bool:
-        if AST.compare_equal(left, right):
-            return True
-        elif isinstance(left, AST):
-            return any(AST.equal_or_contains(child, right) for child in left.children)
-        else:
-            return False
+        # shared subtrees are only searched once
+        visited:set[int] = set()
+        nodes_to_visit:list[ASTChild] = [left]
+        while nodes_to_visit:
+            item = nodes_to_visit.pop()
+            if AST.compare_equal(item, right):
+                return True
+            if isinstance(item, AST) and id(item) not in visited:
+                visited.add(id(item))
+                nodes_to_visit.extend(item.children)
+        return False
 
     @staticmethod
     def follow_path(ast:ASTChild, path:list[int]):
@@ -532,80 +824,95 @@ class AST:
     def max_depth(some_ast:ASTChild) -> int:
         if not isinstance(some_ast, AST):
             return 1
-        else:
-            return 1 + max(AST.max_depth(child) for child in some_ast.children)
+        depths:dict[int, int] = {}
+        for node in AST._post_order(some_ast):
+            depths[id(node)] = 1 + max((depths[id(child)] if isinstance(child, AST) else 1 for child in node.children), default=0)
+        return depths[id(some_ast)]
         
 
     @staticmethod
-    def optimize(myast:ASTChild):
-        
-        myast = AST.clone(myast)
-
-        # obtain a list of repeated subtrees
-        unique_subtrees = AST.unique_subtrees(myast)
-        repeated_subtrees:list[tuple[ASTChild, list[list[int]]]] = [
-            (AST.follow_path(myast, paths[0]), paths)
-            for paths in unique_subtrees.values()
-            if len(paths)>1
-        ]
-        
-        # get a list of declare and refer objects
-        declared = [
-            (
-                paths,
-                AST.declare(f"subtree_{name}", tree),
-                AST.refer(f"subtree_{name}"),
-            )
-            for name, (tree, paths) 
-            in enumerate(repeated_subtrees)
-        ]
-
-        # explode entries by `paths` such that there is one entry per path
-        declared_exploded = [
-            (path, declare, refer)
-            for paths, declare, refer in declared 
-            for path in paths
-        ]
-        
-        # sort (inplace) declared_exploded by length of path
-        declared_exploded.sort(
-            key=lambda item:len(item[0]),
-            reverse=True
+    def _post_order(myast:ASTChild) -> list[AST]:
+        """Each distinct node under `myast` once, children before parents"""
+        if not isinstance(myast, AST):
+            return []
+        order:list[AST] = []
+        visited:set[int] = {id(myast)}
+        stack:list[tuple[AST, Iterator[ASTChild]]] = [(myast, iter(myast.children))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if isinstance(child, AST) and id(child) not in visited:
+                    visited.add(id(child))
+                    stack.append((child, iter(child.children)))
+                    break
+            else:
+                stack.pop()
+                order.append(node)
+        return order
+
+    @staticmethod
+    def optimize(myast:ASTChild, rewrite:bool=True):
+        """Replace every subtree that occurs more than once with a `refer` to a single `declare`.
+
+        Unless `rewrite` is False, the algebraic rewrites of `merge._rewrite`
+        (constant folding, filter fusion...) are applied first. Runs in time
+        linear in the number of distinct nodes; the input is not modified.
+        """
+        if rewrite:
+            from ._rewrite import rewrite_plan
+            myast = rewrite_plan(myast)
+        post_order = AST._post_order(myast)
+
+        # number of times each distinct node occurs in the (unshared) tree; parents are visited before children
+        occurrences:dict[int, int] = {id(node):0 for node in post_order}
+        if isinstance(myast, AST):
+            occurrences[id(myast)] = 1
+        for node in reversed(post_order):
+            for child in node.children:
+                if isinstance(child, AST):
+                    occurrences[id(child)] += occurrences[id(node)]
+
+        # name repeated subtrees in breadth first order of their first appearance
+        names:dict[int, str] = {}
+        if isinstance(myast, AST):
+            visited:set[int] = {id(myast)}
+            nodes_to_visit:deque[AST] = deque([myast])
+            while nodes_to_visit:
+                node = nodes_to_visit.popleft()
+                for child in node.children:
+                    if isinstance(child, AST) and id(child) not in visited:
+                        visited.add(id(child))
+                        # an output stays in place even if it is repeated, so that its name can still be found
+                        if occurrences[id(child)] > 1 and child.action != "output":
+                            names[id(child)] = f"subtree_{len(names)}"
+                        nodes_to_visit.append(child)
+
+        # rebuild bottom up, referring to repeated subtrees by name
+        rebuilt:dict[int, AST] = {}
+        for node in post_order:
+            rebuilt[id(node)] = AST(node.action, tuple(
+                (AST.refer(names[id(child)]) if id(child) in names else rebuilt[id(child)])
+                if isinstance(child, AST) else child
+                for child in node.children
+            ))
+
+        # post order puts every declaration after the declarations it refers to
+        declarations = tuple(
+            AST.declare(names[id(node)], rebuilt[id(node)])
+            for node in post_order
+            if id(node) in names
         )
+        return AST.execute(declarations + ((rebuilt[id(myast)] if isinstance(myast, AST) else myast),))
 
-        # replace tree parts with refers
-        for path, _declare, refer in  declared_exploded:
-            *path_tail, path_head = path
-            subtree_parent_ast = AST.follow_path(myast, path_tail)
-            if not isinstance(subtree_parent_ast, AST):
-                raise Exception("Tried to replace subtree with reference during optimization but failed because the subtree parent did not have children.")
-            # we cannot assign to indexed tuple, so we make a copy
-            replacement_children = list(subtree_parent_ast.children)
-            replacement_children[path_head] = refer
-            # we cannot assign to children because we froze the class
-            # there is no option to override the runtime error :/
-            # perhaps converting to tuple was a bad idea :/
-            subtree_parent_ast.children = tuple(replacement_children)
-        
-        # confirm dependency order by swapping declarations that depend on each other
-        swap_count = 0
-        start_again = True
-        while start_again and swap_count<50:
-            start_again = False
-            for i in range(len(declared)):
-                for j in range(i+1, len(declared)):
-                    _, declare_first,  refer_first  = declared[i]
-                    _, declare_second, refer_second = declared[j]
-                    
-                    if AST.equal_or_contains(declare_first, refer_second):
-                        print("swap")
-                        declared[i],declared[j] = declared[j],declared[i] 
-                        swap_count += 1
-                        start_again = True
-                        break
-                if start_again:
-                    break
-        if start_again and swap_count==50:
-            raise Exception("Compilation failed... probably caused by a circular reference. I thought it wasn't possible, but you did it!")
-        
-        return AST.execute(tuple(declare for _path, declare, _refer in declared)+(myast,))
+    @staticmethod
+    def optimize_columns(columns:list[ASTChild], names:Optional[list[str]]=None) -> AST:
+        """Optimize several columns together into one plan with named outputs.
+
+        Subtrees shared between columns are declared once, so they are only
+        computed once per row (or join group) for all columns. The plan
+        evaluates to a tuple with one value per column; `names` defaults to
+        `AST.output_column_name_simple` of each column.
+        """
+        if names is None:
+            names = [AST.output_column_name_simple(column) for column in columns]
+        return AST.optimize(AST.outputs(zip(names, columns)))
@@ -0,0 +1,534 @@
+"""Evaluate planned ASTs once per join group, for all left rows together.
+
+`AST.evaluate` works on one left row at a time; every value it produces is
+either a scalar or a pandas Series indexed by the right group. The batch
+engine keeps the same meaning but stacks the left rows of a group together:
+
+- a left scalar becomes a 1-D array with one entry per left row,
+- a right Series becomes a `Pairwise` array with one entry per
+  (left row, right row) pair of a `PairTable`.
+
+A `PairTable` is a flat list of pairs in CSR form: the entries for left row
+`i` are `offsets[i]:offsets[i+1]`. It either holds every pair of the group
+or only the overlapping ones, so memory scales with the number of pairs that
+are actually visited. Reductions (`sum`, `index_of_max`, `at_index`, grouped
+sums) run as segmented NumPy reductions over those offsets.
+
+Filtering does not remove entries from a `Pairwise`; instead it clears the
+`present` mask, which plays the role of the pandas index. Binary operations
+follow pandas alignment rules: the result is present where either side is
+present, and the missing side is filled with NaN (or False for masks).
+"""
+from __future__ import annotations
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST, ASTChild, evaluate_bottom_up
+from ._interval_index import IntervalIndex
+from ._profile import MergeProfile
+from ._schedule import plan_graph, run_graph
+
+
+# actions the batch engine knows how to evaluate;
+# plans using anything else are evaluated with the row loop instead
+BATCH_ACTIONS = {
+    "left_column",
+    "right_column",
+    "length_of_overlap",
+    "length_of_left",
+    "length_of_right",
+    "fraction_of_left",
+    "fraction_of_right",
+    "filter",
+    "sum",
+    "masked_dot",
+    "value_at_max",
+    "dominant",
+    "+",
+    "-",
+    "*",
+    "/",
+    ">",
+    "<",
+    ">=",
+    "<=",
+    "neg",
+    "and",
+    "or",
+    "not",
+    "astype",
+    "index_of_max",
+    "isna",
+    "at_index",
+    "groupby",
+    "alias",
+    "declare",
+    "refer",
+    "execute",
+    "outputs",
+    "output",
+}
+
+
+@dataclass(frozen=True)
+class PairTable:
+    """Flat (left row, entry) pairs in CSR form.
+
+    `left_idx[k]` is the left row of entry `k`; entries of left row `i` are
+    `offsets[i]:offsets[i+1]`. `labels[k]` is the pandas index label the
+    entry would have had. `right_idx` is the position of the right row for
+    tables built from the join, and None for tables produced by `groupby`.
+    """
+    left_idx  :np.ndarray
+    offsets   :np.ndarray
+    labels    :np.ndarray
+    right_idx :Optional[np.ndarray]
+
+    @property
+    def row_count(self) -> int:
+        return len(self.offsets) - 1
+
+    @staticmethod
+    def all_pairs(left_count:int, right_labels:np.ndarray) -> PairTable:
+        """Every left row paired with every right row of the group"""
+        right_count = len(right_labels)
+        right_idx   = np.tile(np.arange(right_count), left_count)
+        return PairTable(
+            left_idx  = np.repeat(np.arange(left_count), right_count),
+            offsets   = np.arange(left_count + 1) * right_count,
+            labels    = right_labels[right_idx],
+            right_idx = right_idx,
+        )
+
+    @staticmethod
+    def overlapping_pairs(
+        left_from    :np.ndarray,
+        left_to      :np.ndarray,
+        right_index  :IntervalIndex,
+        right_labels :np.ndarray,
+    ) -> PairTable:
+        """Only pairs that overlap by more than zero, found with the interval index"""
+        offsets, right_idx = right_index.query_many(left_from, left_to)
+        return PairTable(
+            left_idx  = np.repeat(np.arange(len(left_from)), np.diff(offsets)),
+            offsets   = offsets,
+            labels    = right_labels[right_idx],
+            right_idx = right_idx,
+        )
+
+    def subset(self, keep:np.ndarray) -> PairTable:
+        """The pairs where `keep` is True, in the same order"""
+        left_idx = self.left_idx[keep]
+        return PairTable(
+            left_idx  = left_idx,
+            offsets   = np.searchsorted(left_idx, np.arange(self.row_count + 1), side="left"),
+            labels    = self.labels[keep],
+            right_idx = None if self.right_idx is None else self.right_idx[keep],
+        )
+
+
+@dataclass(frozen=True)
+class Pairwise:
+    """A right-indexed Series for every left row of a group; one value per entry of `pairs`.
+
+    `present` (None means all entries are present) marks the entries that
+    the equivalent pandas Series would contain.
+    """
+    values  :np.ndarray
+    present :Optional[np.ndarray]
+    pairs   :PairTable
+
+
+@dataclass(frozen=True)
+class Grouped:
+    """The result of `Pairwise.groupby`; `codes` index into `uniques`, -1 is dropped."""
+    series  :Pairwise
+    codes   :np.ndarray
+    uniques :np.ndarray
+
+
+def supports(myast:ASTChild) -> bool:
+    """True if every node of `myast` can be evaluated by the batch engine"""
+    return all(node.action in BATCH_ACTIONS for node in AST._post_order(myast))
+
+
+def _segment_reduce(ufunc:np.ufunc, values:np.ndarray, offsets:np.ndarray, identity:Any) -> np.ndarray:
+    """`ufunc.reduceat` over each segment of `values`; empty segments give `identity`"""
+    starts = offsets[:-1]
+    # pad so that trailing empty segments still have a valid start index
+    padded = np.append(values, np.array(identity, dtype=values.dtype))
+    result = ufunc.reduceat(padded, starts)
+    result[starts == offsets[1:]] = identity
+    return result
+
+
+def _fill_absent(item:Pairwise) -> np.ndarray:
+    """Values of `item` with absent entries replaced the way pandas alignment would"""
+    if item.present is None:
+        return item.values
+    if item.values.dtype == bool:
+        return np.where(item.present, item.values, False)
+    if item.values.dtype.kind in "iuf":
+        return np.where(item.present, item.values.astype(float), np.nan)
+    return np.where(item.present, item.values, np.nan)
+
+
+def _union_present(left:Pairwise, right:Pairwise) -> Optional[np.ndarray]:
+    if left.present is None or right.present is None:
+        return None
+    return left.present | right.present
+
+
+def _binary(operation:Callable[[Any, Any], Any], left:Any, right:Any) -> Any:
+    if isinstance(left, Pairwise) and isinstance(right, Pairwise):
+        if left.pairs is not right.pairs:
+            raise Exception("Unable to combine series that are indexed by different labels in the batch engine")
+        return Pairwise(
+            operation(_fill_absent(left), _fill_absent(right)),
+            _union_present(left, right),
+            left.pairs,
+        )
+    if isinstance(left, Pairwise):
+        if isinstance(right, np.ndarray):
+            right = right[left.pairs.left_idx]
+        return Pairwise(operation(left.values, right), left.present, left.pairs)
+    if isinstance(right, Pairwise):
+        if isinstance(left, np.ndarray):
+            left = left[right.pairs.left_idx]
+        return Pairwise(operation(left, right.values), right.present, right.pairs)
+    return operation(left, right)
+
+
+def _unary(operation:Callable[[Any], Any], item:Any) -> Any:
+    if isinstance(item, Pairwise):
+        return Pairwise(operation(item.values), item.present, item.pairs)
+    return operation(item)
+
+
+def _valid(item:Pairwise) -> np.ndarray:
+    """Entries that take part in a reduction; absent entries and NaN are skipped like pandas does"""
+    valid = np.ones(len(item.values), dtype=bool) if item.present is None else item.present
+    if item.values.dtype.kind in "fc":
+        valid = valid & ~np.isnan(item.values)
+    elif item.values.dtype == object:
+        valid = valid & ~pd.isna(item.values)
+    return valid
+
+
+def _sum(item:Any) -> Any:
+    if isinstance(item, Grouped):
+        return _grouped_sum(item)
+    if not isinstance(item, Pairwise):
+        raise Exception(f"Unable to sum object {item} which is not Series or DataFrame")
+    valid = _valid(item)
+    if item.values.dtype.kind in "biu":
+        return _segment_reduce(np.add, np.where(valid, item.values, 0), item.pairs.offsets, 0)
+    return _segment_reduce(np.add, np.where(valid, item.values, 0.0), item.pairs.offsets, 0.0)
+
+
+def _filter(series:Any, mask:Any) -> Pairwise:
+    if not isinstance(series, Pairwise):
+        raise Exception(f"Unable to filter object {series} that is not a Series or DataFrame")
+    if not isinstance(mask, Pairwise) or not mask.values.dtype == bool:
+        raise Exception(f"Filter mask is not a boolean series {mask}")
+    keep = mask.values if mask.present is None else mask.values & mask.present
+    return Pairwise(
+        series.values,
+        keep if series.present is None else series.present & keep,
+        series.pairs,
+    )
+
+
+def _masked_dot(left:Any, right:Any, mask:Any) -> np.ndarray:
+    return _sum(_filter(_binary(np.multiply, left, right), mask))
+
+
+def _groupby(item:Any, grouper:Any) -> Grouped:
+    if not isinstance(item, Pairwise):
+        raise Exception(f"Unable to group object {item} which is not a Series")
+    if not isinstance(grouper, Pairwise):
+        raise Exception(f"Unable to group by object {grouper} which is not a Series")
+    if item.pairs is not grouper.pairs:
+        raise Exception("Unable to group by a series that is indexed by different labels in the batch engine")
+    codes, uniques = pd.factorize(grouper.values, sort=True)
+    if grouper.present is not None:
+        codes = np.where(grouper.present, codes, -1)
+    return Grouped(item, codes, np.asarray(uniques))
+
+
+def _grouped_sum(grouped:Grouped) -> Pairwise:
+    item        = grouped.series
+    pairs       = item.pairs
+    group_count = max(len(grouped.uniques), 1)
+    member      = grouped.codes >= 0
+    if item.present is not None:
+        member &= item.present
+    valid       = member & _valid(item)
+
+    # each (left row, group) becomes one entry of a new pair table, sorted by row then group
+    keys = pairs.left_idx[member] * group_count + grouped.codes[member]
+    group_keys, entry = np.unique(keys, return_inverse=True)
+    totals = np.bincount(
+        entry,
+        weights   = np.where(valid[member], item.values[member], 0).astype(float),
+        minlength = len(group_keys),
+    )
+    if item.values.dtype.kind in "biu":
+        totals = totals.astype(np.int64)
+
+    left_idx = group_keys // group_count
+    grouped_pairs = PairTable(
+        left_idx  = left_idx,
+        offsets   = np.searchsorted(left_idx, np.arange(pairs.row_count + 1), side="left"),
+        labels    = grouped.uniques[group_keys % group_count],
+        right_idx = None,
+    )
+    return Pairwise(totals, None, grouped_pairs)
+
+
+def _max_entries(item:Pairwise) -> np.ndarray:
+    """The entry of the maximum of each left row; `len(item.values)` for rows without a valid entry"""
+    pairs    = item.pairs
+    valid    = _valid(item)
+    values   = np.where(valid, item.values, -np.inf).astype(float)
+    maximum  = _segment_reduce(np.maximum, values, pairs.offsets, -np.inf)
+    # the first valid entry holding the maximum of its row, like pandas idxmax
+    is_max   = valid & (values == maximum[pairs.left_idx])
+    entries  = np.arange(len(values))
+    return _segment_reduce(np.minimum, np.where(is_max, entries, len(values)), pairs.offsets, len(values))
+
+
+def _index_of_max(item:Any) -> np.ndarray:
+    if not isinstance(item, Pairwise):
+        raise Exception(f"unable to find index of maximum for object that is not Series {item}")
+    pairs  = item.pairs
+    result = np.full(pairs.row_count, pd.NA, dtype=object)
+    if len(item.values) == 0:
+        return result
+    position = _max_entries(item)
+    has_any  = position < len(item.values)
+    result[has_any] = pairs.labels[position[has_any]]
+    return result
+
+
+def _value_at_max(item:Any, key:Any, mask:Any) -> np.ndarray:
+    """`item.at_index(key.filter(mask).index_of_max())` as one argmax and gather over the pairs"""
+    if mask is not True:
+        key = _filter(key, mask)
+    if not (isinstance(item, Pairwise) and isinstance(key, Pairwise) and item.pairs is key.pairs):
+        return _at_index(item, _index_of_max(key))
+    result = np.full(item.pairs.row_count, pd.NA, dtype=object)
+    if len(key.values) == 0:
+        return result
+    # both are indexed by the same pairs, so the entry of the maximum is also the entry to read
+    position = _max_entries(key)
+    found    = position < len(key.values)
+    if item.present is not None:
+        found[found] = item.present[position[found]]
+    result[found] = item.values[position[found]]
+    return result
+
+
+def _at_index(item:Any, index:Any) -> np.ndarray:
+    if not isinstance(item, Pairwise):
+        raise Exception(f"Unable to look up an index in object {item} which is not a Series")
+    pairs  = item.pairs
+    result = np.full(pairs.row_count, pd.NA, dtype=object)
+    index  = np.broadcast_to(np.asarray(index, dtype=object), (pairs.row_count,))
+
+    # compare labels through shared integer codes; missing labels get code -1
+    codes, _uniques = pd.factorize(np.concatenate([pairs.labels.astype(object), index]))
+    label_codes = codes[:len(pairs.labels)]
+    index_codes = codes[len(pairs.labels):]
+
+    wanted   = index_codes[pairs.left_idx]
+    is_match = (wanted >= 0) & (label_codes == wanted)
+    if item.present is not None:
+        is_match &= item.present
+    entries  = np.arange(len(item.values))
+    position = _segment_reduce(np.minimum, np.where(is_match, entries, len(entries)), pairs.offsets, len(entries))
+
+    found = position < len(entries)
+    result[found] = item.values[position[found]]
+    return result
+
+
+def _dominant(categories:Any, weight:Any) -> np.ndarray:
+    return _index_of_max(_sum(_groupby(weight, categories)))
+
+
+def _as_row_values(result:Any, row_count:int) -> np.ndarray:
+    """Turn the value of a column into an array with one item per left row"""
+    if isinstance(result, Pairwise):
+        # the column did not reduce; hand back one Series per row like the row loop does
+        offsets = result.pairs.offsets
+        present = np.ones(len(result.values), dtype=bool) if result.present is None else result.present
+        out = np.empty(row_count, dtype=object)
+        for row in range(row_count):
+            entries = slice(offsets[row], offsets[row + 1])
+            keep    = present[entries]
+            out[row] = pd.Series(result.values[entries][keep], index=result.pairs.labels[entries][keep])
+        return out
+    if isinstance(result, np.ndarray):
+        return result
+    out = np.empty(row_count, dtype=object)
+    out[:] = [result] * row_count
+    return out
+
+
+def evaluate_batch(
+    myast             :AST,
+    pairs             :PairTable,
+    left_columns      :dict[str, np.ndarray],
+    length_of_left    :np.ndarray,
+    right_columns     :dict[str, np.ndarray],
+    length_of_right   :np.ndarray,
+    length_of_overlap :np.ndarray,
+    profile           :Optional[MergeProfile] = None,
+    executor          :Optional[Executor] = None,
+) -> Union[np.ndarray, list[np.ndarray]]:
+    """Evaluate `myast` (usually the output of `AST.optimize`) for all left rows of a group.
+
+    `left_columns` and `length_of_left` hold one entry per left row,
+    `right_columns` and `length_of_right` one entry per right row, and
+    `length_of_overlap` one entry per pair of `pairs`. Right rows that are
+    not paired with a left row behave as if they were absent from the
+    right group for that row.
+    Returns an array with one value per left row, matching what
+    `AST.evaluate` would have returned for each row; for a plan with named
+    outputs (see `AST.optimize_columns`) a list of such arrays, one per output.
+    With an `executor`, declarations and outputs that do not depend on each
+    other are evaluated concurrently on it; see `merge._schedule`.
+    """
+    row_count = pairs.row_count
+    context:dict[str,Any] = {}
+
+    overlap      = Pairwise(length_of_overlap, None, pairs)
+    right_length = Pairwise(length_of_right[pairs.right_idx], None, pairs)
+
+    def apply(myast:AST, walker_children:list[Any]):
+
+        if myast.action == "left_column":
+            return left_columns[myast.children[0]]
+
+        if myast.action == "right_column":
+            return Pairwise(right_columns[myast.children[0]][pairs.right_idx], None, pairs)
+
+        if myast.action == "length_of_overlap":
+            return overlap
+
+        if myast.action == "length_of_left":
+            return length_of_left
+
+        if myast.action == "length_of_right":
+            return right_length
+
+        if myast.action == "fraction_of_left":
+            return _binary(np.divide, length_of_left, overlap)
+
+        if myast.action == "fraction_of_right":
+            return _binary(np.divide, right_length, overlap)
+
+        if myast.action == "execute":
+            return walker_children[-1]
+
+        if myast.action == "filter":
+            return _filter(*walker_children)
+
+        if myast.action == "sum":
+            return _sum(walker_children[0])
+
+        if myast.action == "masked_dot":
+            return _masked_dot(*walker_children)
+
+        if myast.action == "+":
+            return _binary(np.add, *walker_children)
+
+        if myast.action == "-":
+            return _binary(np.subtract, *walker_children)
+
+        if myast.action == "*":
+            return _binary(np.multiply, *walker_children)
+
+        if myast.action == "/":
+            return _binary(np.divide, *walker_children)
+
+        if myast.action == ">":
+            return _binary(np.greater, *walker_children)
+
+        if myast.action == "<":
+            return _binary(np.less, *walker_children)
+
+        if myast.action == ">=":
+            return _binary(np.greater_equal, *walker_children)
+
+        if myast.action == "<=":
+            return _binary(np.less_equal, *walker_children)
+
+        if myast.action == "neg":
+            return _unary(np.negative, walker_children[0])
+
+        if myast.action == "and":
+            return _binary(np.bitwise_and, *walker_children)
+
+        if myast.action == "or":
+            return _binary(np.bitwise_or, *walker_children)
+
+        if myast.action == "not":
+            return _unary(np.invert, walker_children[0])
+
+        if myast.action == "astype":
+            return _unary(lambda item: item.astype(walker_children[1]), walker_children[0])
+
+        if myast.action == "index_of_max":
+            return _index_of_max(walker_children[0])
+
+        if myast.action == "isna":
+            return _unary(pd.isna, walker_children[0])
+
+        if myast.action == "at_index":
+            return _at_index(walker_children[0], walker_children[1])
+
+        if myast.action == "value_at_max":
+            return _value_at_max(*walker_children)
+
+        if myast.action == "dominant":
+            return _dominant(*walker_children)
+
+        if myast.action == "groupby":
+            return _groupby(walker_children[0], walker_children[1])
+
+        if myast.action == "alias":
+            return walker_children[0]
+
+        if myast.action == "declare":
+            context[walker_children[0]] = walker_children[1]
+            return None
+
+        if myast.action == "refer":
+            return context[walker_children[0]]
+
+        if myast.action == "outputs":
+            return tuple(walker_children)
+
+        if myast.action == "output":
+            return walker_children[1]
+
+        raise Exception(f"Unexpected Node: {myast.action}")
+
+    def evaluate(node:ASTChild) -> Any:
+        # error states are per thread
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return evaluate_bottom_up(node, apply, profile)
+
+    if executor is not None and isinstance(myast, AST) and myast.action == "execute":
+        result = run_graph(plan_graph(myast), evaluate, context, executor)
+    else:
+        result = evaluate(myast)
+    if isinstance(result, tuple):
+        return [_as_row_values(item, row_count) for item in result]
+    return _as_row_values(result, row_count)
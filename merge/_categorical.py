@@ -0,0 +1,158 @@
+"""Dictionary encode string right columns so that plans work on integer codes.
+
+Columns such as "longest overlapping segment" or "dominant category" only
+move the values of a string column around: they pick one right row (or one
+group) and return its value. Such a column can be replaced by integer codes
+into its sorted categories before evaluation, so the engines move integers
+instead of Python strings, and the output column is decoded back into a
+`pd.Categorical` at the end.
+
+A right column is only encoded when every place that reads it is such a
+lookup; a column that is also compared with a literal, summed, returned as
+a Series, etc. keeps its strings. Codes are sorted like the strings, so ties
+(the smallest label of `groupby(...).sum().index_of_max()`) go the same way.
+Missing values become NaN codes, which `groupby` drops like it drops
+missing strings.
+"""
+from __future__ import annotations
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST, ASTChild
+
+Columns = dict[str, np.ndarray]
+
+# the child of these nodes that the result is a value of
+_LOOKUPS = {"at_index": 0, "value_at_max": 0, "dominant": 0}
+
+
+def _grouper_of_max(node:AST) -> Optional[ASTChild]:
+    """The grouper of `x.groupby(grouper).sum().index_of_max()`, whose result is one of its values"""
+    if node.action != "index_of_max":
+        return None
+    total = node.children[0]
+    if not isinstance(total, AST) or total.action != "sum":
+        return None
+    grouped = total.children[0]
+    if not isinstance(grouped, AST) or grouped.action != "groupby":
+        return None
+    return grouped.children[1]
+
+
+def _lookup_source(node:ASTChild, reduced:bool=False) -> Optional[str]:
+    """The right column whose values are the result of `node`, if `node` only looks values of it up"""
+    while isinstance(node, AST):
+        if node.action == "right_column":
+            return node.children[0] if reduced else None  # type: ignore[return-value]
+        if node.action in ("alias", "filter"):
+            node = node.children[0]
+        elif node.action in _LOOKUPS and not reduced:
+            node, reduced = node.children[_LOOKUPS[node.action]], True
+        elif not reduced and (grouper := _grouper_of_max(node)) is not None:
+            node, reduced = grouper, True
+        else:
+            return None
+    return None
+
+
+def category_source(column:ASTChild) -> Optional[str]:
+    """The right column that the output of `column` holds values of, for columns that only look values up"""
+    return _lookup_source(column)
+
+
+def _opaque_columns(column:ASTChild) -> set[str]:
+    """Right columns read by `column` other than through the lookup of `category_source`"""
+    opaque:set[str] = set()
+    source = category_source(column)
+
+    # nodes still to visit, and whether each is on the path followed by `_lookup_source`
+    stack:list[tuple[ASTChild, bool]] = [(column, source is not None)]
+    while stack:
+        node, on_path = stack.pop()
+        if not isinstance(node, AST):
+            continue
+        if not on_path:
+            # everything off the path is opaque
+            opaque |= AST.columns_required(node)[1]
+            continue
+        if node.action == "right_column":
+            continue
+        if node.action in ("alias", "filter"):
+            path_child = 0
+        elif node.action in _LOOKUPS:
+            path_child = _LOOKUPS[node.action]
+        elif (grouper := _grouper_of_max(node)) is not None:
+            total, = node.children
+            grouped, = total.children  # type: ignore[union-attr]
+            stack.append((grouped.children[0], False))  # type: ignore[union-attr]
+            stack.append((grouper, True))
+            continue
+        else:
+            path_child = None
+        stack.extend((child, position == path_child) for position, child in enumerate(node.children))
+
+    return opaque
+
+
+def lookup_columns(add_columns:list[AST]) -> set[str]:
+    """Right columns that `add_columns` only read through lookups"""
+    sources = {category_source(column) for column in add_columns} - {None}
+    opaque  = set().union(*(_opaque_columns(column) for column in add_columns))
+    return sources - opaque  # type: ignore[return-value]
+
+
+def is_strings(values:np.ndarray) -> bool:
+    """True for an object array of strings, possibly with missing values"""
+    return values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) == "string"
+
+
+def encodable_columns(add_columns:list[AST], right_columns:Columns) -> set[str]:
+    """Right string columns that `add_columns` only read through lookups"""
+    return {
+        name
+        for name in lookup_columns(add_columns)
+        if name in right_columns
+        and is_strings(right_columns[name])
+    }
+
+
+def encode_strings(values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Codes of `values` into their sorted distinct strings, and those strings; NaN codes for missing values"""
+    codes, uniques = pd.factorize(values, sort=True)
+    if (codes < 0).any():
+        return np.where(codes < 0, np.nan, codes), np.asarray(uniques, dtype=object)
+    return codes.astype(np.int64), np.asarray(uniques, dtype=object)
+
+
+def decode_strings(codes:np.ndarray, categories:np.ndarray) -> np.ndarray:
+    """The strings of `encode_strings` back as an object array, with NaN for missing values"""
+    missing = np.isnan(codes) if codes.dtype.kind == "f" else np.zeros(len(codes), dtype=bool)
+    values = np.full(len(codes), np.nan, dtype=object)
+    values[~missing] = categories[codes[~missing].astype(np.int64)]
+    return values
+
+
+def encode_categories(
+    right_columns :Columns,
+    add_columns   :list[AST],
+    keep          :Iterable[str] = (),
+) -> tuple[Columns, dict[str, np.ndarray]]:
+    """`right_columns` with the encodable string columns replaced by codes, and the categories of each.
+
+    Columns in `keep`, like the join columns, are never encoded.
+    """
+    categories:dict[str, np.ndarray] = {}
+    encoded = dict(right_columns)
+    for name in sorted(encodable_columns(add_columns, right_columns) - set(keep)):
+        encoded[name], categories[name] = encode_strings(right_columns[name])
+    return encoded, categories
+
+
+def decode_categories(values:np.ndarray, missing:np.ndarray, categories:np.ndarray) -> pd.Categorical:
+    """Codes `values` (ignored where `missing`) as a `pd.Categorical` of the `categories` they use"""
+    missing = missing | np.asarray(pd.isna(values), dtype=bool)
+    codes = np.where(missing, -1, values).astype(np.int64)
+    # only the categories that occur, as when the strings themselves are made categorical
+    return pd.Categorical.from_codes(codes, categories=categories).remove_unused_categories()
@@ -0,0 +1,265 @@
+"""Compile optimized AST plans into plain Python functions.
+
+`AST.evaluate` walks the tree and dispatches on `myast.action` for every node
+on every row. `compile_plan` does that walk once and generates the source of
+a single function instead; `declare`/`refer` become local variables and every
+other node becomes an inline Python expression or a call to one of the small
+helpers below. The generated function takes the same keyword arguments as
+`AST.evaluate` (minus the AST itself) and returns the same value.
+Expressions nesting deeper than `MAX_NESTING` are split into temporary
+locals, so long plans stay within what the Python parser accepts.
+"""
+from __future__ import annotations
+import itertools
+import linecache
+import math
+from typing import Any, Callable, Optional
+import weakref
+
+import pandas as pd
+
+from ._ast import AST, ASTChild, _at_index, _dominant, _index_of_max, _masked_dot, _value_at_max
+from ._types import infer_types
+
+
+CompiledPlan = Callable[..., Any]
+
+# compiled functions keyed by `id` of the interned plan node they were built from.
+# Equal plans are the same node, so the key costs nothing to compute; the weak
+# reference checks that the node is still the one compiled, and its callback
+# drops the entry when the plan is garbage collected, so the cache only holds
+# plans that are in use somewhere.
+_compiled_plans:dict[int, tuple[weakref.ref[AST], CompiledPlan]] = {}
+_compiled_plan_numbers = itertools.count()
+
+# expressions nesting this deep are assigned to a local; see `_SourceBuilder.expression`
+MAX_NESTING = 50
+
+_BINARY_OPERATORS = {
+    "+"  : "+",
+    "-"  : "-",
+    "*"  : "*",
+    "/"  : "/",
+    ">"  : ">",
+    "<"  : "<",
+    ">=" : ">=",
+    "<=" : "<=",
+    "and": "&",
+    "or" : "|",
+}
+
+
+def _hstack(*items):
+    return pd.concat(items, axis="columns")
+
+
+class _SourceBuilder:
+    """Turns the nodes of one plan into Python expressions"""
+
+    def __init__(self) -> None:
+        self.constants:dict[str, Any] = {}
+        self.local_names:dict[str, str] = {}
+        # the expression of every node built so far, and how deeply it nests
+        self.expressions:dict[int, str] = {}
+        self.depths:dict[int, int] = {}
+        # assignments of split off subexpressions, waiting for the statement that uses them
+        self.steps:list[str] = []
+        self.step_count = 0
+
+    def literal(self, value:Any) -> str:
+        if isinstance(value, (bool, int, str)) or value is None:
+            return repr(value)
+        if isinstance(value, float) and math.isfinite(value):
+            return repr(value)
+        # anything without a faithful repr (slices, nan, numpy scalars...) is passed in by name
+        name = f"_constant_{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def local(self, declared_name:ASTChild) -> str:
+        if not isinstance(declared_name, str):
+            raise Exception(f"Expected a string name for declare/refer, found {declared_name!r}")
+        if declared_name not in self.local_names:
+            self.local_names[declared_name] = f"_local_{len(self.local_names)}"
+        return self.local_names[declared_name]
+
+    def expression(self, myast:ASTChild) -> str:
+        """The expression for `myast`; subexpressions it splits off are added to `steps`.
+
+        Nodes are visited children first with an explicit stack, so deep
+        plans do not hit the recursion limit, and an expression that nests
+        `MAX_NESTING` deep is assigned to a local, since the parser refuses
+        more than 200 nested parentheses.
+        """
+        if not isinstance(myast, AST):
+            return self.literal(myast)
+        stack:list[tuple[AST, bool]] = [(myast, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if id(node) in self.expressions:
+                continue
+            if not children_done:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children) if isinstance(child, AST))
+                continue
+            expression = self.node_expression(node)
+            depth = 1 + max((self.depths[id(child)] for child in node.children if isinstance(child, AST)), default=0)
+            if depth >= MAX_NESTING:
+                step = f"_step_{self.step_count}"
+                self.step_count += 1
+                self.steps.append(f"{step} = {expression}")
+                expression, depth = step, 0
+            self.expressions[id(node)] = expression
+            self.depths[id(node)] = depth
+        return self.expressions[id(myast)]
+
+    def node_expression(self, myast:AST) -> str:
+        """The expression for `myast`, whose children already have theirs"""
+        action   = myast.action
+        children = myast.children
+
+        if action == "left_column":
+            return f"left_columns[{self.literal(children[0])}]"
+        if action == "right_column":
+            return f"right_columns[{self.literal(children[0])}]"
+        if action == "length_of_overlap":
+            return "length_of_overlap"
+        if action == "length_of_left":
+            return "length_of_left"
+        if action == "length_of_right":
+            return "length_of_right"
+        if action == "fraction_of_left":
+            return "(length_of_left / length_of_overlap)"
+        if action == "fraction_of_right":
+            return "(length_of_right / length_of_overlap)"
+        if action == "refer":
+            return self.local(children[0])
+
+        walked = [self.expressions[id(child)] if isinstance(child, AST) else self.literal(child) for child in children]
+
+        if action in _BINARY_OPERATORS:
+            return f"({walked[0]} {_BINARY_OPERATORS[action]} {walked[1]})"
+        if action == "neg":
+            return f"(-{walked[0]})"
+        if action == "not":
+            return f"(~{walked[0]})"
+        if action == "filter":
+            return f"{walked[0]}.loc[{walked[1]}]"
+        if action == "sum":
+            return f"{walked[0]}.sum()"
+        if action == "masked_dot":
+            return f"_masked_dot({walked[0]}, {walked[1]}, {walked[2]})"
+        if action == "astype":
+            return f"{walked[0]}.astype({walked[1]})"
+        if action == "index_of_max":
+            return f"_index_of_max({walked[0]})"
+        if action == "isna":
+            return f"{walked[0]}.isna()"
+        if action == "slice_label":
+            return f"{walked[0]}.loc[{walked[1]}]"
+        if action == "slice_integer":
+            return f"{walked[0]}.iloc[{walked[1]}]"
+        if action == "at_index":
+            return f"_at_index({walked[0]}, {walked[1]})"
+        if action == "value_at_max":
+            return f"_value_at_max({walked[0]}, {walked[1]}, {walked[2]})"
+        if action == "dominant":
+            return f"_dominant({walked[0]}, {walked[1]})"
+        if action == "hstack":
+            return f"_hstack({', '.join(walked)})"
+        if action == "groupby":
+            return f"{walked[0]}.groupby({walked[1]})"
+        if action == "alias":
+            return walked[0]
+        if action == "outputs":
+            return f"({''.join(each + ', ' for each in walked)})"
+        if action == "output":
+            return walked[1]
+
+        raise NotImplementedError(f"Unable to compile node: {action}")
+
+    def statements(self, myast:ASTChild) -> list[str]:
+        """Lines of the function body, the last one being the return statement"""
+        if isinstance(myast, AST) and myast.action == "execute":
+            *preliminary, last = myast.children
+            lines = []
+            for item in preliminary:
+                if not isinstance(item, AST) or item.action != "declare":
+                    raise NotImplementedError("Only declare statements can be compiled ahead of the final expression of an execute node")
+                name, value = item.children
+                expression = self.expression(value)
+                lines.extend(self.take_steps())
+                lines.append(f"{self.local(name)} = {expression}")
+            return [*lines, *self.statements(last)]
+        expression = self.expression(myast)
+        return [*self.take_steps(), f"return {expression}"]
+
+    def take_steps(self) -> list[str]:
+        steps, self.steps = self.steps, []
+        return steps
+
+
+def compile_source(plan:ASTChild) -> tuple[str, dict[str, Any]]:
+    """Python source of the function for `plan`, and the constants it refers to"""
+    builder = _SourceBuilder()
+    body = builder.statements(plan)
+    source = "\n".join([
+        "def compiled_plan(left_columns, length_of_left, right_columns, length_of_right, length_of_overlap):",
+        *(f"    {line}" for line in body),
+    ])
+    return source, builder.constants
+
+
+def _cached(plan:ASTChild) -> Optional[CompiledPlan]:
+    entry = _compiled_plans.get(id(plan)) if isinstance(plan, AST) else None
+    if entry is not None and entry[0]() is plan:
+        return entry[1]
+    return None
+
+
+def _cache(plan:ASTChild, compiled:CompiledPlan) -> None:
+    if not isinstance(plan, AST):
+        return
+    key = id(plan)
+
+    def forget(reference:weakref.ref[AST]) -> None:
+        # a newer plan may already have taken over the id
+        if _compiled_plans.get(key, (None,))[0] is reference:
+            del _compiled_plans[key]
+
+    _compiled_plans[key] = (weakref.ref(plan, forget), compiled)
+
+
+def compile_plan(plan:ASTChild) -> CompiledPlan:
+    """Generate (or fetch from the cache) a Python function that evaluates `plan`"""
+    compiled = _cached(plan)
+    if compiled is not None:
+        return compiled
+
+    # type errors are raised here, once, rather than by the compiled function
+    infer_types(plan)
+    source, constants = compile_source(plan)
+    compiled = load_source(source, constants)
+    _cache(plan, compiled)
+    return compiled
+
+
+def load_source(source:str, constants:dict[str, Any]) -> CompiledPlan:
+    """The function defined by `source` from `compile_source`"""
+    filename = f"<merge plan {next(_compiled_plan_numbers)}>"
+    namespace:dict[str, Any] = {
+        "_index_of_max": _index_of_max,
+        "_at_index"    : _at_index,
+        "_masked_dot"  : _masked_dot,
+        "_value_at_max": _value_at_max,
+        "_dominant"    : _dominant,
+        "_hstack"      : _hstack,
+        **constants,
+    }
+    exec(compile(source, filename, "exec"), namespace)
+    # make the generated source visible in tracebacks
+    linecache.cache[filename] = (len(source), None, source.splitlines(keepends=True), filename)
+
+    compiled:CompiledPlan = namespace["compiled_plan"]
+    compiled.__source__ = source  # type: ignore[attr-defined]
+    return compiled
@@ -0,0 +1,361 @@
+"""Evaluation of the planned columns for a single join group.
+
+Both the serial loop in `merge_on_intervals` and the worker processes of the
+parallel path hand each (left group, right group) pair to a `GroupEvaluator`,
+so every execution strategy produces the same per-group result.
+
+Groups are passed as `ColumnGroup`s: contiguous NumPy column arrays plus the
+label of each row. The row engine hands each left row to the plan as a plain
+dict of scalars and builds right Series lazily, only for the columns a plan
+actually reads, so no pandas rows are constructed or indexed per row.
+"""
+from __future__ import annotations
+from concurrent.futures import Executor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, ContextManager, Literal, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from . import _batch
+from ._interval_index import IntervalIndex
+from ._plan_cache import PlanCache
+from ._profile import MergeProfile
+from ._pushdown import OverlapBound, required_bound
+
+LENGTH_LEFT  = "__LEFT_LENGTH__"
+LENGTH_RIGHT = "__RIGHT_LENGTH__"
+
+Engine    = Literal["row", "batch"]
+RightRows = Literal["all", "overlapping", "auto"]
+
+_OVERLAPPING = OverlapBound(0.0)
+
+# below this many pairs, handing the steps of a plan to threads costs more than it saves
+THREADED_MIN_PAIRS = 50_000
+
+# the batch engine evaluates a group that would pair every left row with more right rows than this
+# a few left rows at a time, so that the pair table and the arrays of the plan stay this size
+MAX_BATCH_PAIRS = 2_000_000
+
+
+def plan_function(myast:AST, plan_cache:Optional[PlanCache]=None) -> Callable[..., Any]:
+    """The compiled function for `myast`, or `AST.evaluate` bound to it if it cannot be compiled"""
+    try:
+        if plan_cache is not None:
+            return plan_cache.compile(myast)
+        return AST.compile(myast)
+    except NotImplementedError:
+        return partial(AST.evaluate, myast)
+
+
+@dataclass(frozen=True)
+class ColumnGroup:
+    """The rows of one join group as column arrays, and the label of each row.
+
+    A right group that is evaluated many times can carry its `IntervalIndex`
+    so that it is only built once.
+    """
+    columns        :dict[str, np.ndarray]
+    labels         :np.ndarray
+    interval_index :Optional[IntervalIndex] = None
+
+    def index(self, from_to:tuple[str, str]) -> IntervalIndex:
+        if self.interval_index is not None:
+            return self.interval_index
+        from_column, to_column = from_to
+        return IntervalIndex(self.columns[from_column], self.columns[to_column])
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def rows(self, start:int, stop:int) -> ColumnGroup:
+        """The rows from `start` to `stop`, sharing the arrays of this group"""
+        return ColumnGroup(
+            {name:values[start:stop] for name, values in self.columns.items()},
+            self.labels[start:stop],
+        )
+
+    @staticmethod
+    def from_frame(frame:pd.DataFrame) -> ColumnGroup:
+        return ColumnGroup(
+            {name:frame[name].to_numpy() for name in frame.columns},
+            frame.index.to_numpy(),
+        )
+
+
+class _RightSeries(Mapping[str, pd.Series]):
+    """The right columns seen by one left row, as Series labelled like the right rows.
+
+    Series are only built for the columns that are looked up, and only once.
+    """
+
+    def __init__(self, columns:dict[str, np.ndarray], index:pd.Index, positions:Optional[np.ndarray]) -> None:
+        self.columns   = columns
+        self.index     = index if positions is None else index[positions]
+        self.positions = positions
+        self.built:dict[str, pd.Series] = {}
+
+    def array(self, name:str) -> np.ndarray:
+        values = self.columns[name]
+        return values if self.positions is None else values[self.positions]
+
+    def __getitem__(self, name:str) -> pd.Series:
+        series = self.built.get(name)
+        if series is None:
+            series = self.built[name] = pd.Series(self.array(name), index=self.index, name=name, copy=False)
+        return series
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+
+@dataclass
+class GroupEvaluator:
+    """Evaluates every column for the left rows of one join group.
+
+    Calling it with a left group and the matching right group (both
+    `ColumnGroup`s) returns one array per column, each holding one value per
+    left row (in the order of `left_group`).
+
+    The columns are optimized together by `AST.optimize_columns`, so a
+    subtree shared by several columns is computed once per row (or once per
+    group for the batch engine). With the batch engine, columns the batch
+    engine cannot evaluate are gathered into a second plan that is
+    evaluated row by row.
+
+    Only pairs passing `overlap_bound` are built; None builds every pair of
+    the group. See `merge._pushdown`.
+    """
+    from_to      :tuple[str, str]
+    engine       :Engine
+    right_rows   :RightRows
+    overlap_bound:Optional[OverlapBound]
+    column_count :int
+    # positions of the columns computed by each plan, with the plan and its function
+    batch_columns:list[int]
+    batch_plan   :Optional[AST]
+    row_columns  :list[int]
+    row_plan     :Optional[AST]
+    row_function :Optional[Callable[..., Any]]
+    profile      :Optional[MergeProfile] = None
+    # runs independent steps of the batch plan concurrently for groups with many pairs
+    executor     :Optional[Executor] = None
+
+    @staticmethod
+    def build(
+        columns    :list[AST],
+        from_to    :tuple[str, str],
+        engine     :Engine,
+        right_rows :RightRows,
+        profile    :Optional[MergeProfile] = None,
+        plan_cache :Optional[PlanCache] = None,
+        executor   :Optional[Executor] = None,
+    ) -> GroupEvaluator:
+        """With a `profile`, plans are interpreted instead of compiled so that each node can be timed.
+        With a `plan_cache`, optimized and compiled plans are read from (and written to) it.
+        With an `executor`, the batch plan of a group with at least `THREADED_MIN_PAIRS` pairs runs on it."""
+        optimize_columns = AST.optimize_columns if plan_cache is None else plan_cache.optimize_columns
+        if engine == "batch":
+            batch_columns = [position for position, column in enumerate(columns) if _batch.supports(column)]
+        else:
+            batch_columns = []
+        batch_positions = set(batch_columns)
+        row_columns = [position for position in range(len(columns)) if position not in batch_positions]
+
+        def plan(positions:list[int]) -> Optional[AST]:
+            if not positions:
+                return None
+            return optimize_columns(
+                [columns[position] for position in positions],
+                names = [f"column_{position}" for position in positions],
+            )
+
+        if right_rows == "auto":
+            overlap_bound = required_bound(columns)
+        else:
+            overlap_bound = _OVERLAPPING if right_rows == "overlapping" else None
+
+        row_plan   = plan(row_columns)
+        batch_plan = plan(batch_columns)
+        if row_plan is None:
+            row_function = None
+        elif profile is not None:
+            row_function = partial(AST.evaluate, row_plan, profile=profile)
+        else:
+            row_function = plan_function(row_plan, plan_cache)
+        if profile is not None:
+            profile.plans.extend(each for each in (batch_plan, row_plan) if each is not None)
+        return GroupEvaluator(
+            from_to       = from_to,
+            engine        = engine,
+            right_rows    = right_rows,
+            overlap_bound = overlap_bound,
+            column_count  = len(columns),
+            batch_columns = batch_columns,
+            batch_plan    = batch_plan,
+            row_columns   = row_columns,
+            row_plan      = row_plan,
+            row_function  = row_function,
+            profile       = profile,
+            executor      = executor,
+        )
+
+    def __call__(self, left_group:ColumnGroup, right_group:ColumnGroup) -> list[np.ndarray]:
+        if self.engine == "batch":
+            return self._evaluate_batch(left_group, right_group)
+        return self._evaluate_rows(left_group, right_group)
+
+    def _phase(self, name:str) -> ContextManager[None]:
+        return nullcontext() if self.profile is None else self.profile.phase(name)
+
+    @property
+    def _uses_index(self) -> bool:
+        return self.overlap_bound is not None and self.overlap_bound.overlapping_only
+
+    @property
+    def _needs_keep(self) -> bool:
+        """True if pairs found by the interval index (or all pairs) still have to be checked against the bound"""
+        return self.overlap_bound is not None and self.overlap_bound != _OVERLAPPING
+
+    def _count_pairs(self, signed_overlap_len:Any) -> None:
+        if self.profile is not None:
+            self.profile.count_pairs(len(signed_overlap_len), np.count_nonzero(np.asarray(signed_overlap_len) > 0))
+
+    def _empty_columns(self, row_count:int) -> list[np.ndarray]:
+        return [np.empty(row_count, dtype=object) for _ in range(self.column_count)]
+
+    def _evaluate_row(
+        self,
+        result_columns    :list[np.ndarray],
+        position          :int,
+        left_columns      :dict[str, np.ndarray],
+        right_columns     :_RightSeries,
+        length_of_overlap :np.ndarray,
+    ) -> None:
+        """Evaluate the row plan for the left row at `position` against `right_columns`"""
+        assert self.row_function is not None
+        left_row = {name:values[position] for name, values in left_columns.items()}
+        with self._phase("evaluation"):
+            row_values = self.row_function(
+                left_columns      = left_row,
+                right_columns     = right_columns,
+                length_of_left    = left_row[LENGTH_LEFT],
+                length_of_right   = right_columns[LENGTH_RIGHT],
+                length_of_overlap = pd.Series(length_of_overlap, index=right_columns.index, copy=False),
+            )
+        for column_position, value in zip(self.row_columns, row_values):
+            result_columns[column_position][position] = value
+
+    def _evaluate_rows(self, left_group:ColumnGroup, right_group:ColumnGroup) -> list[np.ndarray]:
+        from_column, to_column = self.from_to
+        result_columns = self._empty_columns(len(left_group))
+        if self.row_function is None:
+            return result_columns
+
+        left_columns  = left_group.columns
+        right_columns = right_group.columns
+        right_labels  = pd.Index(right_group.labels)
+
+        with self._phase("overlap"):
+            if self._uses_index:
+                right_index = right_group.index(self.from_to)
+            else:
+                # every row sees the same right Series, so they are shared
+                all_right = _RightSeries(right_columns, right_labels, None)
+
+        for position in range(len(left_group)):
+            with self._phase("overlap"):
+                if self._uses_index:
+                    right_candidates = _RightSeries(
+                        right_columns,
+                        right_labels,
+                        right_index.query(left_columns[from_column][position], left_columns[to_column][position]),
+                    )
+                else:
+                    right_candidates = all_right
+
+                # compute signed overlap
+                signed_overlap_len = (
+                      np.minimum(left_columns[to_column  ][position], right_candidates.array(to_column  ))
+                    - np.maximum(left_columns[from_column][position], right_candidates.array(from_column))
+                )
+                if self._needs_keep:
+                    keep = self.overlap_bound.keep(signed_overlap_len)  # type: ignore[union-attr]
+                    if not keep.all():
+                        positions = np.flatnonzero(keep) if right_candidates.positions is None else right_candidates.positions[keep]
+                        right_candidates   = _RightSeries(right_columns, right_labels, positions)
+                        signed_overlap_len = signed_overlap_len[keep]
+            self._count_pairs(signed_overlap_len)
+
+            self._evaluate_row(result_columns, position, left_columns, right_candidates, signed_overlap_len)
+        return result_columns
+
+    def _evaluate_tiles(self, left_group:ColumnGroup, right_group:ColumnGroup) -> list[np.ndarray]:
+        """`_evaluate_batch` over tiles of left rows, each with at most `MAX_BATCH_PAIRS` pairs"""
+        tile_rows = max(MAX_BATCH_PAIRS // max(len(right_group), 1), 1)
+        tiles = [
+            self._evaluate_batch(left_group.rows(start, start + tile_rows), right_group)
+            for start in range(0, len(left_group), tile_rows)
+        ]
+        return [np.concatenate(column_tiles) for column_tiles in zip(*tiles)]
+
+    def _evaluate_batch(self, left_group:ColumnGroup, right_group:ColumnGroup) -> list[np.ndarray]:
+        # without the interval index every left row is paired with every right row
+        if not self._uses_index and len(left_group) > 1 and len(left_group) * len(right_group) > MAX_BATCH_PAIRS:
+            return self._evaluate_tiles(left_group, right_group)
+        from_column, to_column = self.from_to
+
+        left_columns  = left_group.columns
+        right_columns = right_group.columns
+
+        with self._phase("overlap"):
+            # flat table of the (left row, right row) pairs this group visits
+            right_labels = right_group.labels
+            if self._uses_index:
+                right_index = right_group.index(self.from_to)
+                pairs = _batch.PairTable.overlapping_pairs(left_columns[from_column], left_columns[to_column], right_index, right_labels)
+            else:
+                pairs = _batch.PairTable.all_pairs(len(left_group), right_labels)
+
+            signed_overlap_len = (
+                  np.minimum(left_columns[to_column  ][pairs.left_idx], right_columns[to_column  ][pairs.right_idx])
+                - np.maximum(left_columns[from_column][pairs.left_idx], right_columns[from_column][pairs.right_idx])
+            )
+            if self._needs_keep:
+                keep = self.overlap_bound.keep(signed_overlap_len)  # type: ignore[union-attr]
+                if not keep.all():
+                    pairs              = pairs.subset(keep)
+                    signed_overlap_len = signed_overlap_len[keep]
+        self._count_pairs(signed_overlap_len)
+
+        result_columns = self._empty_columns(len(left_group))
+        if self.batch_plan is not None:
+            with self._phase("evaluation"):
+                batch_values = _batch.evaluate_batch(
+                    self.batch_plan,
+                    pairs             = pairs,
+                    left_columns      = left_columns,
+                    length_of_left    = left_columns [LENGTH_LEFT ],
+                    right_columns     = right_columns,
+                    length_of_right   = right_columns[LENGTH_RIGHT],
+                    length_of_overlap = signed_overlap_len,
+                    profile           = self.profile,
+                    executor          = self.executor if len(signed_overlap_len) >= THREADED_MIN_PAIRS else None,
+                )
+            for column_position, column_values in zip(self.batch_columns, batch_values):
+                result_columns[column_position] = column_values
+
+        if self.row_function is not None:
+            right_index_labels = pd.Index(right_labels)
+            for position in range(len(left_group)):
+                entries = slice(pairs.offsets[position], pairs.offsets[position + 1])
+                right_candidates = _RightSeries(right_columns, right_index_labels, pairs.right_idx[entries])
+                self._evaluate_row(result_columns, position, left_columns, right_candidates, signed_overlap_len[entries])
+        return result_columns
@@ -0,0 +1,211 @@
+"""Keep the result of a merge up to date as rows of the right data change.
+
+`IncrementalMerge` runs the merge once and keeps what it built along the
+way: the projected columns of both sides, the left rows and right row labels
+of every join group, and the typed output columns. `apply` takes a delta of
+inserted, updated and deleted right rows, patches the right columns, and
+recomputes only the left rows that can see a changed right row:
+
+- when every column only reads right rows through an overlap filter (see
+  `merge._pushdown`), the left rows of the affected join groups whose
+  intervals overlap the old or new interval of a changed right row,
+- otherwise every left row of the affected join groups.
+
+The patched result is the same as merging the left data with the patched
+right data from scratch, where updated rows keep their place and inserted
+rows come after the existing ones.
+"""
+from __future__ import annotations
+from typing import Hashable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._categorical import encode_categories
+from ._group import LENGTH_LEFT, LENGTH_RIGHT, ColumnGroup, Engine, GroupEvaluator, RightRows
+from ._interval_index import IntervalIndex
+from ._merge import Columns, Data, as_frame, check_options, distinct_keys, factorize_join_keys, group_offsets, lookup_join_keys, prepare_columns, project, row_count
+from ._output import OutputBuilder
+from ._plan_cache import PlanCache
+from ._pushdown import required_bound
+
+def _assign(values:np.ndarray, positions:np.ndarray, new_values:np.ndarray) -> np.ndarray:
+    """`values` with `new_values` written at `positions`, widening the dtype if they do not fit"""
+    dtype = np.result_type(values.dtype, new_values.dtype)
+    values = values.astype(dtype) if dtype != values.dtype else values.copy()
+    values[positions] = new_values
+    return values
+
+
+class IncrementalMerge:
+    """The result of `merge_on_intervals(left_data, right_data, ...)`, patched in place by `apply`.
+
+    Right rows are identified by their index labels (or their positions, for
+    a dict of arrays), which must be unique. Columns that produce right row
+    labels, like `index_of_max`, give these labels; they match
+    `merge_on_intervals` for right data with a default RangeIndex until rows
+    are deleted.
+    """
+
+    def __init__(
+        self,
+        left_data    :Data,
+        right_data   :Data,
+        join_left_on :list[str],
+        from_to      :tuple[str, str],
+        add_columns  :list[AST],
+        engine       :Engine = "row",
+        right_rows   :RightRows = "auto",
+        plan_cache   :Optional[PlanCache] = None,
+    ) -> None:
+        check_options(engine, right_rows)
+        self.join_left_on = join_left_on
+        self.from_to      = from_to
+        self.add_columns  = add_columns
+
+        left_needed, self.right_needed, self.names = prepare_columns(add_columns)
+        self.left_data_original = as_frame(left_data)
+        self.left  = project(left_data,  join_left_on, from_to, left_needed,       LENGTH_LEFT )
+        self.right = project(right_data, join_left_on, from_to, self.right_needed, LENGTH_RIGHT)
+        if isinstance(right_data, pd.DataFrame):
+            self.right_labels = right_data.index
+        else:
+            self.right_labels = pd.RangeIndex(row_count(self.right))
+        if not self.right_labels.is_unique:
+            raise ValueError("The index of the right data must be unique to apply changes to it")
+
+        # join groups are the distinct keys of the left data; right rows with other keys join nothing
+        (left_codes,), group_count = factorize_join_keys([self.left], join_left_on)
+        self.keys = distinct_keys(self.left, left_codes, join_left_on)
+        order, offsets = group_offsets(left_codes, group_count)
+        self.left_groups:list[np.ndarray] = [order[offsets[group]:offsets[group + 1]] for group in range(group_count)]
+        self.right_groups:list[set[Hashable]] = [set() for _ in range(group_count)]
+        for label, group in zip(self.right_labels, self._groups(self.right)):
+            if group is not None:
+                self.right_groups[group].add(label)
+
+        # when columns only read overlapping right rows, a change only reaches the left rows it overlaps
+        bound = required_bound(add_columns) if right_rows != "all" else None
+        if right_rows == "overlapping":
+            self.overlap_only = True
+        else:
+            self.overlap_only = bound is not None and bound.overlapping_only
+
+        self.evaluate_group = GroupEvaluator.build(add_columns, from_to, engine, right_rows, plan_cache=plan_cache)
+        self.output = OutputBuilder.for_columns(
+            add_columns,
+            {name:values.dtype for name, values in self.left .items()},
+            {name:values.dtype for name, values in self.right.items()},
+            LENGTH_LEFT,
+            LENGTH_RIGHT,
+            len(self.left_data_original),
+        )
+        self.last_recomputed = self._recompute({group:None for group in range(group_count)})
+
+    @property
+    def result(self) -> pd.DataFrame:
+        # string columns are not encoded here, as their categories change with the right data,
+        # but lookups of them come back as `merge_on_intervals` decodes them
+        _encoded, categories = encode_categories(self.right, self.add_columns, keep=self.join_left_on)
+        return self.output.assemble(self.left_data_original, self.names, categories)
+
+    def _project(self, data:pd.DataFrame) -> Columns:
+        return project(data, self.join_left_on, self.from_to, self.right_needed, LENGTH_RIGHT)
+
+    def _groups(self, columns:Columns) -> list[Optional[int]]:
+        """The join group of every row; None for rows whose key the left data does not have, or is missing"""
+        codes = lookup_join_keys(self.keys, columns, self.join_left_on)
+        group_count = len(self.left_groups)
+        return [group if 0 <= group < group_count else None for group in codes.tolist()]
+
+    def _recompute(self, changed:dict[int, Optional[list[tuple[float, float]]]]) -> np.ndarray:
+        """Evaluate the left rows of each group in `changed` that overlap one of its intervals (all of them for None)"""
+        from_column, to_column = self.from_to
+        recomputed = []
+        for group, intervals in changed.items():
+            left_positions = self.left_groups[group]
+            if len(left_positions) == 0:
+                continue
+            if intervals is not None:
+                starts, ends = np.array(intervals, dtype=float).reshape(-1, 2).T
+                offsets, _found = IntervalIndex(starts, ends).query_many(
+                    self.left[from_column][left_positions],
+                    self.left[to_column  ][left_positions],
+                )
+                left_positions = left_positions[np.diff(offsets) > 0]
+                if len(left_positions) == 0:
+                    continue
+            right_positions = np.sort(self.right_labels.get_indexer(list(self.right_groups[group])))
+            left_group  = ColumnGroup({name:values[left_positions ] for name, values in self.left .items()}, left_positions)
+            right_group = ColumnGroup(
+                {name:values[right_positions] for name, values in self.right.items()},
+                self.right_labels[right_positions].to_numpy(),
+            )
+            self.output.fill(left_positions, self.evaluate_group(left_group, right_group))
+            recomputed.append(left_positions)
+        return np.sort(np.concatenate(recomputed)) if recomputed else np.empty(0, dtype=np.intp)
+
+    def apply(
+        self,
+        inserted :Optional[pd.DataFrame] = None,
+        updated  :Optional[pd.DataFrame] = None,
+        deleted  :Optional[Iterable[Hashable]] = None,
+    ) -> pd.DataFrame:
+        """Patch the right data and return the patched result.
+
+        `inserted` holds new right rows with new labels, `updated` the new
+        values of existing right rows (by label), and `deleted` the labels of
+        right rows to remove. The left rows that were recomputed are in
+        `last_recomputed`, by position.
+        """
+        from_column, to_column = self.from_to
+        changed:dict[int, Optional[list[tuple[float, float]]]] = {}
+
+        def touch(columns:Columns, labels:Iterable[Hashable], add:Optional[bool]) -> None:
+            """Record the intervals of these rows as changed; add them to or remove them from their group"""
+            for label, group, start, end in zip(labels, self._groups(columns), columns[from_column], columns[to_column]):
+                if group is None:
+                    continue
+                intervals = changed.setdefault(group, [])
+                if intervals is not None:
+                    intervals.append((start, end))
+                if add is True:
+                    self.right_groups[group].add(label)
+                elif add is False:
+                    self.right_groups[group].discard(label)
+
+        def old_rows(labels:pd.Index) -> tuple[np.ndarray, Columns]:
+            positions = self.right_labels.get_indexer(labels)
+            if (positions < 0).any():
+                raise KeyError(f"Right rows not found: {list(labels[positions < 0])}")
+            return positions, {name:values[positions] for name, values in self.right.items()}
+
+        if deleted is not None:
+            labels = pd.Index(list(deleted))
+            positions, old = old_rows(labels)
+            touch(old, labels, add=False)
+            keep = np.ones(len(self.right_labels), dtype=bool)
+            keep[positions] = False
+            self.right        = {name:values[keep] for name, values in self.right.items()}
+            self.right_labels = self.right_labels[keep]
+
+        if updated is not None:
+            positions, old = old_rows(updated.index)
+            new = self._project(updated)
+            touch(old, updated.index, add=False)
+            touch(new, updated.index, add=True)
+            self.right = {name:_assign(values, positions, new[name]) for name, values in self.right.items()}
+
+        if inserted is not None:
+            if self.right_labels.isin(inserted.index).any() or not inserted.index.is_unique:
+                raise ValueError("Inserted right rows must have new, unique labels")
+            new = self._project(inserted)
+            touch(new, inserted.index, add=True)
+            self.right        = {name:np.concatenate([values, new[name]]) for name, values in self.right.items()}
+            self.right_labels = self.right_labels.append(inserted.index)
+
+        if not self.overlap_only:
+            changed = {group:None for group in changed}
+        self.last_recomputed = self._recompute(changed)
+        return self.result
@@ -0,0 +1,70 @@
+import numpy as np
+from numpy import typing as npt
+
+
+class IntervalIndex:
+    """Find the intervals that overlap a query interval by binary search.
+
+    Intervals are sorted by start. Because intervals may overlap each other,
+    a running maximum of the ends is kept alongside so that the first
+    interval which could still reach the query start can also be found by
+    binary search. Build cost is O(M log M); each query is O(log M + k)
+    where k is the number of intervals between the two search bounds.
+    """
+    order            :npt.NDArray
+    starts           :npt.NDArray
+    ends             :npt.NDArray
+    ends_running_max :npt.NDArray
+
+    def __init__(self, starts:npt.NDArray, ends:npt.NDArray) -> None:
+        self.order            = np.argsort(starts, kind="stable")
+        self.starts           = np.asarray(starts)[self.order]
+        self.ends             = np.asarray(ends  )[self.order]
+        # fmax skips NaN, so one bad row does not poison the rest of the index
+        self.ends_running_max = np.fmax.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def query(self, start:float, end:float) -> npt.NDArray:
+        """Positions (in the original order) of intervals that overlap [start, end) by more than zero"""
+        upper = np.searchsorted(self.starts,           end,   side="left" )
+        lower = np.searchsorted(self.ends_running_max, start, side="right")
+        if lower >= upper or not start < end:
+            return np.empty(0, dtype=np.intp)
+        # empty intervals never overlap anything by more than zero
+        keep = (self.ends[lower:upper] > start) & (self.ends[lower:upper] > self.starts[lower:upper])
+        return np.sort(self.order[lower:upper][keep])
+
+    def query_many(self, starts:npt.NDArray, ends:npt.NDArray) -> tuple[npt.NDArray, npt.NDArray]:
+        """All queries at once, in CSR form.
+
+        Returns `(offsets, positions)` where the positions (in the original
+        order) overlapping query `i` are `positions[offsets[i]:offsets[i+1]]`,
+        sorted ascending within each query.
+        """
+        starts = np.asarray(starts)
+        ends   = np.asarray(ends)
+        upper  = np.searchsorted(self.starts,           ends,   side="left" )
+        lower  = np.searchsorted(self.ends_running_max, starts, side="right")
+        counts = np.maximum(upper - lower, 0)
+
+        # expand each [lower, upper) window into explicit candidate slots
+        query  = np.repeat(np.arange(len(starts)), counts)
+        window_start = np.repeat(np.cumsum(counts) - counts, counts)
+        slot   = np.repeat(lower, counts) + np.arange(counts.sum()) - window_start
+
+        keep     = (
+              (self.ends[slot] > starts[query])
+            & (self.ends[slot] > self.starts[slot])
+            & (ends[query]     > starts[query])
+        )
+        query    = query[keep]
+        position = self.order[slot[keep]]
+
+        # order by query, then by original position
+        sort     = np.lexsort((position, query))
+        query    = query[sort]
+        position = position[sort]
+        offsets  = np.searchsorted(query, np.arange(len(starts) + 1), side="left")
+        return offsets, position
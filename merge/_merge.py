@@ -1,25 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from functools import reduce
+from typing import TYPE_CHECKING, Mapping, Optional, Union
 
 import pandas as pd
 import numpy as np
 
 from ._ast import AST
+from ._categorical import encode_categories
+from ._group import LENGTH_LEFT as _LENGTH_LEFT, LENGTH_RIGHT as _LENGTH_RIGHT, ColumnGroup, Engine, GroupEvaluator, RightRows
+from ._output import OutputBuilder
+from ._parallel import evaluate_groups_parallel
+from ._plan_cache import PlanCache
+from ._profile import MergeProfile
 
-_LENGTH_LEFT  = "__LEFT_LENGTH__"
-_LENGTH_RIGHT = "__RIGHT_LENGTH__"
+if TYPE_CHECKING:
+    from ._right_index import RightIndex
+
+# input data: a DataFrame, or a mapping of column names to equally long 1-D arrays
+Data = Union[pd.DataFrame, Mapping[str, np.ndarray]]
+
+# projected data: contiguous column arrays
+Columns = dict[str, np.ndarray]
 
 def merge_on_intervals(
-    left_data     : pd.DataFrame,
-    right_data    : pd.DataFrame,
+    left_data     : Data,
+    right_data    : Union[Data, "RightIndex"],
     join_left_on  : list[str],
     from_to       : tuple[str, str],
-    add_columns   : list[AST]
+    add_columns   : list[AST],
+    engine        : Engine = "row",
+    right_rows    : RightRows = "auto",
+    workers       : Optional[int] = None,
+    profile       : Optional[MergeProfile] = None,
+    plan_cache    : Optional[PlanCache] = None,
+    threads       : Optional[int] = None,
 ):
-    from_column, to_column = from_to
+    """Left join `right_data` onto `left_data` where intervals overlap,
+    adding one column per AST in `add_columns`.
+
+    Either side may be a DataFrame or a dict of NumPy column arrays. Only
+    the columns the algorithm needs are kept, as contiguous arrays, and
+    everything after that works on those arrays; the result is a DataFrame
+    of the left columns plus the new columns.
+
+    Join groups are found by encoding the `join_left_on` key of both sides
+    into shared integer codes and sorting each side by code once; a left
+    group whose key has no right rows is evaluated against an empty right
+    group.
+
+    `right_data` may also be a `RightIndex` built (or saved and opened) on
+    the same `join_left_on` and `from_to`; its rows are grouped and sorted
+    already, and its columns are used as they are, memory mapped or not.
+
+    `engine="row"` evaluates every column once per left row.
+    `engine="batch"` evaluates every column once per join group over a flat
+    table of (left row, right row) pairs using segmented reductions; columns
+    using actions the batch engine does not support are still evaluated row
+    by row.
+
+    `right_rows="all"` passes every right row of the join group to each
+    column, including rows that do not overlap the left row; ASTs such as
+    "nearest value" need this. `right_rows="overlapping"` uses an interval
+    index built once per group so that only right rows overlapping the
+    left row by more than zero are visited; it gives the same result for
+    columns that filter on `AST.length_of_overlap() > 0` anyway.
+    `right_rows="auto"` (the default) finds the overlap predicates, like
+    `AST.length_of_overlap() > 0` or `>= min_length`, that every column
+    applies to every right row it reads, and leaves rows failing them out of
+    the pairs; it gives the same result as "all", and falls back to it when
+    any column reads right rows without such a filter.
+
+    `workers` greater than one spreads the join groups over that many
+    worker processes. Groups are balanced by their estimated cost (left rows
+    × right rows) and the projected columns are shared with the workers
+    through shared memory. The result is the same as the serial path.
+
+    All columns are planned together with `AST.optimize_columns`, so
+    subtrees shared between columns are computed only once.
+
+    `threads` greater than one lets the batch engine evaluate the
+    declarations and columns of a plan that do not depend on each other at
+    the same time, on that many threads, for join groups with many pairs
+    (see `merge._schedule`). The row engine does not use them.
+
+    Passing a `MergeProfile` as `profile` records per node timings, per
+    phase timings and pair counts into it; see `MergeProfile.report`.
+    Profiling is not available together with `workers`.
+
+    With a `PlanCache`, the optimized and compiled plans of the columns are
+    read from its directory when they were built before (by this process,
+    a worker process or an earlier job) and written to it otherwise.
+    """
+    from ._right_index import RightIndex
+    check_options(engine, right_rows)
+    if profile is not None and workers is not None and workers > 1:
+        raise ValueError("profile cannot be used together with workers > 1")
+    if threads is not None and threads > 1 and (profile is not None or (workers is not None and workers > 1)):
+        raise ValueError("threads cannot be used together with profile or workers > 1")
+    phase = (lambda name: nullcontext()) if profile is None else profile.phase
+
+    left_columns_needed, right_columns_needed, result_column_names = prepare_columns(add_columns)
+
+    with phase("projection"):
+        # keep the original left data, but with the index reset
+        left_data_original = as_frame(left_data)
+
+        # select only the relevant columns and compute lengths
+        left_data   = project(left_data,  join_left_on, from_to, left_columns_needed,  _LENGTH_LEFT )
+        if isinstance(right_data, RightIndex):
+            right_index = right_data
+            right_index.check(join_left_on, from_to)
+            right_data, categories = right_index.columns_for(add_columns)
+        else:
+            right_index = None
+            right_data  = project(right_data, join_left_on, from_to, right_columns_needed, _LENGTH_RIGHT)
+            # string columns that are only looked up are evaluated as integer codes
+            right_data, categories = encode_categories(right_data, add_columns, keep=join_left_on)
+
+    with phase("groupby"):
+        if right_index is None:
+            # encode the join key of both sides into shared group codes, and sort each side by code
+            (left_codes, right_codes), group_count = factorize_join_keys([left_data, right_data], join_left_on)
+            left_order,  left_offsets  = group_offsets(left_codes,  group_count)
+            right_order, right_offsets = group_offsets(right_codes, group_count)
+        else:
+            # the right rows are grouped already; left keys the index lacks share an empty group at the end
+            group_count = len(right_index.offsets) - 1
+            left_order,  left_offsets  = group_offsets(right_index.group_codes(left_data), group_count + 1)
+            right_order, right_offsets = right_index.order, np.append(right_index.offsets, right_index.offsets[-1])
+        groups = np.flatnonzero(np.diff(left_offsets))
+
+    # typed output columns, filled in place as groups finish
+    output = OutputBuilder.for_columns(
+        add_columns,
+        {name:values.dtype for name, values in left_data .items()},
+        {name:values.dtype for name, values in right_data.items()},
+        _LENGTH_LEFT,
+        _LENGTH_RIGHT,
+        len(left_data_original),
+        categories,
+    )
+
+    if workers is not None and workers > 1:
+        group_positions = [
+            (
+                left_order [left_offsets [group]:left_offsets [group + 1]],
+                right_order[right_offsets[group]:right_offsets[group + 1]],
+            )
+            for group in groups
+        ]
+        group_results = evaluate_groups_parallel(
+            left_data,
+            right_data if right_index is None else right_index.unsorted(right_data),
+            group_positions,
+            add_columns,
+            from_to,
+            engine,
+            right_rows,
+            workers,
+            plan_cache,
+        )
+        for (left_positions, _right_positions), group_result in zip(group_positions, group_results):
+            output.fill(left_positions, group_result)
+    else:
+        with phase("groupby"):
+            # each group is then a slice (a view) of the sorted columns
+            left_sorted  = {name:values[left_order ] for name, values in left_data .items()}
+            if right_index is None:
+                right_sorted = {name:values[right_order] for name, values in right_data.items()}
+            else:
+                right_sorted = right_data
+        use_threads = threads is not None and threads > 1 and engine == "batch"
+        with ThreadPoolExecutor(threads) if use_threads else nullcontext() as executor:
+            evaluate_group = GroupEvaluator.build(add_columns, from_to, engine, right_rows, profile, plan_cache, executor)
+            for group in groups:
+                left_group  = slice_group(left_sorted,  left_order,  left_offsets [group], left_offsets [group + 1])
+                # a left group without right rows gets an empty right group rather than an error
+                right_group = slice_group(right_sorted, right_order, right_offsets[group], right_offsets[group + 1])
+                output.fill(left_group.labels, evaluate_group(left_group, right_group))
+
+    with phase("output"):
+        return output.assemble(left_data_original, result_column_names)
+
+
+def check_options(engine:Engine, right_rows:RightRows) -> None:
+    if engine not in ("row", "batch"):
+        raise ValueError(f"Unknown engine {engine!r}, expected 'row' or 'batch'")
+    if right_rows not in ("all", "overlapping", "auto"):
+        raise ValueError(f"Unknown right_rows {right_rows!r}, expected 'all', 'overlapping' or 'auto'")
 
-    # plan executions
-    add_columns_planned = [AST.optimize(myast) for myast in add_columns]
-    
+
+def prepare_columns(add_columns:list[AST]) -> tuple[set[str], set[str], list[str]]:
+    """The left and right columns `add_columns` need, and the resulting column names"""
     # determine the columns needed for the body of the algorithm
     left_columns_needed, right_columns_needed = reduce(
         lambda a,b: ({*a[0], *b[0]}, {*a[1],*b[1]}),
@@ -27,60 +200,103 @@ def merge_on_intervals(
     )
 
     # determine the resulting column names
-
     result_column_names = [AST.output_column_name_simple(myast) for myast in add_columns]
 
-    # keep the original left data, but with the index reset
-    left_data_original = left_data.reset_index(drop=True)
-
-    # select only the relevant columns
-    left_data   = left_data .loc[:,list({*join_left_on, *from_to, *left_columns_needed })].reset_index(drop=True)
-    right_data  = right_data.loc[:,list({*join_left_on, *from_to, *right_columns_needed})].reset_index(drop=True)
-
-    # compute lengths
-    left_data [_LENGTH_LEFT ] = left_data [to_column] - left_data [from_column]
-    right_data[_LENGTH_RIGHT] = right_data[to_column] - right_data[from_column]
-
-    # group data for left join
-    left_groups  = left_data .groupby(by=join_left_on)
-    right_groups = right_data.groupby(by=join_left_on)
-
-    left_group :pd.DataFrame
-    right_group:pd.DataFrame
-    
-    # prepare list to store output
-    result_index = []
-    result_rows = []
-
-    for group_index, left_group in left_groups:
-        right_group = right_groups.get_group(group_index)
-        for left_row_index, left_row in left_group.iterrows():
-            
-            # compute signed overlap
-            overlap_min = np.maximum(left_row[from_column], right_group[from_column])
-            overlap_max = np.minimum(left_row[to_column  ], right_group[to_column  ])
-            signed_overlap_len = overlap_max - overlap_min
-            
-            result_index.append(left_row_index)
-            result_rows.append([
-                AST.evaluate(
-                    myast,
-                    left_columns      = left_row,
-                    right_columns     = right_group,
-                    length_of_left    = left_row[_LENGTH_LEFT],
-                    length_of_right   = right_group[_LENGTH_RIGHT],
-                    length_of_overlap = signed_overlap_len
-                )
-                for myast in add_columns_planned
-            ])
-    return pd.concat(
-        [
-            left_data_original,
-            pd.DataFrame(
-                columns = result_column_names,
-                index   = result_index,
-                data    = result_rows,
-            )
-        ],
-        axis="columns"
-    )
\ No newline at end of file
+    return left_columns_needed, right_columns_needed, result_column_names
+
+
+def factorize_join_keys(sides:list[Columns], join_left_on:list[str]) -> tuple[list[np.ndarray], int]:
+    """Integer codes of the composite join key of each row of each side, shared by all sides, and the number of codes.
+
+    Codes are dense, numbered in order of first appearance. Rows with a
+    missing key value get code -1, so that they join nothing, as they would
+    be dropped by `groupby`.
+    """
+    counts = [row_count(side) for side in sides]
+    codes = np.zeros(sum(counts), dtype=np.int64)
+    missing = np.zeros(sum(counts), dtype=bool)
+    code_count = 1
+    for column in join_left_on:
+        column_codes, column_uniques = pd.factorize(
+            pd.concat([pd.Series(side[column]) for side in sides], ignore_index=True)
+        )
+        missing |= column_codes < 0
+        # fold this column into the codes so far, then renumber to keep the codes dense
+        codes[~missing], uniques = pd.factorize(codes[~missing] * len(column_uniques) + column_codes[~missing])
+        code_count = len(uniques)
+    codes[missing] = -1
+    return np.split(codes, np.cumsum(counts)[:-1]), code_count
+
+
+def distinct_keys(columns:Columns, codes:np.ndarray, join_left_on:list[str]) -> Columns:
+    """The join key of each code of `factorize_join_keys([columns], ...)`, as one row per code"""
+    valid = np.flatnonzero(codes >= 0)
+    _codes, first = np.unique(codes[valid], return_index=True)
+    return {column:columns[column][valid[first]] for column in join_left_on}
+
+
+def lookup_join_keys(keys:Columns, columns:Columns, join_left_on:list[str]) -> np.ndarray:
+    """The row of `keys` (from `distinct_keys`) holding the join key of each row of `columns`.
+
+    Rows with a missing key value get -1, and rows with a key that `keys`
+    does not hold get `row_count(keys)`.
+    """
+    (codes, key_codes), code_count = factorize_join_keys([columns, keys], join_left_on)
+    key_rows = np.full(code_count, len(key_codes), dtype=np.int64)
+    key_rows[key_codes] = np.arange(len(key_codes))
+    return np.where(codes < 0, -1, key_rows[np.maximum(codes, 0)])
+
+
+def group_offsets(codes:np.ndarray, group_count:int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions sorted by group code (stable), and offsets such that group `g` is `order[offsets[g]:offsets[g+1]]`
+
+    Positions with code -1 are left out.
+    """
+    order   = np.argsort(codes, kind="stable")
+    order   = order[np.searchsorted(codes[order], 0):]
+    offsets = np.zeros(group_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes[order], minlength=group_count), out=offsets[1:])
+    return order, offsets
+
+
+def slice_group(sorted_columns:Columns, order:np.ndarray, start:int, stop:int) -> ColumnGroup:
+    """Rows `start:stop` of columns sorted by `order`, labelled by their original positions"""
+    return ColumnGroup(
+        {name:values[start:stop] for name, values in sorted_columns.items()},
+        order[start:stop],
+    )
+
+
+def row_count(columns:Columns) -> int:
+    return len(next(iter(columns.values())))
+
+
+def as_frame(data:Data) -> pd.DataFrame:
+    """`data` as a DataFrame with a fresh RangeIndex"""
+    if isinstance(data, pd.DataFrame):
+        return data.reset_index(drop=True)
+    return pd.DataFrame({name:np.asarray(values) for name, values in data.items()})
+
+
+def project(
+    data           : Data,
+    join_left_on   : list[str],
+    from_to        : tuple[str, str],
+    columns_needed : set[str],
+    length_column  : str,
+) -> Columns:
+    """Only the columns the algorithm needs as contiguous arrays, with the interval length added"""
+    from_column, to_column = from_to
+    projected:Columns = {}
+    for name in dict.fromkeys([*join_left_on, *from_to, *sorted(columns_needed)]):
+        if isinstance(data, pd.DataFrame):
+            values = data[name].to_numpy()
+        else:
+            values = np.asarray(data[name])
+        if values.ndim != 1:
+            raise ValueError(f"Column {name!r} must be one dimensional, found shape {values.shape}")
+        projected[name] = np.ascontiguousarray(values)
+    if len({len(values) for values in projected.values()}) > 1:
+        raise ValueError("All columns must have the same length")
+    projected[length_column] = projected[to_column] - projected[from_column]
+    return projected
@@ -0,0 +1,104 @@
+"""Merge several right datasets onto the same left data in one pass.
+
+Calling `merge_on_intervals` once per right dataset projects, factorizes and
+sorts the left data every time. `merge_many_on_intervals` does that once:
+the join keys of the left data and of every right dataset are factorized
+together into shared group codes, the left data is sorted by code once, and
+a single loop over the left join groups evaluates the columns of every
+dataset against its slice of that group. The result holds the left columns followed by the new columns
+of each dataset, in the order of `sources`.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._categorical import encode_categories
+from ._group import LENGTH_LEFT, LENGTH_RIGHT, Engine, GroupEvaluator, RightRows
+from ._merge import Columns, Data, as_frame, check_options, factorize_join_keys, group_offsets, prepare_columns, project, slice_group
+from ._output import OutputBuilder, assemble_frame
+from ._plan_cache import PlanCache
+
+
+@dataclass
+class _Source:
+    """One right dataset, sorted by the left join groups, with its evaluator and output columns"""
+    names          :list[str]
+    sorted_columns :Columns
+    order          :np.ndarray
+    offsets        :np.ndarray
+    evaluate_group :GroupEvaluator
+    output         :OutputBuilder
+
+
+def merge_many_on_intervals(
+    left_data    : Data,
+    sources      : Mapping[str, tuple[Data, list[AST]]],
+    join_left_on : list[str],
+    from_to      : tuple[str, str],
+    engine       : Engine = "row",
+    right_rows   : RightRows = "auto",
+    plan_cache   : Optional[PlanCache] = None,
+) -> pd.DataFrame:
+    """Left join every right dataset of `sources` onto `left_data` where intervals overlap.
+
+    `sources` maps a name to a pair of right data and the columns to add
+    from it. Every right dataset has the `join_left_on` and `from_to`
+    columns of the left data. The result is the same as chaining
+    `merge_on_intervals` for each source, and column names may repeat across
+    sources. See `merge_on_intervals` for the other arguments.
+    """
+    check_options(engine, right_rows)
+    prepared = {name:prepare_columns(add_columns) for name, (_right_data, add_columns) in sources.items()}
+    left_needed = set().union(*(left_columns_needed for left_columns_needed, _right, _names in prepared.values()))
+
+    left_data_original = as_frame(left_data)
+    left = project(left_data, join_left_on, from_to, left_needed, LENGTH_LEFT)
+    left_dtypes = {name:values.dtype for name, values in left.items()}
+
+    rights:dict[str, Columns] = {}
+    for name, (right_data, _add_columns) in sources.items():
+        _left_needed, right_needed, _names = prepared[name]
+        rights[name] = project(right_data, join_left_on, from_to, right_needed, LENGTH_RIGHT)
+
+    # group codes shared by the left data and every right dataset; the left data is sorted once
+    (left_codes, *right_codes), group_count = factorize_join_keys([left, *rights.values()], join_left_on)
+    left_order, left_offsets = group_offsets(left_codes, group_count)
+    left_sorted = {name:values[left_order] for name, values in left.items()}
+
+    merged:list[_Source] = []
+    for (name, (_right_data, add_columns)), codes in zip(sources.items(), right_codes):
+        _left_needed, _right_needed, names = prepared[name]
+        right, categories = encode_categories(rights[name], add_columns, keep=join_left_on)
+        order, offsets = group_offsets(codes, group_count)
+        merged.append(_Source(
+            names          = names,
+            sorted_columns = {column:values[order] for column, values in right.items()},
+            order          = order,
+            offsets        = offsets,
+            evaluate_group = GroupEvaluator.build(add_columns, from_to, engine, right_rows, plan_cache=plan_cache),
+            output         = OutputBuilder.for_columns(
+                add_columns,
+                left_dtypes,
+                {column:values.dtype for column, values in right.items()},
+                LENGTH_LEFT,
+                LENGTH_RIGHT,
+                len(left_data_original),
+                categories,
+            ),
+        ))
+
+    for group in np.flatnonzero(np.diff(left_offsets)):
+        left_group = slice_group(left_sorted, left_order, left_offsets[group], left_offsets[group + 1])
+        for source in merged:
+            right_group = slice_group(source.sorted_columns, source.order, source.offsets[group], source.offsets[group + 1])
+            source.output.fill(left_group.labels, source.evaluate_group(left_group, right_group))
+
+    return assemble_frame(
+        left_data_original,
+        [column.result() for source in merged for column in source.output.columns],
+        [name for source in merged for name in source.names],
+    )
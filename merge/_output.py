@@ -0,0 +1,181 @@
+"""Collect per-group results straight into typed, preallocated output columns.
+
+Each output column is one NumPy array sized to the number of left rows,
+with the dtype the column's AST is expected to produce, plus a validity mask.
+Group results are written into it in place at the positions of their left
+rows. Integer and boolean columns that end up with missing values become
+pandas nullable arrays built on the same buffers; float columns use NaN.
+Columns whose dtype cannot be inferred, or whose values turn out not to fit
+the inferred dtype, are kept as object arrays and left to pandas inference
+like before. Columns that look up the values of a string right column come back as a
+`pd.Categorical` of the values they hold, decoded from codes when the right
+column was dictionary encoded (see `merge._categorical`).
+"""
+from __future__ import annotations
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._categorical import category_source, decode_categories
+from ._types import plan_type
+
+
+class OutputColumn:
+    """A preallocated output column; `dtype` None (or object) stores Python objects.
+
+    With `categories`, the values are codes into them. A `lookup` column of
+    strings is returned as categorical.
+    """
+
+    def __init__(
+        self,
+        dtype      :Optional[np.dtype],
+        row_count  :int,
+        categories :Optional[np.ndarray] = None,
+        lookup     :bool = False,
+    ) -> None:
+        self.categories = categories
+        self.lookup     = lookup or categories is not None
+        self.dtype = np.dtype(object) if dtype is None else dtype
+        if self.dtype.kind == "f":
+            self.values = np.full(row_count, np.nan, dtype=self.dtype)
+        elif self.dtype == object:
+            self.values = np.full(row_count, np.nan, dtype=object)
+        else:
+            self.values = np.zeros(row_count, dtype=self.dtype)
+        self.valid = np.zeros(row_count, dtype=bool)
+
+    def _to_object(self) -> None:
+        values = self.values.astype(object)
+        values[~self.valid] = np.nan
+        self.values = values
+        self.dtype  = values.dtype
+
+    def fill(self, positions:np.ndarray, group_values:np.ndarray) -> None:
+        """Write the values of one group at `positions`"""
+        if self.dtype == object:
+            self.values[positions] = group_values
+            self.valid [positions] = True
+            return
+        if group_values.dtype == self.dtype:
+            self.values[positions] = group_values
+            self.valid [positions] = True
+            return
+        present = ~np.asarray(pd.isna(group_values), dtype=bool) if group_values.dtype.kind in "Of" else np.ones(len(group_values), dtype=bool)
+        try:
+            converted = group_values[present].astype(self.dtype)
+            fits = bool(np.all(converted == group_values[present]))
+        except (TypeError, ValueError):
+            fits = False
+        if not fits:
+            # the inference was wrong for this data; keep whatever we get
+            self._to_object()
+            self.fill(positions, group_values)
+            return
+        self.values[positions[present]] = converted
+        if self.dtype.kind == "f":
+            # positions may be filled again, so do not leave an older value behind
+            self.values[positions[~present]] = np.nan
+        self.valid [positions] = present
+
+    def result(self, categories:Optional[np.ndarray]=None) -> Any:
+        """The finished column, sharing the buffer of `values` where possible.
+
+        `categories` are those of the string right column that a lookup
+        column holds values of, when that column was not encoded; the
+        column comes back as if it had been, even with no values.
+        """
+        if self.categories is not None:
+            return decode_categories(self.values, ~self.valid, self.categories)
+        if categories is not None and self.lookup and self.dtype == object:
+            codes = pd.Index(categories).get_indexer(np.where(self.valid, self.values, None))
+            return decode_categories(codes, codes < 0, categories)
+        if self.lookup and self.dtype == object and pd.api.types.infer_dtype(self.values[self.valid], skipna=True) == "string":
+            return pd.Categorical(np.where(self.valid, self.values, np.nan))
+        if self.dtype == object:
+            # let pandas infer the dtype the same way it does for a list of rows
+            return list(self.values)
+        if self.dtype.kind == "f" or self.valid.all():
+            return self.values
+        if self.dtype.kind == "b":
+            return pd.arrays.BooleanArray(self.values, ~self.valid)
+        return pd.arrays.IntegerArray(self.values, ~self.valid)
+
+
+class OutputBuilder:
+    """The output columns of a merge for `row_count` left rows"""
+
+    def __init__(
+        self,
+        dtypes     :list[Optional[np.dtype]],
+        row_count  :int,
+        categories :Optional[list[Optional[np.ndarray]]] = None,
+        sources    :Optional[list[Optional[str]]] = None,
+    ) -> None:
+        if categories is None:
+            categories = [None] * len(dtypes)
+        # the right column that each lookup column holds values of; see `category_source`
+        self.sources = [None] * len(dtypes) if sources is None else sources
+        self.columns = [
+            OutputColumn(dtype, row_count, each_categories, source is not None)
+            for dtype, each_categories, source in zip(dtypes, categories, self.sources)
+        ]
+
+    @staticmethod
+    def for_columns(
+        add_columns  :list[AST],
+        left_dtypes  :dict[str, np.dtype],
+        right_dtypes :dict[str, np.dtype],
+        length_left  :str,
+        length_right :str,
+        row_count    :int,
+        categories   :Optional[dict[str, np.ndarray]] = None,
+    ) -> OutputBuilder:
+        """Output columns for `add_columns`, typed from the dtypes of the projected input columns.
+
+        `categories` holds the categories of the right columns that were
+        replaced by codes; columns that look values of them up are decoded.
+        Columns that look up strings are returned as categorical either way.
+        Raises `PlanTypeError` for columns that cannot be evaluated.
+        """
+        dtypes  = dict(left_dtypes=left_dtypes, right_dtypes=right_dtypes, length_left=length_left, length_right=length_right)
+        sources = [category_source(myast) for myast in add_columns]
+        return OutputBuilder(
+            [plan_type(myast, **dtypes).output_dtype for myast in add_columns],
+            row_count,
+            [(categories or {}).get(source) for source in sources],  # type: ignore[arg-type]
+            sources,
+        )
+
+    def fill(self, positions:np.ndarray, group_columns:list[np.ndarray]) -> None:
+        for column, group_values in zip(self.columns, group_columns):
+            column.fill(positions, group_values)
+
+    def assemble(
+        self,
+        left_data_original  :pd.DataFrame,
+        result_column_names :list[str],
+        categories          :Optional[dict[str, np.ndarray]] = None,
+    ) -> pd.DataFrame:
+        """The original left data followed by the output columns.
+
+        `categories` holds the categories `encode_categories` gives for right
+        columns that were evaluated as strings all the same; lookups of them
+        come back like decoded columns do.
+        """
+        results = [column.result((categories or {}).get(source)) for column, source in zip(self.columns, self.sources)]  # type: ignore[arg-type]
+        return assemble_frame(left_data_original, results, result_column_names)
+
+
+def assemble_frame(left_data_original:pd.DataFrame, results:list[Any], result_column_names:list[str]) -> pd.DataFrame:
+    """`left_data_original` followed by the finished output columns `results`"""
+    # build the frame positionally so that repeated column names survive
+    arrays = [
+        *(left_data_original.iloc[:, position].array for position in range(left_data_original.shape[1])),
+        *results,
+    ]
+    result = pd.DataFrame(dict(enumerate(arrays)), index=left_data_original.index, copy=False)
+    result.columns = [*left_data_original.columns, *result_column_names]
+    return result
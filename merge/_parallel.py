@@ -0,0 +1,172 @@
+"""Spread independent join groups across a pool of worker processes.
+
+The projected left and right columns are copied once into shared memory
+blocks; workers attach to them when they start and slice out their own
+groups, so only group positions and results cross the process boundary per
+task. Columns that are not plain numbers (strings, for example) are
+dictionary encoded into integer codes so that they can be shared too, and
+the small table of categories is sent to each worker once at start up.
+"""
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+import heapq
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._group import ColumnGroup, Engine, GroupEvaluator, RightRows
+from ._plan_cache import PlanCache
+
+
+# number of tasks per worker; more tasks smooth out badly estimated group costs
+_TASKS_PER_WORKER = 4
+
+
+@dataclass(frozen=True)
+class SharedColumn:
+    """Where to find one column in shared memory"""
+    name        :str
+    block       :str
+    dtype       :str
+    length      :int
+    # decoding table for dictionary encoded columns; the last entry stands in for missing values
+    categories  :Optional[np.ndarray]
+
+
+class SharedFrame:
+    """Copies column arrays into shared memory blocks owned by this process"""
+
+    def __init__(self, data:dict[str, np.ndarray]) -> None:
+        self.blocks :list[shared_memory.SharedMemory] = []
+        self.columns:list[SharedColumn] = []
+        try:
+            for name, values in data.items():
+                categories = None
+                if values.dtype.kind not in "biuf":
+                    codes, uniques = pd.factorize(values)
+                    categories = np.append(np.asarray(uniques, dtype=object), np.nan)
+                    values = codes
+                values = np.ascontiguousarray(values)
+                block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+                self.columns.append(SharedColumn(name, block.name, values.dtype.str, len(values), categories))
+        except BaseException:
+            # the blocks made so far would outlive this process otherwise
+            self.release()
+            raise
+
+    def release(self) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+class _AttachedFrame:
+    """Read-only view of a `SharedFrame` from inside a worker process"""
+
+    def __init__(self, columns:list[SharedColumn]) -> None:
+        # the blocks must outlive the arrays that view them
+        self.blocks = [shared_memory.SharedMemory(name=column.block) for column in columns]
+        self.columns = columns
+        self.arrays = {
+            column.name: np.ndarray((column.length,), dtype=np.dtype(column.dtype), buffer=block.buf)
+            for column, block in zip(columns, self.blocks)
+        }
+
+    def take(self, positions:np.ndarray) -> ColumnGroup:
+        """The rows at `positions`, labelled by their positions like in the serial path"""
+        data = {}
+        for column in self.columns:
+            values = self.arrays[column.name][positions]
+            if column.categories is not None:
+                values = column.categories[values]
+            data[column.name] = values
+        return ColumnGroup(data, positions)
+
+
+_worker_state:dict[str, Any] = {}
+
+
+def _worker_init(
+    left_columns  :list[SharedColumn],
+    right_columns :list[SharedColumn],
+    columns       :list[AST],
+    from_to       :tuple[str, str],
+    engine        :Engine,
+    right_rows    :RightRows,
+    plan_cache    :Optional[PlanCache],
+) -> None:
+    _worker_state["left"]      = _AttachedFrame(left_columns)
+    _worker_state["right"]     = _AttachedFrame(right_columns)
+    _worker_state["evaluator"] = GroupEvaluator.build(columns, from_to, engine, right_rows, plan_cache=plan_cache)
+
+
+def _worker_task(groups:list[tuple[int, np.ndarray, np.ndarray]]) -> list[tuple[int, list[np.ndarray]]]:
+    left      :_AttachedFrame  = _worker_state["left"]
+    right     :_AttachedFrame  = _worker_state["right"]
+    evaluator :GroupEvaluator  = _worker_state["evaluator"]
+    return [
+        (group_number, evaluator(left.take(left_positions), right.take(right_positions)))
+        for group_number, left_positions, right_positions in groups
+    ]
+
+
+def balance(costs:list[int], bucket_count:int) -> list[list[int]]:
+    """Split item numbers into buckets of similar total cost (longest processing time first)"""
+    buckets:list[list[int]] = [[] for _ in range(bucket_count)]
+    heap = [(0, bucket) for bucket in range(bucket_count)]
+    for item in sorted(range(len(costs)), key=lambda item: costs[item], reverse=True):
+        total, bucket = heapq.heappop(heap)
+        buckets[bucket].append(item)
+        heapq.heappush(heap, (total + costs[item], bucket))
+    return [bucket for bucket in buckets if bucket]
+
+
+def evaluate_groups_parallel(
+    left_data       :dict[str, np.ndarray],
+    right_data      :dict[str, np.ndarray],
+    group_positions :list[tuple[np.ndarray, np.ndarray]],
+    columns         :list[AST],
+    from_to         :tuple[str, str],
+    engine          :Engine,
+    right_rows      :RightRows,
+    workers         :int,
+    plan_cache      :Optional[PlanCache] = None,
+) -> list[list[np.ndarray]]:
+    """Evaluate every group on a process pool.
+
+    `group_positions` holds the (left positions, right positions) of each
+    group. Returns the per-column result arrays of each group, in the same
+    order as `group_positions`.
+    """
+    # estimated cost of a group is the number of (left row, right row) pairs it may visit
+    costs = [len(left) * max(len(right), 1) for left, right in group_positions]
+    buckets = balance(costs, workers * _TASKS_PER_WORKER)
+
+    with ExitStack() as shared:
+        # released however the merge ends, including when the right frame cannot be shared
+        left_shared  = SharedFrame(left_data)
+        shared.callback(left_shared.release)
+        right_shared = SharedFrame(right_data)
+        shared.callback(right_shared.release)
+        with ProcessPoolExecutor(
+            max_workers = workers,
+            initializer = _worker_init,
+            initargs    = (left_shared.columns, right_shared.columns, columns, from_to, engine, right_rows, plan_cache),
+        ) as executor:
+            tasks = [
+                executor.submit(_worker_task, [(group_number, *group_positions[group_number]) for group_number in bucket])
+                for bucket in buckets
+            ]
+            results:list[list[np.ndarray]] = [[] for _ in group_positions]
+            for task in tasks:
+                for group_number, group_result in task.result():
+                    results[group_number] = group_result
+    return results
@@ -0,0 +1,97 @@
+"""A directory of optimized plans, keyed by a stable plan hash.
+
+Optimizing a large set of columns is repeated by every merge, every worker
+process and every batch job. With a `PlanCache` the result is written to
+disk the first time and read back afterwards:
+
+- `<hash>.plan.json` holds the optimized plan of the columns whose hash is
+  `<hash>`, in the format of `merge._serialize`.
+
+Compiled functions are generated from the plan in each process rather than
+stored, so the directory only ever holds data, never code that is executed.
+
+Files are written to a temporary name and renamed into place, so processes
+sharing a directory never read a partly written entry. Entries that cannot
+be read are rebuilt.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Optional, Union
+
+from ._ast import AST, ASTChild
+from . import _serialize
+
+
+# bump when `AST.optimize` changes what it produces, so that old entries are not reused
+OPTIMIZER_VERSION = 4
+
+
+class PlanCache:
+    """Optimized plans stored in `directory`"""
+
+    def __init__(self, directory:Union[str, os.PathLike]) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def __repr__(self) -> str:
+        return f"PlanCache({str(self.directory)!r})"
+
+    def _key(self, kind:str, text:str) -> str:
+        return hashlib.sha256(f"{kind}\n{OPTIMIZER_VERSION}\n{text}".encode("utf-8")).hexdigest()
+
+    def _read(self, path:Path) -> Optional[dict[str, Any]]:
+        try:
+            with open(path, encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, path:Path, document:dict[str, Any]) -> None:
+        file_descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                json.dump(document, file, separators=(",", ":"), ensure_ascii=False)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def optimize_columns(self, columns:list[ASTChild], names:Optional[list[str]]=None) -> AST:
+        """Like `AST.optimize_columns`, reading the plan from the cache when possible"""
+        if names is None:
+            names = [AST.output_column_name_simple(column) for column in columns]
+        return self.optimize(AST.outputs(zip(names, columns)))
+
+    def optimize(self, myast:ASTChild) -> AST:
+        """Like `AST.optimize`, reading the plan from the cache when possible"""
+        try:
+            text = _serialize.dumps(myast)
+        except Exception:
+            # literals the format cannot hold; optimize without caching
+            return AST.optimize(myast)
+        path = self.directory / f"{self._key('optimize', text)}.plan.json"
+        document = self._read(path)
+        if document is not None:
+            try:
+                plan = _serialize.from_document(document)
+                if isinstance(plan, AST):
+                    return plan
+            except Exception:
+                pass
+        plan = AST.optimize(myast)
+        self._write(path, _serialize.to_document(plan))
+        return plan
+
+    def compile(self, plan:ASTChild):
+        """Like `AST.compile`.
+
+        Only plans are stored on disk. Generated source is never read back
+        from the directory, since executing it would run whatever anyone
+        able to write there put in it; it is cheap to regenerate from the
+        (cached) plan instead.
+        """
+        return AST.compile(plan)
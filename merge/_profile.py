@@ -0,0 +1,85 @@
+"""Opt-in profiling of merges, in the spirit of `EXPLAIN ANALYZE`.
+
+Pass a `MergeProfile` to `merge_on_intervals` (or to `AST.evaluate`) and it
+collects:
+
+- the time spent in, and the number of calls to, every node of the plans
+  (including each `declare`), timed inclusive of the node's children,
+- the time spent in each phase of the merge,
+- the number of (left row, right row) pairs examined, and how many of them
+  actually overlap.
+
+Plans are evaluated by the interpreters rather than compiled functions while
+profiling, so that individual nodes can be timed; expect a profiled merge to
+be slower than an unprofiled one.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from dataclasses import dataclass
+from time import perf_counter
+from typing import Iterator
+
+from ._ast import AST
+
+
+@dataclass
+class NodeStats:
+    node    :AST
+    seconds :float = 0.0
+    calls   :int   = 0
+
+
+class MergeProfile:
+    """Timings and counts collected while merging; see `report`"""
+
+    def __init__(self) -> None:
+        self.phases:dict[str, float] = {}
+        # keyed by id(node); interned nodes that occur several times in a plan share their stats
+        self.nodes:dict[int, NodeStats] = {}
+        self.plans:list[AST] = []
+        self.pairs_examined    = 0
+        self.pairs_overlapping = 0
+
+    @contextmanager
+    def phase(self, name:str) -> Iterator[None]:
+        """Add the time spent in the `with` block to phase `name`"""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + perf_counter() - start
+
+    def record(self, node:AST, seconds:float) -> None:
+        """Add one call of `node` taking `seconds`; the evaluators call this for every node they visit"""
+        stats = self.nodes.get(id(node))
+        if stats is None:
+            stats = self.nodes[id(node)] = NodeStats(node)
+        stats.seconds += seconds
+        stats.calls   += 1
+
+    def count_pairs(self, examined:int, overlapping:int) -> None:
+        self.pairs_examined    += int(examined)
+        self.pairs_overlapping += int(overlapping)
+
+    def annotation(self, node:AST) -> str:
+        """Timing of `node` as shown next to it in `report`"""
+        stats = self.nodes.get(id(node))
+        if stats is None:
+            return "  (not run)"
+        return f"  {stats.seconds*1000:.3f} ms × {stats.calls}"
+
+    def report(self) -> str:
+        """The plans in `AST.to_string` form with the timing of each node, followed by phases and pair counts"""
+        out = ""
+        for plan in self.plans:
+            out += plan.to_string(annotate=self.annotation) + "\n"
+        out += "\nphases:"
+        for name, seconds in self.phases.items():
+            out += f"\n  {name:<12} {seconds*1000:10.3f} ms"
+        out += "\n\npairs:"
+        out += f"\n  examined    {self.pairs_examined}"
+        out += f"\n  overlapping {self.pairs_overlapping}"
+        return out
+
+    def print_report(self) -> None:
+        print(self.report())
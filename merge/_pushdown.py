@@ -0,0 +1,258 @@
+"""Find the overlap predicates that every column applies, so that pair generation can apply them instead.
+
+Most columns only look at right rows through a filter like
+`.filter(AST.length_of_overlap() > 0)`. If every right row a column depends
+on passes such a predicate, right rows that fail it can be left out of the
+pairs entirely without changing the result. `required_bound` works out the
+weakest `OverlapBound` that all columns need; `merge_on_intervals` with
+`right_rows="auto"` then only builds the pairs that pass it.
+
+The analysis is conservative: anything it does not understand depends on
+every right row, and then no rows are left out.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import math
+from typing import Optional, Union
+
+import numpy as np
+
+from ._ast import AST, ASTChild
+from ._types import NodeType, PlanTypeError, infer_types
+
+
+@dataclass(frozen=True)
+class OverlapBound:
+    """Pairs whose overlap is greater than `threshold`, or equal to it if `inclusive`"""
+    threshold :float
+    inclusive :bool = False
+
+    def implies(self, other:OverlapBound) -> bool:
+        """True if every overlap that passes this bound also passes `other`"""
+        if self.threshold != other.threshold:
+            return self.threshold > other.threshold
+        return other.inclusive or not self.inclusive
+
+    def keep(self, overlap:np.ndarray) -> np.ndarray:
+        return overlap >= self.threshold if self.inclusive else overlap > self.threshold
+
+    @property
+    def overlapping_only(self) -> bool:
+        """True if only pairs that overlap by more than zero pass, so an `IntervalIndex` can find the candidates"""
+        return self.implies(OverlapBound(0.0))
+
+
+class _Free:
+    """Marks a value that does not depend on the right rows at all"""
+    def __repr__(self) -> str:
+        return "FREE"
+
+
+FREE = _Free()
+
+# the right rows a value depends on: FREE for none of them, None for all of them,
+# or an `OverlapBound` that every row it depends on passes
+Requirement = Union[_Free, OverlapBound, None]
+
+
+def _weakest(*requirements:Requirement) -> Requirement:
+    result:Requirement = FREE
+    for requirement in requirements:
+        if requirement is None:
+            return None
+        if requirement is FREE:
+            continue
+        if result is FREE or result.implies(requirement):  # type: ignore[union-attr]
+            result = requirement
+    return result
+
+
+def _threshold(value:ASTChild) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or math.isnan(value):
+        return None
+    return float(value)
+
+
+def _is_overlap(node:ASTChild) -> bool:
+    return isinstance(node, AST) and node.action == "length_of_overlap"
+
+
+def _comparison_bound(mask:AST) -> Optional[OverlapBound]:
+    """The bound of a comparison of the overlap with a number"""
+    if mask.action in (">", ">=") and _is_overlap(mask.children[0]):
+        threshold = _threshold(mask.children[1])
+        return None if threshold is None else OverlapBound(threshold, mask.action == ">=")
+    if mask.action in ("<", "<=") and _is_overlap(mask.children[1]):
+        threshold = _threshold(mask.children[0])
+        return None if threshold is None else OverlapBound(threshold, mask.action == "<=")
+    return None
+
+
+def mask_bound(mask:ASTChild) -> Optional[OverlapBound]:
+    """The strongest `OverlapBound` that every row selected by `mask` is known to pass"""
+    if not isinstance(mask, AST):
+        return None
+    # the terms of a (possibly nested) `and`; any of them bounds the rows that pass
+    bounds:list[OverlapBound] = []
+    terms:list[ASTChild] = [mask]
+    while terms:
+        term = terms.pop()
+        if not isinstance(term, AST):
+            continue
+        if term.action == "and":
+            terms.extend(reversed(term.children))
+        elif (bound := _comparison_bound(term)) is not None:
+            bounds.append(bound)
+    if not bounds:
+        return None
+    strongest = bounds[0]
+    for bound in bounds[1:]:
+        if bound.implies(strongest):
+            strongest = bound
+    return strongest
+
+
+_RIGHT_LEAVES = {"right_column", "length_of_right", "length_of_overlap", "fraction_of_left", "fraction_of_right"}
+_LEFT_LEAVES  = {"left_column", "length_of_left"}
+_ELEMENTWISE  = {"+", "-", "*", "/", ">", "<", ">=", "<=", "==", "and", "or", "not", "neg", "astype", "isna", "alias"}
+_ARITHMETIC   = {"+", "-", "*", "/"}
+
+
+def _requirements(column:ASTChild, types:dict[int, NodeType]) -> Requirement:
+    # shared subtrees are only analysed once
+    rowwise_known:dict[int, Requirement] = {}
+    whole_known  :dict[int, Requirement] = {}
+    missing_known:dict[int, Requirement] = {}
+
+    def rowwise(node:ASTChild) -> Requirement:
+        """Rows needed for the value of `node` at each remaining right row to stay the same"""
+        if not isinstance(node, AST):
+            return FREE
+        if id(node) not in rowwise_known:
+            rowwise_known[id(node)] = _rowwise(node)
+        return rowwise_known[id(node)]
+
+    def _rowwise(node:AST) -> Requirement:
+        if node.action in _RIGHT_LEAVES:
+            return FREE
+        if node.action in _ELEMENTWISE or node.action == "filter":
+            return _weakest(*map(rowwise, node.children))
+        node_type = types.get(id(node))
+        if node_type is not None and node_type.per_row:
+            # a value per left row, like a sum, broadcast to the right rows
+            return whole(node)
+        return None
+
+    def whole(node:ASTChild) -> Requirement:
+        """Rows needed for the whole value of `node` to stay the same"""
+        if not isinstance(node, AST):
+            return FREE
+        if id(node) not in whole_known:
+            whole_known[id(node)] = _whole(node)
+        return whole_known[id(node)]
+
+    def missing_outside(node:ASTChild) -> Requirement:
+        """Rows outside which `node` is absent or NaN, and inside which its values stay the same"""
+        if not isinstance(node, AST):
+            return None
+        if id(node) not in missing_known:
+            missing_known[id(node)] = _missing_outside(node)
+        return missing_known[id(node)]
+
+    def _missing_outside(node:AST) -> Requirement:
+        if node.action == "filter":
+            series, mask = node.children
+            bound = mask_bound(mask)
+            return None if bound is None else _weakest(bound, rowwise(mask), rowwise(series))
+        if node.action in _ARITHMETIC:
+            # arithmetic with an absent value gives NaN
+            left, right = node.children
+            candidates = [
+                _weakest(missing, rowwise(other))
+                for missing, other in ((missing_outside(left), right), (missing_outside(right), left))
+                if isinstance(missing, OverlapBound)
+            ]
+            candidates = [each for each in candidates if each is not None]
+            return candidates[0] if candidates else None
+        if node.action in ("neg", "alias"):
+            return missing_outside(node.children[0])
+        return None
+
+    def _whole(node:AST) -> Requirement:
+        action, children = node.action, node.children
+        if action in _LEFT_LEAVES:
+            return FREE
+        if action in _RIGHT_LEAVES or action in ("declare", "refer", "execute"):
+            return None
+
+        if action in ("filter", "masked_dot"):
+            *series, mask = children
+            bound = mask_bound(mask)
+            if bound is not None:
+                # rows failing the mask are dropped anyway
+                return _weakest(bound, rowwise(mask), *map(rowwise, series))
+
+        if action == "value_at_max":
+            series, key, mask = children
+            bound = mask_bound(mask)
+            if bound is not None:
+                # the value is read from the row of the maximum key, which passes the mask
+                return _weakest(bound, rowwise(mask), rowwise(key), rowwise(series))
+
+        if action == "dominant":
+            categories, weight = children
+            for series, other in ((weight, categories), (categories, weight)):
+                # rows missing from either side are not grouped
+                requirement = whole(series)
+                if isinstance(requirement, OverlapBound):
+                    return _weakest(requirement, rowwise(other))
+
+        if action == "at_index":
+            series, index = children
+            if isinstance(index, AST) and index.action == "index_of_max":
+                searched = index.children[0]
+                searched_type = types.get(id(searched))
+                requirement = whole(searched)
+                if isinstance(requirement, OverlapBound) and searched_type is not None and searched_type.rows:
+                    # the index is the label of a right row that passes `requirement`, or missing
+                    return _weakest(requirement, rowwise(series))
+
+        if action == "sum":
+            # sums skip NaN, and the sum of nothing is zero either way
+            missing = missing_outside(children[0])
+            if isinstance(missing, OverlapBound):
+                return missing
+
+        if action == "groupby":
+            series, grouper = children
+            requirement = whole(series)
+            if isinstance(requirement, OverlapBound):
+                # the grouper is aligned to the rows of the series
+                return _weakest(requirement, rowwise(grouper))
+
+        return _weakest(*map(whole, children))
+
+    # fill the caches children first, so that the functions above only ever look one or two levels down
+    for node in AST._post_order(column):
+        missing_outside(node)
+        rowwise(node)
+        whole(node)
+    return whole(column)
+
+
+def required_bound(columns:list[ASTChild]) -> Optional[OverlapBound]:
+    """The weakest bound that every right row used by `columns` passes, or None if the columns need every right row"""
+    requirements = []
+    for column in columns:
+        try:
+            types = infer_types(column)
+        except PlanTypeError:
+            return None
+        requirements.append(_requirements(column, types))
+    requirement = _weakest(*requirements)
+    if requirement is None:
+        return None
+    if requirement is FREE:
+        # nothing reads the right rows
+        return OverlapBound(0.0)
+    return requirement  # type: ignore[return-value]
@@ -0,0 +1,313 @@
+"""Algebraic rewrites applied to plans before `AST.optimize` extracts shared subtrees.
+
+Each rule looks at one node whose children have already been rewritten and
+returns a replacement, or None to leave it alone:
+
+- `fold_constants`:     `2 * 3` becomes `6`,
+- `fuse_filters`:       `x.filter(a).filter(b)` becomes `x.filter(a & b)`,
+- `push_filters`:       `(x * 2).filter(m)` becomes `x.filter(m) * 2`, so the
+                        arithmetic only runs on the rows that are kept,
+- `masked_dots`:        `(x.filter(m) * y.filter(m)).sum()` and
+                        `(x * y).filter(m).sum()` become one `masked_dot`
+                        node that does not build the filtered Series,
+- `fuse_argmax`:        `x.at_index(k.filter(m).index_of_max())` becomes one
+                        `value_at_max` node: a single argmax over the kept
+                        keys and a lookup of `x` at the same row, with no
+                        filtered Series or label lookup in between,
+- `fuse_dominant`:      `w.groupby(c).sum().index_of_max()` becomes
+                        `dominant(c, w)`, the category with the largest
+                        total weight, without a grouped Series per row,
+- `simplify_fractions`: `length_of_right / length_of_overlap` becomes
+                        `fraction_of_right` (and the same for the left), and
+                        under a filter that keeps only overlapping rows
+                        `fraction_of_right * length_of_overlap` becomes
+                        `length_of_right`.
+
+Rules are applied bottom up, pass after pass, until nothing changes. Rules
+that depend on the shape of their operands use `merge._types`; plans that
+do not type check are returned unchanged so the error is raised where the
+plan is checked. `equivalent` evaluates a plan before and after rewriting,
+to test rules against data.
+"""
+from __future__ import annotations
+import operator
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST, ASTChild
+from ._pushdown import mask_bound
+from ._types import NodeType, PlanTypeError, infer_types
+
+
+TypeOf = Callable[[ASTChild], Optional[NodeType]]
+Rule   = Callable[[AST, TypeOf], Optional[ASTChild]]
+
+_FOLDABLE:dict[str, Callable[..., Any]] = {
+    "+"  : operator.add,
+    "-"  : operator.sub,
+    "*"  : operator.mul,
+    "/"  : operator.truediv,
+    ">"  : operator.gt,
+    "<"  : operator.lt,
+    ">=" : operator.ge,
+    "<=" : operator.le,
+    "==" : operator.eq,
+    "and": operator.and_,
+    "or" : operator.or_,
+    "neg": operator.neg,
+    "not": operator.invert,
+}
+
+# nodes whose value for a right row only depends on that row
+_ELEMENTWISE = {"+", "-", "*", "/", ">", "<", ">=", "<=", "==", "and", "or", "neg", "not", "astype", "isna"}
+# elementwise nodes that a filter is pushed through
+_PUSHABLE    = {"+", "-", "*", "/", "neg", "astype"}
+
+
+def _is_number(value:ASTChild) -> bool:
+    return isinstance(value, (bool, int, float))
+
+
+def _is_row_vector(node_type:Optional[NodeType]) -> bool:
+    return node_type is not None and node_type.rows
+
+
+def fold_constants(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    operation = _FOLDABLE.get(node.action)
+    if operation is None or not all(_is_number(child) for child in node.children):
+        return None
+    try:
+        # the same Python operators `AST.evaluate` applies to literals
+        folded = operation(*node.children)
+    except (ArithmeticError, TypeError):
+        return None
+    return folded if _is_number(folded) else None
+
+
+def fuse_filters(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action != "filter":
+        return None
+    series, mask = node.children
+    if not isinstance(series, AST) or series.action != "filter":
+        return None
+    inner_series, inner_mask = series.children
+    return AST("filter", (inner_series, AST("and", (inner_mask, mask))))
+
+
+def push_filters(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action != "filter":
+        return None
+    series, mask = node.children
+    if not isinstance(series, AST) or series.action not in _PUSHABLE or not _is_row_vector(type_of(series)):
+        return None
+    operands = [child for child in series.children if isinstance(child, AST)]
+    operand_types = [type_of(child) for child in operands]
+    if any(item is None for item in operand_types):
+        return None
+    vectors = [child for child, item in zip(operands, operand_types) if item.kind == "vector"]  # type: ignore[union-attr]
+    # filtering two operands instead of one result would add work
+    if len(vectors) != 1 or not _is_row_vector(type_of(vectors[0])):
+        return None
+    vector, = vectors
+    return AST(series.action, tuple(
+        AST("filter", (child, mask)) if child is vector else child
+        for child in series.children
+    ))
+
+
+def masked_dots(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action != "sum" or not isinstance(node.children[0], AST):
+        return None
+    item = node.children[0]
+    if item.action == "*":
+        left, right = item.children
+        if not (isinstance(left, AST) and isinstance(right, AST) and left.action == right.action == "filter"):
+            return None
+        (left, mask), (right, right_mask) = left.children, right.children
+        if mask is not right_mask:
+            return None
+    elif item.action == "filter":
+        product, mask = item.children
+        if not isinstance(product, AST) or product.action != "*":
+            return None
+        left, right = product.children
+    else:
+        return None
+    if not (_is_row_vector(type_of(left)) and _is_row_vector(type_of(right))):
+        return None
+    return AST("masked_dot", (left, right, mask))
+
+
+def fuse_argmax(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action != "at_index":
+        return None
+    series, index = node.children
+    if not isinstance(index, AST) or index.action != "index_of_max":
+        return None
+    key = index.children[0]
+    # labels of right rows only; the maximum of a grouped sum is labelled by group
+    if not (_is_row_vector(type_of(series)) and _is_row_vector(type_of(key))):
+        return None
+    mask:ASTChild = True
+    if isinstance(key, AST) and key.action == "filter":
+        key, mask = key.children
+    return AST("value_at_max", (series, key, mask))
+
+
+def fuse_dominant(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action != "index_of_max" or not isinstance(total := node.children[0], AST) or total.action != "sum":
+        return None
+    grouped = total.children[0]
+    if not isinstance(grouped, AST) or grouped.action != "groupby":
+        return None
+    weight, categories = grouped.children
+    weight_type = type_of(weight)
+    if not (_is_row_vector(weight_type) and _is_row_vector(type_of(categories))):
+        return None
+    if weight_type.dtype is not None and weight_type.dtype.kind not in "biuf":  # type: ignore[union-attr]
+        return None
+    return AST("dominant", (categories, weight))
+
+
+def _keeps_overlapping_only(mask:ASTChild) -> bool:
+    """True if `mask` is only True where the overlap is greater than zero"""
+    bound = mask_bound(mask)
+    return bound is not None and bound.overlapping_only
+
+
+_FRACTIONS = {
+    ("length_of_right", "length_of_overlap"): "fraction_of_right",
+    ("length_of_left",  "length_of_overlap"): "fraction_of_left",
+}
+_LENGTHS = {fraction:length for (length, _overlap), fraction in _FRACTIONS.items()}
+
+
+def _cancel_fractions(node:ASTChild) -> ASTChild:
+    """`node` with `fraction_of_x * length_of_overlap` replaced by `length_of_x`; only valid where the overlap is positive"""
+    def elementwise(item:ASTChild) -> bool:
+        return isinstance(item, AST) and item.action in _ELEMENTWISE
+
+    if not elementwise(node):
+        return node
+    # bottom up with an explicit stack, so long chains of arithmetic do not hit the recursion limit
+    cancelled:dict[int, ASTChild] = {}
+    stack:list[tuple[AST, bool]] = [(node, False)]  # type: ignore[list-item]
+    while stack:
+        item, children_done = stack.pop()
+        if not children_done:
+            if id(item) not in cancelled:
+                stack.append((item, True))
+                stack.extend((child, False) for child in item.children if elementwise(child))  # type: ignore[misc]
+            continue
+        children = tuple(cancelled[id(child)] if elementwise(child) else child for child in item.children)
+        result:ASTChild = AST(item.action, children)
+        if item.action == "*":
+            actions = tuple(child.action if isinstance(child, AST) else None for child in children)
+            for fraction, other in (actions, actions[::-1]):
+                if fraction in _LENGTHS and other == "length_of_overlap":
+                    result = AST(_LENGTHS[fraction], ())
+                    break
+        cancelled[id(item)] = result
+    return cancelled[id(node)]
+
+
+def simplify_fractions(node:AST, type_of:TypeOf) -> Optional[ASTChild]:
+    if node.action == "/":
+        actions = tuple(child.action if isinstance(child, AST) else None for child in node.children)
+        if actions in _FRACTIONS:
+            return AST(_FRACTIONS[actions], ())  # type: ignore[index]
+        return None
+    if node.action == "filter":
+        series, mask = node.children
+        cancelled = (_cancel_fractions(series), mask)
+    elif node.action == "masked_dot":
+        left, right, mask = node.children
+        cancelled = (_cancel_fractions(left), _cancel_fractions(right), mask)
+    else:
+        return None
+    if all(a is b for a, b in zip(cancelled, node.children)) or not _keeps_overlapping_only(mask):
+        return None
+    return AST(node.action, cancelled)
+
+
+RULES:list[tuple[str, Rule]] = [
+    ("fold_constants",     fold_constants),
+    ("fuse_filters",       fuse_filters),
+    ("simplify_fractions", simplify_fractions),
+    ("push_filters",       push_filters),
+    ("masked_dots",        masked_dots),
+    ("fuse_argmax",        fuse_argmax),
+    ("fuse_dominant",      fuse_dominant),
+]
+
+
+def _rewrite_pass(plan:AST, rules:list[tuple[str, Rule]], types:dict[int, NodeType]) -> ASTChild:
+    def type_of(node:ASTChild) -> Optional[NodeType]:
+        # nodes made earlier in this pass are not typed yet; their rules wait for the next pass
+        return types.get(id(node)) if isinstance(node, AST) else None
+
+    rewritten:dict[int, ASTChild] = {}
+    for node in AST._post_order(plan):
+        children = tuple(rewritten[id(child)] if isinstance(child, AST) else child for child in node.children)
+        result:ASTChild = node if all(a is b for a, b in zip(children, node.children)) else AST(node.action, children)
+        if isinstance(result, AST):
+            for _name, rule in rules:
+                replacement = rule(result, type_of)
+                if replacement is not None:
+                    result = replacement
+                    break
+        rewritten[id(node)] = result
+    return rewritten[id(plan)]
+
+
+def rewrite_plan(plan:ASTChild, rules:Optional[list[tuple[str, Rule]]]=None, max_passes:int=20) -> ASTChild:
+    """Apply `rules` (by default `RULES`) to `plan` until it stops changing"""
+    if rules is None:
+        rules = RULES
+    for _ in range(max_passes):
+        if not isinstance(plan, AST):
+            return plan
+        try:
+            types = infer_types(plan)
+        except PlanTypeError:
+            return plan
+        rewritten = _rewrite_pass(plan, rules, types)
+        if rewritten is plan:
+            break
+        plan = rewritten
+    return plan
+
+
+def _same_value(left:Any, right:Any, rtol:float) -> bool:
+    if isinstance(left, tuple) and isinstance(right, tuple):
+        return len(left) == len(right) and all(_same_value(a, b, rtol) for a, b in zip(left, right))
+    if isinstance(left, (pd.Series, pd.DataFrame)) or isinstance(right, (pd.Series, pd.DataFrame)):
+        if type(left) is not type(right):
+            return False
+        try:
+            testing = pd.testing.assert_series_equal if isinstance(left, pd.Series) else pd.testing.assert_frame_equal
+            testing(left, right, check_dtype=False, check_names=False, rtol=rtol)
+        except AssertionError:
+            return False
+        return True
+    if pd.api.types.is_scalar(left) and pd.api.types.is_scalar(right):
+        if pd.isna(left) or pd.isna(right):
+            return bool(pd.isna(left) and pd.isna(right))
+        if isinstance(left, (bool, int, float, np.number)) and isinstance(right, (bool, int, float, np.number)):
+            return bool(np.isclose(left, right, rtol=rtol, atol=0))
+    return bool(left == right)
+
+
+def equivalent(plan:ASTChild, rewritten:Optional[ASTChild]=None, rtol:float=1e-9, **arguments) -> bool:
+    """True if `plan` and `rewritten` (by default `rewrite_plan(plan)`) give the same value with `AST.evaluate`.
+
+    `arguments` are the keyword arguments of `AST.evaluate` other than
+    `myast`. Values are compared up to a relative tolerance of `rtol`, since
+    rewritten arithmetic may round differently.
+    """
+    if rewritten is None:
+        rewritten = rewrite_plan(plan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return _same_value(AST.evaluate(plan, **arguments), AST.evaluate(rewritten, **arguments), rtol)
@@ -0,0 +1,230 @@
+"""A right dataset prepared once and stored as memory-mappable files.
+
+Every call of `merge_on_intervals` projects the right data, computes
+`__RIGHT_LENGTH__`, factorizes the join keys and sorts the rows by join
+group. A `RightIndex` holds the result of that work, so a reference dataset
+merged against many left tables is only prepared once: pass the index as
+the `right_data` of `merge_on_intervals`. `RightIndex.save(directory)`
+writes each array to its own `.npy` file and `RightIndex.open(directory)`
+maps them back read-only, so opening an index reads only its small
+manifest, and a merge only pages in the columns and groups it visits.
+
+The directory holds:
+
+- `index.json`: the join and interval columns, the number of right rows
+  and the file of each array, with the sorted distinct strings of string
+  arrays,
+- `order.npy` and `offsets.npy`: the original position of each sorted row,
+  and where each join group starts, as returned by `group_offsets`,
+- `keys-<level>.npy`: each join column of the distinct join keys, one row per group,
+- `column-<position>.npy`: each column, sorted by join group.
+
+Object arrays cannot be memory mapped, so string columns are stored as codes
+into their sorted distinct strings, the encoding of `merge._categorical`.
+Columns that a merge only reads through lookups are used as codes directly;
+other string columns are decoded, which copies just those columns, and
+their missing values come back as NaN. Columns of other Python objects
+cannot be stored.
+
+Files are written to a temporary name and renamed into place, with the
+manifest last; do not open a directory while an index is being saved to it.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Iterable, Literal, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._categorical import decode_strings, encode_strings, lookup_columns
+from ._group import LENGTH_RIGHT
+from ._merge import Columns, Data, distinct_keys, factorize_join_keys, group_offsets, lookup_join_keys, prepare_columns, project, row_count
+
+# bump when the layout of the directory changes
+INDEX_VERSION = 1
+
+_MANIFEST = "index.json"
+
+
+def _storable(name:str, values:np.ndarray) -> tuple[np.ndarray, Optional[np.ndarray]]:
+    """`values` as an array `np.save` can write without pickling, and its categories if it held strings"""
+    if values.dtype != object:
+        return values, None
+    if pd.api.types.infer_dtype(values, skipna=True) not in ("string", "empty"):
+        raise Exception(f"Column {name!r} holds Python objects other than strings, which a RightIndex cannot store")
+    return encode_strings(values)
+
+
+@dataclass
+class RightIndex:
+    """A right dataset projected, split into join groups and sorted by group.
+
+    Group `g` holds the rows `columns[name][offsets[g]:offsets[g+1]]`, which
+    were the rows `order[offsets[g]:offsets[g+1]]` of the right data, for the
+    join key in row `g` of `keys`. String columns hold codes into
+    `categories[name]`.
+    """
+    join_left_on :list[str]
+    from_to      :tuple[str, str]
+    row_count    :int
+    keys         :Columns
+    order        :np.ndarray
+    offsets      :np.ndarray
+    columns      :Columns
+    categories   :dict[str, np.ndarray]
+
+    def __repr__(self) -> str:
+        return f"RightIndex({len(self.order)} rows, {len(self.offsets) - 1} groups, columns {list(self.columns)})"
+
+    @staticmethod
+    def build(
+        right_data   :Data,
+        join_left_on :list[str],
+        from_to      :tuple[str, str],
+        columns      :Optional[Iterable[str]] = None,
+    ) -> RightIndex:
+        """Prepare `right_data` for merges on `join_left_on` and `from_to`.
+
+        Only `columns` (by default every column) are kept besides the join
+        and interval columns.
+        """
+        if columns is None:
+            columns = right_data.columns if isinstance(right_data, pd.DataFrame) else right_data.keys()
+        kept = {name for name in columns if name not in (*join_left_on, *from_to)}
+        projected = project(right_data, join_left_on, from_to, kept, LENGTH_RIGHT)
+
+        (codes,), group_count = factorize_join_keys([projected], join_left_on)
+        order, offsets = group_offsets(codes, group_count)
+        keys = distinct_keys(projected, codes, join_left_on)
+        sorted_columns:Columns = {}
+        categories:dict[str, np.ndarray] = {}
+        for name, values in projected.items():
+            sorted_columns[name], column_categories = _storable(name, values[order])
+            if column_categories is not None:
+                categories[name] = column_categories
+        return RightIndex(list(join_left_on), tuple(from_to), row_count(projected), keys, order, offsets, sorted_columns, categories)  # type: ignore[arg-type]
+
+    def save(self, directory:Union[str, os.PathLike]) -> None:
+        """Write the index to `directory`, creating it if needed"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def write(stem:str, values:np.ndarray, categories:Optional[np.ndarray]=None) -> dict[str, Any]:
+            file_descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+            try:
+                with os.fdopen(file_descriptor, "wb") as file:
+                    np.save(file, np.ascontiguousarray(values), allow_pickle=False)
+                os.replace(temporary, directory / f"{stem}.npy")
+            except BaseException:
+                os.unlink(temporary)
+                raise
+            return {"file":f"{stem}.npy", "categories":None if categories is None else categories.tolist()}
+
+        keys = [
+            write(f"keys-{level}", *_storable(name, self.keys[name]))
+            for level, name in enumerate(self.join_left_on)
+        ]
+        manifest = {
+            "version"      : INDEX_VERSION,
+            "join_left_on" : self.join_left_on,
+            "from_to"      : list(self.from_to),
+            "row_count"    : self.row_count,
+            "order"        : write("order",   self.order  ),
+            "offsets"      : write("offsets", self.offsets),
+            "keys"         : keys,
+            "columns"      : [
+                {"name":name, **write(f"column-{position}", values, self.categories.get(name))}
+                for position, (name, values) in enumerate(self.columns.items())
+            ],
+        }
+        file_descriptor, temporary = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+                json.dump(manifest, file, ensure_ascii=False)
+            os.replace(temporary, directory / _MANIFEST)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    @staticmethod
+    def open(directory:Union[str, os.PathLike], mmap_mode:Literal["r", "c"]="r") -> RightIndex:
+        """Map the index saved in `directory` without reading its arrays.
+
+        With `mmap_mode="c"` the arrays may be written to, copy on write,
+        without changing the files.
+        """
+        directory = Path(directory)
+        with open(directory / _MANIFEST, encoding="utf-8") as file:
+            manifest = json.load(file)
+        if manifest.get("version") != INDEX_VERSION:
+            raise Exception(f"{directory} holds a RightIndex of version {manifest.get('version')}, expected {INDEX_VERSION}")
+
+        def load(entry:dict[str, Any]) -> np.ndarray:
+            return np.load(directory / entry["file"], mmap_mode=mmap_mode, allow_pickle=False)
+
+        def categories(entry:dict[str, Any]) -> Optional[np.ndarray]:
+            return None if entry["categories"] is None else np.asarray(entry["categories"], dtype=object)
+
+        keys:Columns = {}
+        for name, entry in zip(manifest["join_left_on"], manifest["keys"]):
+            values = load(entry)
+            key_categories = categories(entry)
+            keys[name] = values if key_categories is None else decode_strings(values, key_categories)
+        return RightIndex(
+            join_left_on = manifest["join_left_on"],
+            from_to      = tuple(manifest["from_to"]),  # type: ignore[arg-type]
+            row_count    = manifest["row_count"],
+            keys         = keys,
+            order        = load(manifest["order"]),
+            offsets      = load(manifest["offsets"]),
+            columns      = {entry["name"]:load(entry) for entry in manifest["columns"]},
+            categories   = {entry["name"]:column_categories for entry in manifest["columns"] if (column_categories := categories(entry)) is not None},
+        )
+
+    def check(self, join_left_on:list[str], from_to:tuple[str, str]) -> None:
+        if list(join_left_on) != self.join_left_on or tuple(from_to) != self.from_to:
+            raise ValueError(
+                f"The right index joins on {self.join_left_on} and {self.from_to}, "
+                f"not on {list(join_left_on)} and {tuple(from_to)}"
+            )
+
+    def columns_for(self, add_columns:list[AST]) -> tuple[Columns, dict[str, np.ndarray]]:
+        """The sorted columns `add_columns` read, and the categories of those left encoded.
+
+        Columns are the stored arrays themselves, except string columns read
+        other than through lookups, which are decoded.
+        """
+        _left_needed, right_needed, _names = prepare_columns(add_columns)
+        # like `encode_categories(..., keep=join_left_on)`
+        lookups = lookup_columns(add_columns) - set(self.join_left_on)
+        columns:Columns = {}
+        categories:dict[str, np.ndarray] = {}
+        for name in dict.fromkeys([*self.from_to, LENGTH_RIGHT, *sorted(right_needed)]):
+            if name not in self.columns:
+                raise Exception(f"The right index has no column {name!r}; it holds {list(self.columns)}")
+            values = self.columns[name]
+            if name in self.categories:
+                # a column of only missing values is not encoded by `encode_categories` either
+                if name in lookups and len(self.categories[name]):
+                    categories[name] = self.categories[name]
+                else:
+                    values = decode_strings(values, self.categories[name])
+            columns[name] = values
+        return columns, categories
+
+    def group_codes(self, left_columns:Columns) -> np.ndarray:
+        """The join group of every left row; the group count for keys without right rows, -1 for missing keys"""
+        return lookup_join_keys(self.keys, left_columns, self.join_left_on)
+
+    def unsorted(self, columns:Columns) -> Columns:
+        """`columns` (from `columns_for`) in the order of the right data; rows with a missing join key are zero"""
+        original:Columns = {}
+        for name, values in columns.items():
+            original[name] = np.zeros(self.row_count, dtype=values.dtype)
+            original[name][self.order] = values
+        return original
@@ -0,0 +1,127 @@
+"""The dependency graph of an optimized plan, and a thread pool that runs it.
+
+`AST.optimize` turns a plan into an `execute` of `declare` statements
+followed by the result, usually the `outputs` of several columns. Each
+declaration and each output is a step that depends only on the declarations
+it refers to. `plan_graph` makes those dependencies explicit, and
+`run_graph` evaluates the steps on an executor as soon as the steps they
+depend on are done, so independent declarations and columns run at the same
+time.
+
+This pays off for the batch engine on large join groups: each step is a few
+NumPy operations over every pair of the group, and NumPy releases the GIL
+while it works.
+"""
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from ._ast import AST, ASTChild
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    """One declaration or output of a plan, and the declarations it refers to"""
+    name    :str
+    node    :ASTChild
+    depends :tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class PlanGraph:
+    """The steps of a plan; declarations come before the steps that refer to them.
+
+    `outputs` is None when the plan has a single result rather than named
+    outputs; its only step is then the last of `steps`.
+    """
+    steps   :list[PlanStep]
+    outputs :Optional[list[str]]
+
+
+def _references(node:ASTChild) -> tuple[str, ...]:
+    return tuple(dict.fromkeys(
+        each.children[0]  # type: ignore[misc]
+        for each in AST._post_order(node)
+        if each.action == "refer"
+    ))
+
+
+def plan_graph(plan:ASTChild) -> PlanGraph:
+    """The dependency graph of `plan`, usually the output of `AST.optimize` or `AST.optimize_columns`"""
+    if isinstance(plan, AST) and plan.action == "execute":
+        *statements, result = plan.children
+    else:
+        statements, result = [], plan
+
+    steps:list[PlanStep] = []
+    declared:set[str] = set()
+
+    def add(name:str, node:ASTChild) -> None:
+        depends = _references(node)
+        undeclared = [each for each in depends if each not in declared]
+        if undeclared:
+            raise Exception(f"Step {name!r} refers to {undeclared} before they are declared")
+        steps.append(PlanStep(name, node, depends))
+
+    for statement in statements:
+        if not isinstance(statement, AST) or statement.action != "declare":
+            raise Exception(f"Expected only declarations before the result of a plan, found {statement!r}")
+        name, value = statement.children
+        add(name, value)  # type: ignore[arg-type]
+        declared.add(name)  # type: ignore[arg-type]
+
+    if isinstance(result, AST) and result.action == "outputs":
+        # output names may repeat, and may equal declared names, so output steps are named by position
+        outputs = []
+        for position, output in enumerate(result.children):
+            _name, value = output.children  # type: ignore[union-attr]
+            outputs.append(f"output {position}")
+            add(outputs[-1], value)
+        return PlanGraph(steps, outputs)
+    add("result", result)
+    return PlanGraph(steps, None)
+
+
+def run_graph(graph:PlanGraph, evaluate:Callable[[ASTChild], Any], context:dict[str, Any], executor:Executor) -> Any:
+    """Evaluate every step of `graph` on `executor`; the value of the plan, like the `execute` it came from.
+
+    `evaluate(node)` must read the declarations a node refers to from
+    `context`, where the value of each declaration is stored once its step
+    is done.
+    """
+    values:dict[str, Any] = {}
+    waiting = {step.name:set(step.depends) for step in graph.steps}
+    dependents:dict[str, list[PlanStep]] = {step.name:[] for step in graph.steps}
+    for step in graph.steps:
+        for name in step.depends:
+            dependents[name].append(step)
+
+    running:dict[Future, PlanStep] = {}
+
+    def start(step:PlanStep) -> None:
+        running[executor.submit(evaluate, step.node)] = step
+
+    for step in graph.steps:
+        if not step.depends:
+            start(step)
+    while running:
+        done, _pending = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            step = running.pop(future)
+            try:
+                values[step.name] = future.result()
+            except BaseException:
+                for other in running:
+                    other.cancel()
+                raise
+            if dependents[step.name]:
+                context[step.name] = values[step.name]
+            for dependent in dependents[step.name]:
+                waiting[dependent.name].discard(step.name)
+                if not waiting[dependent.name]:
+                    start(dependent)
+
+    if graph.outputs is None:
+        return values[graph.steps[-1].name]
+    return tuple(values[name] for name in graph.outputs)
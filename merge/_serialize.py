@@ -0,0 +1,108 @@
+"""A versioned JSON format for AST plans.
+
+A plan is stored as a table of distinct nodes in which every node comes
+after its children, so subtrees shared by a hash-consed plan are written
+once:
+
+    {"format": "merge_with_deferred.plan", "version": 1,
+     "nodes": [["length_of_overlap", []], [">", [0, {"int": 0}]], ...],
+     "root": 1}
+
+Each child is either an integer (the position of a node in the table) or a
+tagged literal: `{"int": 1}`, `{"float": 0.5}`, `{"bool": true}`,
+`{"str": "x"}`, `{"none": null}` or `{"slice": [start, stop, step]}` where
+the slice parts are tagged literals too. Non-finite floats are written as the
+strings "nan", "inf" and "-inf". The tags keep `1`, `1.0` and `True` apart.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import math
+from typing import Any
+
+from ._ast import AST, ASTChild
+
+
+FORMAT_NAME    = "merge_with_deferred.plan"
+FORMAT_VERSION = 1
+
+
+def encode_literal(value:Any) -> dict[str, Any]:
+    # bool before int; bool is a subclass of int
+    if isinstance(value, bool):
+        return {"bool": value}
+    if isinstance(value, int):
+        return {"int": value}
+    if isinstance(value, float):
+        return {"float": value if math.isfinite(value) else repr(value)}
+    if isinstance(value, str):
+        return {"str": value}
+    if value is None:
+        return {"none": None}
+    if isinstance(value, slice):
+        return {"slice": [encode_literal(value.start), encode_literal(value.stop), encode_literal(value.step)]}
+    raise Exception(f"Unable to serialize literal {value!r} of type {type(value).__name__}")
+
+
+def decode_literal(encoded:dict[str, Any]) -> Any:
+    if len(encoded) != 1:
+        raise Exception(f"Expected a tagged literal, found {encoded!r}")
+    (tag, value), = encoded.items()
+    if tag == "bool":
+        return bool(value)
+    if tag == "int":
+        return int(value)
+    if tag == "float":
+        return float(value)
+    if tag == "str":
+        return str(value)
+    if tag == "none":
+        return None
+    if tag == "slice":
+        return slice(*map(decode_literal, value))
+    raise Exception(f"Unknown literal tag {tag!r}")
+
+
+def to_document(plan:ASTChild) -> dict[str, Any]:
+    """The plan as a JSON-compatible dictionary"""
+    if not isinstance(plan, AST):
+        return {"format": FORMAT_NAME, "version": FORMAT_VERSION, "nodes": [], "root": encode_literal(plan)}
+    positions:dict[int, int] = {}
+    nodes:list[list[Any]] = []
+    for node in AST._post_order(plan):
+        positions[id(node)] = len(nodes)
+        nodes.append([
+            node.action,
+            [positions[id(child)] if isinstance(child, AST) else encode_literal(child) for child in node.children],
+        ])
+    return {"format": FORMAT_NAME, "version": FORMAT_VERSION, "nodes": nodes, "root": positions[id(plan)]}
+
+
+def from_document(document:dict[str, Any]) -> ASTChild:
+    """Rebuild the plan of a dictionary made by `to_document`"""
+    if document.get("format") != FORMAT_NAME:
+        raise Exception(f"Not a serialized plan; expected format {FORMAT_NAME!r}, found {document.get('format')!r}")
+    if document.get("version") != FORMAT_VERSION:
+        raise Exception(f"Unsupported plan format version {document.get('version')!r}; expected {FORMAT_VERSION}")
+    nodes:list[AST] = []
+    for action, children in document["nodes"]:
+        nodes.append(AST(action, tuple(
+            nodes[child] if isinstance(child, int) else decode_literal(child)
+            for child in children
+        )))
+    root = document["root"]
+    return nodes[root] if isinstance(root, int) else decode_literal(root)
+
+
+def dumps(plan:ASTChild) -> str:
+    """Compact JSON text of the plan; equal plans always give the same text"""
+    return json.dumps(to_document(plan), separators=(",", ":"), ensure_ascii=False)
+
+
+def loads(text:str) -> ASTChild:
+    return from_document(json.loads(text))
+
+
+def plan_hash(plan:ASTChild) -> str:
+    """A hash of the plan that is stable across processes and sessions"""
+    return hashlib.sha256(dumps(plan).encode("utf-8")).hexdigest()
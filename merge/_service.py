@@ -0,0 +1,457 @@
+"""A long running merge service that keeps right datasets loaded and indexed.
+
+`MergeService` projects each right dataset once, splits it into join groups
+and builds the `IntervalIndex` of every group up front. Evaluators (the
+optimized and compiled plans of a list of columns) are cached by the JSON of
+the columns and the interval columns of the dataset, so a column list is only
+planned the first time it is seen.
+
+`MergeService.serve_forever(path)` listens on a Unix socket. Requests that
+arrive close together (within `batch_window` seconds) for the same dataset
+and columns are merged as one left batch, so each join group is evaluated
+once for all of them. `MergeClient` is the matching client:
+
+    service = MergeService()
+    service.add_dataset("condition", right_data, ["road", "cwy"], ("slk_from", "slk_to"))
+    service.serve_forever("/tmp/merge.sock")
+
+    client = MergeClient("/tmp/merge.sock")
+    result = client.merge("condition", left_data, add_columns)
+
+Messages are a JSON header followed by the raw bytes of the columns; no
+pickling is involved. Numeric and boolean columns are sent as their buffers,
+anything else as JSON values. The socket is only accessible to its owner.
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+import json
+import os
+import queue
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._group import LENGTH_LEFT, LENGTH_RIGHT, ColumnGroup, Engine, GroupEvaluator, RightRows
+from ._interval_index import IntervalIndex
+from ._merge import (
+    Columns,
+    Data,
+    as_frame,
+    check_options,
+    distinct_keys,
+    factorize_join_keys,
+    group_offsets,
+    lookup_join_keys,
+    prepare_columns,
+    project,
+    row_count,
+    slice_group,
+)
+from ._output import OutputBuilder, assemble_frame
+from ._plan_cache import PlanCache
+
+
+_FRAME = struct.Struct("!IQ")
+
+
+def _receive_exactly(connection:socket.socket, size:int) -> bytes:
+    chunks = []
+    while size:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Connection closed in the middle of a message")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(connection:socket.socket, header:dict[str, Any], payload:bytes=b"") -> None:
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    connection.sendall(_FRAME.pack(len(header_bytes), len(payload)) + header_bytes + payload)
+
+
+def receive_message(connection:socket.socket) -> Optional[tuple[dict[str, Any], bytes]]:
+    """The next message, or None if the connection was closed between messages"""
+    first = connection.recv(_FRAME.size)
+    if not first:
+        return None
+    frame = first + _receive_exactly(connection, _FRAME.size - len(first))
+    header_size, payload_size = _FRAME.unpack(frame)
+    header = json.loads(_receive_exactly(connection, header_size).decode("utf-8"))
+    return header, _receive_exactly(connection, payload_size)
+
+
+def _json_value(value:Any) -> Any:
+    if value is pd.NA:
+        return {"NA": None}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise Exception(f"Unable to send value {value!r} of type {type(value).__name__}")
+
+
+def _python_value(value:Any) -> Any:
+    return pd.NA if isinstance(value, dict) else value
+
+
+def encode_columns(columns:dict[str, Any]) -> tuple[list[dict[str, Any]], bytes]:
+    """Descriptions of `columns` and the buffer they refer to.
+
+    NumPy numeric and boolean arrays are sent as raw bytes, pandas nullable
+    integer and boolean arrays as their values plus a mask, categoricals as
+    their codes plus a list of categories, and anything else as a list of
+    JSON values.
+    """
+    descriptions = []
+    buffers      = []
+    offset       = 0
+
+    def add(array:np.ndarray) -> dict[str, Any]:
+        nonlocal offset
+        data = np.ascontiguousarray(array).tobytes()
+        buffers.append(data)
+        part = {"dtype": array.dtype.str, "offset": offset, "size": len(data)}
+        offset += len(data)
+        return part
+
+    for name, values in columns.items():
+        if isinstance(values, (pd.arrays.IntegerArray, pd.arrays.BooleanArray)):
+            mask = np.asarray(values.isna())
+            data = values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0)
+            descriptions.append({"name": name, "kind": "masked", "values": add(data), "mask": add(mask)})
+        elif isinstance(values, pd.Categorical):
+            categories = [_json_value(value) for value in values.categories]
+            descriptions.append({"name": name, "kind": "categorical", "values": add(values.codes), "categories": categories})
+        elif isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+            descriptions.append({"name": name, "kind": "array", "values": add(values)})
+        else:
+            descriptions.append({"name": name, "kind": "json", "values": [_json_value(value) for value in values]})
+    return descriptions, b"".join(buffers)
+
+
+def decode_columns(descriptions:list[dict[str, Any]], payload:bytes) -> dict[str, Any]:
+    def array(part:dict[str, Any]) -> np.ndarray:
+        return np.frombuffer(payload, dtype=np.dtype(part["dtype"]), count=part["size"] // np.dtype(part["dtype"]).itemsize, offset=part["offset"]).copy()
+
+    columns:dict[str, Any] = {}
+    for description in descriptions:
+        kind = description["kind"]
+        if kind == "array":
+            columns[description["name"]] = array(description["values"])
+        elif kind == "masked":
+            values, mask = array(description["values"]), array(description["mask"])
+            masked = pd.arrays.BooleanArray if values.dtype == bool else pd.arrays.IntegerArray
+            columns[description["name"]] = masked(values, mask)
+        elif kind == "categorical":
+            columns[description["name"]] = pd.Categorical.from_codes(array(description["values"]), categories=description["categories"])
+        elif kind == "json":
+            values = np.empty(len(description["values"]), dtype=object)
+            values[:] = [_python_value(value) for value in description["values"]]
+            columns[description["name"]] = values
+        else:
+            raise Exception(f"Unknown column encoding {kind!r}")
+    return columns
+
+
+def _request_part(result:Any, start:int, stop:int) -> Any:
+    """The rows of one request in a batched output column, with only the categories those rows use, as `merge_on_intervals` gives"""
+    part = result[start:stop]
+    if isinstance(part, pd.Categorical):
+        return part.remove_unused_categories()
+    return part
+
+
+@dataclass
+class _Dataset:
+    """A right dataset split into join groups, each with its interval index, followed by an empty group"""
+    join_left_on :list[str]
+    from_to      :tuple[str, str]
+    columns      :Columns
+    keys         :Columns
+    groups       :list[ColumnGroup]
+
+    @staticmethod
+    def load(right_data:Data, join_left_on:list[str], from_to:tuple[str, str]) -> _Dataset:
+        frame = as_frame(right_data)
+        # keep every column, since later requests may ask for any of them
+        available = {name for name in frame.columns if name not in (*join_left_on, *from_to)}
+        columns = project(frame, join_left_on, from_to, available, LENGTH_RIGHT)
+
+        (codes,), group_count = factorize_join_keys([columns], join_left_on)
+        order, offsets = group_offsets(codes, group_count)
+        sorted_columns = {name:values[order] for name, values in columns.items()}
+        from_column, to_column = from_to
+        groups = []
+        for group in range(group_count):
+            rows = slice_group(sorted_columns, order, offsets[group], offsets[group + 1])
+            groups.append(ColumnGroup(rows.columns, rows.labels, IntervalIndex(rows.columns[from_column], rows.columns[to_column])))
+        groups.append(ColumnGroup({name:values[:0] for name, values in columns.items()}, np.empty(0, dtype=np.intp)))
+        return _Dataset(join_left_on, from_to, columns, distinct_keys(columns, codes, join_left_on), groups)
+
+    def group_codes(self, left:Columns) -> np.ndarray:
+        """The group of every left row, as a position in `groups`"""
+        # keys without right rows share the empty group at the end; missing keys join nothing
+        return lookup_join_keys(self.keys, left, self.join_left_on)
+
+
+@dataclass
+class _Columns:
+    """A planned list of columns"""
+    add_columns :list[AST]
+    names       :list[str]
+    left_needed :set[str]
+    evaluator   :GroupEvaluator
+
+
+@dataclass
+class _Pending:
+    dataset  :str
+    columns  :str
+    engine   :Engine
+    right_rows :RightRows
+    left     :Columns
+    done     :threading.Event = field(default_factory=threading.Event)
+    result   :Optional[list[Any]] = None
+    error    :Optional[BaseException] = None
+
+
+class MergeService:
+    """Right datasets held in memory, merged against left batches on request"""
+
+    def __init__(self, plan_cache:Optional[PlanCache]=None, batch_window:float=0.005) -> None:
+        self.plan_cache   = plan_cache
+        self.batch_window = batch_window
+        self.datasets:dict[str, _Dataset] = {}
+        self.planned :dict[tuple[tuple[str, str], str, Engine, RightRows], _Columns] = {}
+        self.lock    = threading.Lock()
+        self.pending:queue.Queue[Optional[_Pending]] = queue.Queue()
+        self.server:Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def add_dataset(self, name:str, right_data:Data, join_left_on:list[str], from_to:tuple[str, str]) -> None:
+        """Load, group and index `right_data` under `name`"""
+        dataset = _Dataset.load(right_data, join_left_on, from_to)
+        with self.lock:
+            self.datasets[name] = dataset
+
+    def describe(self) -> dict[str, Any]:
+        return {
+            name:{"join_left_on": list(dataset.join_left_on), "from_to": list(dataset.from_to)}
+            for name, dataset in self.datasets.items()
+        }
+
+    def _plan(self, dataset:_Dataset, columns_json:str, engine:Engine, right_rows:RightRows) -> _Columns:
+        # the evaluator reads the interval columns of the dataset, so datasets only share plans when those match
+        key = (dataset.from_to, columns_json, engine, right_rows)
+        with self.lock:
+            planned = self.planned.get(key)
+        if planned is None:
+            check_options(engine, right_rows)
+            add_columns = [AST.from_json(column) for column in json.loads(columns_json)]
+            left_needed, _right_needed, names = prepare_columns(add_columns)
+            evaluator = GroupEvaluator.build(add_columns, dataset.from_to, engine, right_rows, plan_cache=self.plan_cache)
+            planned = _Columns(add_columns, names, left_needed, evaluator)
+            with self.lock:
+                self.planned[key] = planned
+        return planned
+
+    def _evaluate(self, dataset_name:str, columns_json:str, engine:Engine, right_rows:RightRows, left:Columns) -> list[Any]:
+        """The finished output columns for the projected `left` rows"""
+        dataset = self.datasets[dataset_name]
+        planned = self._plan(dataset, columns_json, engine, right_rows)
+        left = project(left, dataset.join_left_on, dataset.from_to, planned.left_needed, LENGTH_LEFT)
+        codes = dataset.group_codes(left)
+        order, offsets = group_offsets(codes, len(dataset.groups))
+        output = OutputBuilder.for_columns(
+            planned.add_columns,
+            {name:values.dtype for name, values in left           .items()},
+            {name:values.dtype for name, values in dataset.columns.items()},
+            LENGTH_LEFT,
+            LENGTH_RIGHT,
+            row_count(left),
+        )
+        left_sorted = {name:values[order] for name, values in left.items()}
+        for group in np.flatnonzero(np.diff(offsets)):
+            left_group = slice_group(left_sorted, order, offsets[group], offsets[group + 1])
+            output.fill(left_group.labels, planned.evaluator(left_group, dataset.groups[group]))
+        return [column.result() for column in output.columns]
+
+    def merge(self, dataset:str, left_data:Data, add_columns:list[AST], engine:Engine="row", right_rows:RightRows="auto") -> pd.DataFrame:
+        """Like `merge_on_intervals` against the right dataset `dataset`, in this process"""
+        columns_json = json.dumps([AST.to_json(column) for column in add_columns])
+        planned = self._plan(self.datasets[dataset], columns_json, engine, right_rows)
+        left_frame = as_frame(left_data)
+        return assemble_frame(left_frame, self._evaluate(dataset, columns_json, engine, right_rows, left_frame), planned.names)
+
+    def _run_batches(self) -> None:
+        """Evaluate queued requests, gathering those that arrive within `batch_window` of each other"""
+        while True:
+            first = self.pending.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.batch_window
+            stop = False
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    item = self.pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            similar:dict[tuple[str, str, str, str], list[_Pending]] = {}
+            for item in batch:
+                similar.setdefault((item.dataset, item.columns, item.engine, item.right_rows), []).append(item)
+            for (dataset, columns, engine, right_rows), items in similar.items():
+                try:
+                    names = list(items[0].left)
+                    sizes = [row_count(item.left) for item in items]
+                    left  = {name:np.concatenate([item.left[name] for item in items]) for name in names}
+                    results = self._evaluate(dataset, columns, engine, right_rows, left)  # type: ignore[arg-type]
+                    bounds = np.concatenate([[0], np.cumsum(sizes)])
+                    for item, start, stop_at in zip(items, bounds[:-1], bounds[1:]):
+                        item.result = [_request_part(result, start, stop_at) for result in results]
+                except BaseException as error:
+                    for item in items:
+                        item.error = error
+                for item in items:
+                    item.done.set()
+            if stop:
+                return
+
+    def submit(self, dataset:str, columns_json:str, engine:Engine, right_rows:RightRows, left:Columns) -> list[Any]:
+        """Queue a request for the batching thread and wait for its output columns"""
+        item = _Pending(dataset, columns_json, engine, right_rows, left)
+        self.pending.put(item)
+        item.done.wait()
+        if item.error is not None:
+            raise item.error
+        assert item.result is not None
+        return item.result
+
+    def serve_forever(self, path:str) -> None:
+        """Listen for `MergeClient` requests on the Unix socket `path` until `shutdown` is called"""
+        service = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                while True:
+                    message = receive_message(self.request)
+                    if message is None:
+                        return
+                    header, payload = message
+                    try:
+                        if header["op"] == "describe":
+                            send_message(self.request, {"ok": True, "datasets": service.describe()})
+                            continue
+                        if header["op"] != "merge":
+                            raise Exception(f"Unknown operation {header['op']!r}")
+                        left = decode_columns(header["left"], payload)
+                        results = service.submit(header["dataset"], header["columns"], header["engine"], header["right_rows"], left)
+                        descriptions, result_payload = encode_columns({str(position):result for position, result in enumerate(results)})
+                    except Exception as error:
+                        send_message(self.request, {"ok": False, "error": f"{type(error).__name__}: {error}"})
+                        continue
+                    send_message(self.request, {"ok": True, "columns": descriptions}, result_payload)
+
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            # a socket left behind by an earlier service; never remove anything else
+            if not stat.S_ISSOCK(mode):
+                raise Exception(f"{path} exists and is not a socket")
+            os.unlink(path)
+        # bind with owner only permissions, so no other user can connect before the chmod;
+        # the umask is per process, so it is restored straight away
+        previous_umask = os.umask(0o077)
+        try:
+            server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        finally:
+            os.umask(previous_umask)
+        batches = threading.Thread(target=self._run_batches, name="merge-batches", daemon=True)
+        batches.start()
+        with server:
+            server.daemon_threads = True
+            os.chmod(path, 0o600)
+            self.server = server
+            try:
+                server.serve_forever()
+            finally:
+                self.pending.put(None)
+                batches.join()
+                os.unlink(path)
+
+    def shutdown(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class MergeClient:
+    """Sends merges to a `MergeService` listening on the Unix socket `path`"""
+
+    def __init__(self, path:str) -> None:
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(path)
+        self.datasets:Optional[dict[str, Any]] = None
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self) -> MergeClient:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _request(self, header:dict[str, Any], payload:bytes=b"") -> tuple[dict[str, Any], bytes]:
+        send_message(self.connection, header, payload)
+        message = receive_message(self.connection)
+        if message is None:
+            raise ConnectionError("The merge service closed the connection")
+        response, response_payload = message
+        if not response["ok"]:
+            raise Exception(f"Merge service error: {response['error']}")
+        return response, response_payload
+
+    def describe(self) -> dict[str, Any]:
+        """The join columns and interval columns of each dataset the service holds"""
+        if self.datasets is None:
+            self.datasets = self._request({"op": "describe"})[0]["datasets"]
+        return self.datasets
+
+    def merge(self, dataset:str, left_data:Data, add_columns:list[AST], engine:Engine="row", right_rows:RightRows="auto") -> pd.DataFrame:
+        """Like `merge_on_intervals` against the right dataset `dataset` of the service"""
+        description = self.describe()[dataset]
+        join_left_on, from_to = description["join_left_on"], tuple(description["from_to"])
+        left_needed, _right_needed, names = prepare_columns(add_columns)
+        left_frame = as_frame(left_data)
+        # only send the columns the service needs; it works out the interval lengths itself
+        left = {
+            name:values
+            for name, values in project(left_frame, join_left_on, from_to, left_needed, LENGTH_LEFT).items()
+            if name != LENGTH_LEFT
+        }
+        descriptions, payload = encode_columns(left)
+        response, response_payload = self._request({
+            "op"         : "merge",
+            "dataset"    : dataset,
+            "columns"    : json.dumps([AST.to_json(column) for column in add_columns]),
+            "engine"     : engine,
+            "right_rows" : right_rows,
+            "left"       : descriptions,
+        }, payload)
+        results = decode_columns(response["columns"], response_payload)
+        return assemble_frame(left_frame, [results[str(position)] for position in range(len(names))], names)
@@ -0,0 +1,203 @@
+"""Streaming variant of `merge_on_intervals` that works through the data one join group at a time."""
+from __future__ import annotations
+from collections import deque
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from ._ast import AST
+from ._categorical import category_source, encode_strings, is_strings
+from ._group import LENGTH_LEFT, LENGTH_RIGHT, ColumnGroup, Engine, GroupEvaluator, RightRows
+from ._plan_cache import PlanCache
+from ._merge import check_options, prepare_columns, project
+from ._output import OutputBuilder
+
+
+def _check_sorted(frame:pd.DataFrame, join_left_on:list[str], side:str) -> list[tuple[Any, pd.DataFrame]]:
+    """The groups of `frame` in order; raises if a join key is out of order or not contiguous"""
+    grouped = frame.groupby(by=join_left_on, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    codes = codes[codes >= 0]
+    if np.any(np.diff(codes) < 0):
+        raise ValueError(f"The {side} data must be sorted by the join columns {join_left_on}")
+    groups = list(grouped)
+    if any(not previous < current for (previous, _), (current, _) in zip(groups, groups[1:])):
+        raise ValueError(f"The {side} data must be sorted by the join columns {join_left_on}")
+    return groups
+
+
+class _RightCursor:
+    """Walks forward through right chunks sorted by join key, handing out one group at a time"""
+
+    def __init__(
+        self,
+        chunks       :Iterator[pd.DataFrame],
+        prepare      :Callable[[pd.DataFrame], pd.DataFrame],
+        join_left_on :list[str],
+        columns      :list[str],
+    ) -> None:
+        self.chunks       = chunks
+        self.prepare      = prepare
+        self.join_left_on = join_left_on
+        # the right columns to prepare an empty group from when there are no right chunks at all
+        self.columns      = columns
+        self.groups:deque[tuple[Any, pd.DataFrame]] = deque()
+        self.position     = 0
+        self.last_key:Any = None
+        # an empty right group, once the columns are known
+        self.empty:Optional[pd.DataFrame] = None
+
+    def _load(self) -> bool:
+        for chunk in self.chunks:
+            projected = self.prepare(chunk)
+            # label right rows by their position in the whole stream, as the non-streaming merge does
+            projected.index = pd.RangeIndex(self.position, self.position + len(projected))
+            self.position += len(projected)
+            if self.empty is None:
+                self.empty = projected.iloc[:0]
+            groups = _check_sorted(projected, self.join_left_on, "right")
+            if groups and self.last_key is not None and groups[0][0] < self.last_key:
+                raise ValueError(f"The right data must be sorted by the join columns {self.join_left_on}")
+            if groups:
+                self.last_key = groups[-1][0]
+                self.groups.extend(groups)
+                return True
+        return False
+
+    def _empty(self) -> pd.DataFrame:
+        """An empty right group, from the first chunk or, without any chunk, from the column names"""
+        if self.empty is None:
+            self._load()
+        if self.empty is None:
+            # float, so that reductions over no rows give NaN like they do for numeric columns
+            self.empty = self.prepare(pd.DataFrame({name:np.empty(0) for name in self.columns}))
+        return self.empty
+
+    def dtypes(self) -> dict[str, np.dtype]:
+        """dtypes of the projected right columns"""
+        empty = self._empty()
+        return {name:empty[name].to_numpy().dtype for name in empty.columns}
+
+    def take(self, key:Any) -> pd.DataFrame:
+        """All right rows with join key `key` (possibly none); rows with smaller keys are discarded"""
+        parts = []
+        while self.groups or self._load():
+            group_key, frame = self.groups[0]
+            if group_key < key:
+                self.groups.popleft()
+            elif group_key == key:
+                parts.append(frame)
+                self.groups.popleft()
+            else:
+                break
+        if not parts:
+            return self._empty()
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+
+def _split_last_group(buffer:pd.DataFrame, join_left_on:list[str]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Split off the rows of the last join key, which may continue in the next chunk"""
+    keys = buffer.loc[:, join_left_on]
+    has_key = keys.notna().all(axis="columns").to_numpy()
+    if not has_key.any():
+        return buffer, buffer.iloc[:0]
+    last_keyed = np.flatnonzero(has_key)[-1]
+    is_last_key = (keys == keys.iloc[last_keyed]).all(axis="columns").to_numpy()
+    belongs_to_finished = ~(is_last_key | ~has_key)
+    carry_start = np.flatnonzero(belongs_to_finished)[-1] + 1 if belongs_to_finished.any() else 0
+    return buffer.iloc[:carry_start], buffer.iloc[carry_start:]
+
+
+def iter_merge_on_intervals(
+    left_chunks   : Iterable[pd.DataFrame],
+    right_data    : Union[pd.DataFrame, Iterable[pd.DataFrame]],
+    join_left_on  : list[str],
+    from_to       : tuple[str, str],
+    add_columns   : list[AST],
+    engine        : Engine = "row",
+    right_rows    : RightRows = "auto",
+    plan_cache    : Optional[PlanCache] = None,
+) -> Iterator[pd.DataFrame]:
+    """Like `merge_on_intervals`, but yields the result in chunks as join groups finish.
+
+    `left_chunks` and `right_data` (a DataFrame or an iterable of chunks) must
+    both be sorted by `join_left_on`; the right data should also be sorted by
+    the `from` column within each group. A join group may span several
+    chunks. Only the current left group and the right rows of the current
+    join key are held in memory, so whole networks can be merged in a fixed
+    memory budget.
+
+    Each yielded frame holds the original left columns plus the new columns,
+    indexed by row position in the left stream; concatenating them gives the
+    same values as `merge_on_intervals` on the concatenated input.
+
+    Columns that look up strings are categorical. When `right_data` is a
+    DataFrame every chunk gets the categories of the whole right column, so
+    the chunks concatenate into one categorical; `merge_on_intervals` keeps
+    only the categories it uses, which `remove_unused_categories` gives back.
+    Right chunks cannot be seen in advance, so with them each chunk has the
+    categories it uses, and `pd.concat` gives object columns.
+    """
+    check_options(engine, right_rows)
+
+    left_columns_needed, right_columns_needed, result_column_names = prepare_columns(add_columns)
+    evaluate_group = GroupEvaluator.build(add_columns, from_to, engine, right_rows, plan_cache=plan_cache)
+
+    right_chunks = iter([right_data]) if isinstance(right_data, pd.DataFrame) else iter(right_data)
+    right = _RightCursor(
+        right_chunks,
+        lambda chunk: pd.DataFrame(project(chunk, join_left_on, from_to, right_columns_needed, LENGTH_RIGHT)),
+        join_left_on,
+        list(dict.fromkeys([*join_left_on, *from_to, *sorted(right_columns_needed)])),
+    )
+
+    # the categories of string right columns that columns look up, taken once from the whole right data
+    sources = [category_source(column) for column in add_columns]
+    categories:dict[str, np.ndarray] = {}
+    if isinstance(right_data, pd.DataFrame):
+        for name in set(sources) - {None}:
+            if name in right_data.columns and is_strings(values := right_data[name].to_numpy()):
+                categories[name] = encode_strings(values)[1]  # type: ignore[index]
+
+    last_key:Any = None
+
+    def merge_finished(finished:pd.DataFrame) -> pd.DataFrame:
+        nonlocal last_key
+        left_data = pd.DataFrame(project(finished, join_left_on, from_to, left_columns_needed, LENGTH_LEFT), index=finished.index)
+
+        output = OutputBuilder.for_columns(
+            add_columns,
+            {name:left_data[name].to_numpy().dtype for name in left_data.columns},
+            right.dtypes(),
+            LENGTH_LEFT,
+            LENGTH_RIGHT,
+            len(finished),
+        )
+        for group_index, left_group in _check_sorted(left_data, join_left_on, "left"):
+            if last_key is not None and not last_key < group_index:
+                raise ValueError(f"The left data must be sorted by the join columns {join_left_on}")
+            last_key = group_index
+            right_group = right.take(group_index)
+            output.fill(
+                finished.index.get_indexer(left_group.index),
+                evaluate_group(ColumnGroup.from_frame(left_group), ColumnGroup.from_frame(right_group)),
+            )
+        result = output.assemble(finished, result_column_names)
+        for position, source in enumerate(sources):
+            if source in categories:
+                column = len(finished.columns) + position
+                result.isetitem(column, pd.Categorical(result.iloc[:, column], categories=categories[source]))
+        return result
+
+    left_position = 0
+    carry:pd.DataFrame = pd.DataFrame()
+    for chunk in left_chunks:
+        chunk = chunk.set_axis(pd.RangeIndex(left_position, left_position + len(chunk)), axis="index")
+        left_position += len(chunk)
+        buffer = chunk if carry.empty else pd.concat([carry, chunk])
+        finished, carry = _split_last_group(buffer, join_left_on)
+        if len(finished):
+            yield merge_finished(finished)
+    if len(carry):
+        yield merge_finished(carry)
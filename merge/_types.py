@@ -0,0 +1,353 @@
+"""Static type and shape inference over AST plans.
+
+Every node of a plan is labelled, before anything is evaluated, with
+
+- its kind:
+    - "scalar":  one value per left row that does not depend on the right
+      rows (a left column, a literal, ...),
+    - "vector":  a Series with one value per right row, or per group after a
+      grouped sum; `labels` is the dtype of its index,
+    - "reduced": one value per left row computed from the right rows (a sum,
+      an `index_of_max`, ...),
+    - "grouped": the result of `groupby`, only good for `sum`,
+    - "frame":   the result of `hstack`,
+    - "statement" for `declare`, and "outputs" for a plan with named outputs,
+- its dtype, when the dtypes of the input columns are known,
+- whether it can be missing (`nullable`): NA or NaN.
+
+Plans that cannot work (filtering a scalar, filtering by something that is
+not a boolean Series, reducing a scalar, referring to a name that was never
+declared...) raise `PlanTypeError` when the plan is checked rather than on
+some row in the middle of a merge.
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Literal, Optional
+
+import numpy as np
+
+from ._ast import AST, ASTChild
+
+
+Kind = Literal["scalar", "vector", "reduced", "grouped", "frame", "statement", "outputs"]
+
+_BOOL   = np.dtype(bool)
+_INT    = np.dtype(np.int64)
+_FLOAT  = np.dtype(np.float64)
+# right rows are labelled by their position
+_LABELS = np.dtype(np.int64)
+
+_ARITHMETIC  = {"+", "-", "*", "/"}
+_COMPARISONS = {">", "<", ">=", "<=", "=="}
+_LOGICAL     = {"and", "or", "logical_and", "logical_or"}
+
+
+class PlanTypeError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class NodeType:
+    kind     :Kind
+    dtype    :Optional[np.dtype] = None
+    nullable :bool = True
+    # dtype of the index of a "vector" (or of the groups of a "grouped")
+    labels   :Optional[np.dtype] = None
+    # True for a "vector" indexed by the right rows, rather than by groups
+    rows     :bool = False
+
+    def __str__(self) -> str:
+        dtype = "?" if self.dtype is None else str(self.dtype)
+        return f"{self.kind}[{dtype}{'?' if self.nullable else ''}]"
+
+    @property
+    def per_row(self) -> bool:
+        """True if the node has a single value per left row"""
+        return self.kind in ("scalar", "reduced")
+
+    @property
+    def output_dtype(self) -> Optional[np.dtype]:
+        """The NumPy dtype a column with this type can be stored in, if it is a plain number or boolean"""
+        if not self.per_row or self.dtype is None or self.dtype.kind not in "biuf":
+            return None
+        return self.dtype
+
+
+def _numeric(dtype:Optional[np.dtype]) -> bool:
+    return dtype is not None and dtype.kind in "biuf"
+
+
+def _nullable(dtype:Optional[np.dtype]) -> bool:
+    # integers and booleans held in NumPy arrays cannot be missing
+    return dtype is None or dtype.kind not in "biu"
+
+
+def _rows(left:NodeType, right:NodeType) -> bool:
+    """True if combining `left` and `right` gives a Series indexed by the right rows"""
+    vectors = [item for item in (left, right) if item.kind == "vector"]
+    return bool(vectors) and all(item.rows for item in vectors)
+
+
+def _combine(kind_a:Kind, kind_b:Kind, node:AST) -> Kind:
+    kinds = {kind_a, kind_b}
+    if kinds & {"grouped", "frame", "statement", "outputs"}:
+        raise PlanTypeError(f"Cannot combine a {kind_a} with a {kind_b} in ⟨{node.action}⟩:{node.to_string()}")
+    if "vector" in kinds:
+        return "vector"
+    if "reduced" in kinds:
+        return "reduced"
+    return "scalar"
+
+
+def infer_types(
+    plan         :ASTChild,
+    left_dtypes  :Optional[dict[str, np.dtype]] = None,
+    right_dtypes :Optional[dict[str, np.dtype]] = None,
+    length_left  :Optional[str] = None,
+    length_right :Optional[str] = None,
+) -> dict[int, NodeType]:
+    """The type of every node of `plan`, keyed by `id(node)`.
+
+    `left_dtypes` and `right_dtypes` map column names to dtypes; when they
+    are not given only kinds are checked. `length_left`/`length_right` name
+    the columns holding the interval lengths, if they are among those dtypes.
+    Raises `PlanTypeError` for plans that cannot be evaluated.
+    """
+    left_dtypes  = left_dtypes  or {}
+    right_dtypes = right_dtypes or {}
+    types:dict[int, NodeType] = {}
+    declared:dict[str, NodeType] = {}
+
+    def column_type(dtypes:dict[str, np.dtype], name:ASTChild, kind:Kind) -> NodeType:
+        dtype = dtypes.get(name) if isinstance(name, str) else None
+        vector = kind == "vector"
+        return NodeType(kind, dtype, _nullable(dtype), _LABELS if vector else None, vector)
+
+    def length_dtype() -> Optional[np.dtype]:
+        left_length  = left_dtypes .get(length_left ) if length_left  else None
+        right_length = right_dtypes.get(length_right) if length_right else None
+        if _numeric(left_length) and _numeric(right_length):
+            return np.result_type(left_length, right_length)
+        return None
+
+    def fail(node:AST, message:str) -> PlanTypeError:
+        return PlanTypeError(f"{message} in ⟨{node.action}⟩:{node.to_string()}")
+
+    def literal_type(node:ASTChild) -> NodeType:
+        if isinstance(node, (bool, int, float)):
+            return NodeType("scalar", np.asarray(node).dtype, isinstance(node, float) and node != node)
+        return NodeType("scalar", None, node is None)
+
+    def known(node:AST) -> bool:
+        # declarations make the type of a node depend on its position, so only reuse types of declaration free subtrees
+        return id(node) in types and node.action not in ("refer", "declare", "execute")
+
+    def walker(plan:ASTChild) -> NodeType:
+        """Type `plan` and everything under it, children before parents and left to right.
+
+        The walk keeps its own stack rather than recursing, so deep plans
+        (a long chain of `+`...) do not hit the recursion limit.
+        """
+        if not isinstance(plan, AST):
+            return literal_type(plan)
+        stack:list[tuple[AST, bool]] = [(plan, False)]
+        while stack:
+            node, children_done = stack.pop()
+            if children_done:
+                types[id(node)] = infer(node)
+            elif not known(node):
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(node.children) if isinstance(child, AST))
+        return types[id(plan)]
+
+    def type_of(node:ASTChild) -> NodeType:
+        """The type of a child of the node being inferred, which `walker` has already typed"""
+        return types[id(node)] if isinstance(node, AST) else literal_type(node)
+
+    def infer(node:AST) -> NodeType:
+        action, children = node.action, node.children
+
+        if action == "left_column":
+            return column_type(left_dtypes, children[0], "scalar")
+        if action == "right_column":
+            return column_type(right_dtypes, children[0], "vector")
+        if action == "length_of_left":
+            return column_type(left_dtypes, length_left, "scalar")
+        if action == "length_of_right":
+            return column_type(right_dtypes, length_right, "vector")
+        if action == "length_of_overlap":
+            dtype = length_dtype()
+            return NodeType("vector", dtype, _nullable(dtype), _LABELS, True)
+        if action in ("fraction_of_left", "fraction_of_right"):
+            return NodeType("vector", _FLOAT, True, _LABELS, True)
+
+        if action == "execute":
+            return type_of(children[-1])
+
+        if action == "declare":
+            name, value = children
+            if not isinstance(name, str):
+                raise fail(node, f"Expected a string name, found {name!r}")
+            declared[name] = type_of(value)
+            return NodeType("statement", None, False)
+
+        if action == "refer":
+            name = children[0]
+            if name not in declared:
+                raise fail(node, f"Reference to {name!r} before it is declared")
+            return declared[name]  # type: ignore[index]
+
+        walked = [type_of(child) for child in children]
+
+        if action in _ARITHMETIC:
+            left, right = walked
+            kind = _combine(left.kind, right.kind, node)
+            dtype = None
+            if _numeric(left.dtype) and _numeric(right.dtype):
+                dtype = np.result_type(left.dtype, right.dtype)
+                if action == "/":
+                    dtype = np.result_type(dtype, _FLOAT)
+                elif dtype == _BOOL:
+                    # bool + bool is an integer in pandas
+                    dtype = _INT
+            elif left.dtype is not None and right.dtype is not None and not (left.dtype == object or right.dtype == object):
+                raise fail(node, f"Cannot apply {action} to {left.dtype} and {right.dtype}")
+            nullable = action == "/" or left.nullable or right.nullable
+            return NodeType(kind, dtype, nullable, left.labels or right.labels, _rows(left, right))
+
+        if action in _COMPARISONS:
+            left, right = walked
+            return NodeType(_combine(left.kind, right.kind, node), _BOOL, False, left.labels or right.labels, _rows(left, right))
+
+        if action in _LOGICAL:
+            left, right = walked
+            kind = _combine(left.kind, right.kind, node)
+            dtype = None
+            if left.dtype == _BOOL and right.dtype == _BOOL:
+                dtype = _BOOL
+            elif left.dtype is not None and left.dtype.kind in "iu" and right.dtype is not None and right.dtype.kind in "iu":
+                dtype = np.result_type(left.dtype, right.dtype)
+            return NodeType(kind, dtype, False, left.labels or right.labels, _rows(left, right))
+
+        if action in ("not", "logical_not", "neg"):
+            item, = walked
+            return NodeType(_combine(item.kind, "scalar", node), item.dtype, item.nullable, item.labels, item.rows)
+
+        if action == "isna":
+            item, = walked
+            return NodeType(_combine(item.kind, "scalar", node), _BOOL, False, item.labels, item.rows)
+
+        if action == "astype":
+            item, typ = walked[0], children[1]
+            try:
+                dtype = np.dtype(typ)  # type: ignore[arg-type]
+            except TypeError:
+                dtype = None
+            return NodeType(item.kind, dtype, _nullable(dtype) and item.nullable, item.labels, item.rows)
+
+        if action == "alias":
+            return walked[0]
+
+        if action == "filter":
+            series, mask = walked
+            if series.kind != "vector":
+                raise fail(node, f"Unable to filter a {series.kind}; only Series of right rows can be filtered")
+            if mask.kind != "vector" or (mask.dtype is not None and mask.dtype != _BOOL):
+                raise fail(node, f"Filter mask must be a boolean Series, found {mask}")
+            return series
+
+        if action == "sum":
+            item, = walked
+            if item.kind not in ("vector", "grouped"):
+                raise fail(node, f"Unable to sum a {item.kind}")
+            dtype = None
+            if _numeric(item.dtype):
+                dtype = _FLOAT if item.dtype.kind == "f" else _INT  # type: ignore[union-attr]
+            if item.kind == "grouped":
+                # one sum per group, labelled by the group
+                return NodeType("vector", dtype, False, item.labels)
+            return NodeType("reduced", dtype, False)
+
+        if action == "masked_dot":
+            left, right, mask = walked
+            if not (left.rows and right.rows):
+                raise fail(node, f"Unable to take the dot product of a {left} and a {right}")
+            if mask.kind != "vector" or (mask.dtype is not None and mask.dtype != _BOOL):
+                raise fail(node, f"Filter mask must be a boolean Series, found {mask}")
+            dtype = None
+            if _numeric(left.dtype) and _numeric(right.dtype):
+                dtype = _FLOAT if np.result_type(left.dtype, right.dtype).kind == "f" else _INT
+            return NodeType("reduced", dtype, False)
+
+        if action == "groupby":
+            item, grouper = walked
+            if item.kind != "vector" or grouper.kind != "vector":
+                raise fail(node, f"Unable to group a {item.kind} by a {grouper.kind}")
+            return NodeType("grouped", item.dtype, item.nullable, grouper.dtype)
+
+        if action == "index_of_max":
+            item, = walked
+            if item.kind != "vector":
+                raise fail(node, f"Unable to find the index of the maximum of a {item.kind}")
+            # missing when there is nothing to choose from
+            return NodeType("reduced", item.labels, True)
+
+        if action == "at_index":
+            item, index = walked
+            if item.kind != "vector":
+                raise fail(node, f"Unable to look up an index in a {item.kind}")
+            if not index.per_row:
+                raise fail(node, f"Index to look up must have one value per row, found a {index.kind}")
+            return NodeType("reduced", item.dtype, True)
+
+        if action == "value_at_max":
+            item, key, mask = walked
+            if not (item.rows and key.rows):
+                raise fail(node, f"Unable to look up the maximum of a {key} in a {item}")
+            if mask.kind not in ("vector", "scalar") or (mask.dtype is not None and mask.dtype != _BOOL):
+                raise fail(node, f"Filter mask must be a boolean Series, found {mask}")
+            return NodeType("reduced", item.dtype, True)
+
+        if action == "dominant":
+            categories, weight = walked
+            if not (categories.rows and weight.rows):
+                raise fail(node, f"Unable to weigh a {categories} by a {weight}")
+            if weight.dtype is not None and not _numeric(weight.dtype):
+                raise fail(node, f"Weights must be numeric, found {weight}")
+            # missing when no category is left
+            return NodeType("reduced", categories.dtype, True)
+
+        if action in ("slice_label", "slice_integer"):
+            item = walked[0]
+            if item.kind != "vector":
+                raise fail(node, f"Unable to slice a {item.kind}")
+            if isinstance(children[1], slice):
+                return item
+            return NodeType("reduced", item.dtype, True)
+
+        if action == "hstack":
+            for item in walked:
+                if item.kind != "vector":
+                    raise fail(node, f"Unable to stack a {item.kind}")
+            return NodeType("frame", None, True)
+
+        if action == "outputs":
+            return NodeType("outputs", None, False)
+
+        if action == "output":
+            return walked[1]
+
+        raise fail(node, f"Unexpected Node: {action}")
+
+    walker(plan)
+    return types
+
+
+def plan_type(plan:ASTChild, **dtypes) -> NodeType:
+    """The type of the value of `plan` (for a plan with named outputs, of the `outputs` node); see `infer_types`"""
+    types = infer_types(plan, **dtypes)
+    if isinstance(plan, AST) and plan.action == "execute":
+        plan = plan.children[-1]
+    if not isinstance(plan, AST):
+        return NodeType("scalar")
+    return types[id(plan)]
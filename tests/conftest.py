@@ -0,0 +1,34 @@
+"""Data shared by the tests: a small road network and columns over it."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmark import NetworkShape, road_network
+from merge import AST
+
+
+@pytest.fixture
+def network() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """A small shuffled road network whose right data misses a road and some measures"""
+    left, right = road_network(NetworkShape(roads=3, segments_per_road=8, overlap_density=1.5), seed=1)
+    right = right[right["road"] != "H0002"].copy()
+    right.loc[right.index[::7], "right_measure"] = np.nan
+    return (
+        left .sample(frac=1, random_state=1).reset_index(drop=True),
+        right.sample(frac=1, random_state=2).reset_index(drop=True),
+    )
+
+
+@pytest.fixture
+def columns() -> list[AST]:
+    """Columns reading right rows through an overlap filter, and one reading the whole join group"""
+    overlap  = AST.length_of_overlap()
+    measure  = AST.right_column("right_measure")
+    category = AST.right_column("right_category")
+    return [
+        measure.filter(overlap > 0).sum().alias("sum"),
+        ((measure.filter(overlap > 0) * overlap).sum() / overlap.filter(overlap > 0).sum()).alias("weighted"),
+        measure.at_index(overlap.filter(overlap > 0).index_of_max()).alias("longest"),
+        category.filter(overlap > 0).dominant(overlap).alias("dominant"),
+        (AST.left_column("left_measure") + measure.filter(measure > 5).sum()).alias("group"),
+    ]
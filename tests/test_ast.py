@@ -0,0 +1,95 @@
+"""AST nodes are interned, immutable and survive copying and pickling as the same node."""
+import copy
+import gc
+import pickle
+import threading
+
+import pytest
+
+from merge import AST
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("measure")
+
+
+def _deep_plan(depth:int) -> AST:
+    plan = measure.filter(overlap > 0).sum()
+    for _ in range(depth):
+        plan = plan + AST.left_column("width")
+    return plan
+
+
+def test_equal_structure_is_the_same_node():
+    assert measure.filter(overlap > 0).sum() is AST.right_column("measure").filter(AST.length_of_overlap() > 0).sum()
+    assert hash(measure + 1) == hash(AST.right_column("measure") + 1)
+    assert measure.slice_integer(slice(1, None)) is measure.slice_integer(slice(1, None))
+    assert len({measure + 1, AST.right_column("measure") + 1}) == 1
+
+
+@pytest.mark.parametrize(("first", "second"), [(1, 1.0), (1, True), (0.0, -0.0), ("1", 1)])
+def test_literals_of_other_types_are_other_nodes(first, second):
+    assert measure + first is not measure + second
+
+
+def test_unhashable_literals_are_not_shared():
+    first, second = AST("alias", (measure, ["a"])), AST("alias", (measure, ["a"]))
+    assert first is not second
+    assert first.children[0] is second.children[0]
+
+
+def test_nodes_are_immutable():
+    with pytest.raises(AttributeError):
+        measure.action = "left_column"  # type: ignore[misc]
+    with pytest.raises(AttributeError):
+        del measure.children
+    assert not hasattr(measure, "__dict__")
+
+
+def test_comparison_builds_nodes_instead_of_comparing():
+    node = measure == 1
+    assert isinstance(node, AST) and node.action == "=="
+    with pytest.raises(Exception, match="PEP 335"):
+        bool(node)
+
+
+def test_copies_and_pickles_are_the_same_node():
+    plan = measure.at_index(overlap.filter(overlap > 0).index_of_max()) * -0.0
+    assert copy.copy(plan) is plan
+    assert copy.deepcopy(plan) is plan
+    assert pickle.loads(pickle.dumps(plan)) is plan
+    whole, part = pickle.loads(pickle.dumps([plan, plan.children[0]]))
+    assert whole is plan and part is plan.children[0]
+
+
+def test_deep_plans_pickle_and_walk_without_recursion():
+    plan = _deep_plan(5000)
+    assert pickle.loads(pickle.dumps(plan)) is plan
+    # the name of the right column, the column, the filter and the sum under the additions
+    assert AST.max_depth(plan) == 5004
+    assert AST.columns_required(plan) == ({"width"}, {"measure"})
+
+
+def test_unused_nodes_are_released():
+    gc.collect()
+    count = len(AST._interned)
+    plan = AST.right_column("only used here") + 1
+    assert len(AST._interned) == count + 2
+    del plan
+    gc.collect()
+    assert len(AST._interned) == count
+
+
+def test_threads_build_the_same_node():
+    built:list[AST] = []
+    barrier = threading.Barrier(8)
+
+    def build() -> None:
+        barrier.wait()
+        built.append(AST.right_column("built by threads").filter(overlap > 3).sum())
+
+    threads = [threading.Thread(target=build) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(node is built[0] for node in built)
@@ -0,0 +1,119 @@
+"""`evaluate_batch` on a `PairTable` gives what `AST.evaluate` gives for each left row."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST
+from merge._batch import PairTable, evaluate_batch
+from merge._interval_index import IntervalIndex
+
+overlap     = AST.length_of_overlap()
+overlapping = overlap > 0
+measure     = AST.right_column("measure")
+surface     = AST.right_column("surface")
+
+# plans that only read overlapping right rows, so either pair table gives the same values
+OVERLAPPING_PLANS = [
+    measure.filter(overlapping).sum(),
+    measure.filter(overlapping).index_of_max(),
+    measure.at_index(overlap.filter(overlapping).index_of_max()),
+    (measure.filter(overlapping) * overlap).sum() / overlap.filter(overlapping).sum(),
+    surface.filter(overlapping).dominant(overlap),
+    overlap.filter(overlapping).groupby(surface.filter(overlapping)).sum().index_of_max(),
+    (AST.fraction_of_left() * measure).filter(overlap >= 2).sum() + AST.left_column("width"),
+]
+ALL_PLANS = [
+    *OVERLAPPING_PLANS,
+    measure.filter(measure > 2).sum(),
+    (AST.length_of_right() - overlap).filter(~measure.isna()).sum(),
+]
+
+
+def _group(seed:int) -> dict:
+    random = np.random.default_rng(seed)
+    left_from  = random.integers(0, 40, 5).astype(float)
+    left_to    = left_from + random.integers(0, 20, 5)
+    right_from = np.sort(random.integers(0, 50, 7)).astype(float)
+    right_to   = right_from + random.integers(1, 12, 7)
+    return dict(
+        left_from    = left_from,
+        left_to      = left_to,
+        right_from   = right_from,
+        right_to     = right_to,
+        width        = random.integers(1, 4, 5).astype(float),
+        measure      = np.where(random.random(7) < 0.2, np.nan, random.integers(0, 5, 7).astype(float)),
+        surface      = random.choice(np.array(["asphalt", "gravel", "seal"], dtype=object), 7),
+        right_labels = np.arange(7) * 10,
+    )
+
+
+def _row_values(plan:AST, group:dict) -> list:
+    right = pd.DataFrame({"measure": group["measure"], "surface": group["surface"]}, index=group["right_labels"])
+    length_of_right = pd.Series(group["right_to"] - group["right_from"], index=right.index)
+    values = []
+    for row in range(len(group["left_from"])):
+        overlap_length = np.minimum(group["left_to"][row], group["right_to"]) - np.maximum(group["left_from"][row], group["right_from"])
+        values.append(AST.evaluate(
+            plan,
+            {"width": group["width"][row]},
+            group["left_to"][row] - group["left_from"][row],
+            right,
+            length_of_right,
+            pd.Series(overlap_length, index=right.index),
+        ))
+    return values
+
+
+def _batch_values(plan:AST, group:dict, pairs:PairTable) -> list:
+    right_idx = pairs.right_idx
+    overlap_length = (
+          np.minimum(group["left_to"  ][pairs.left_idx], group["right_to"  ][right_idx])
+        - np.maximum(group["left_from"][pairs.left_idx], group["right_from"][right_idx])
+    )
+    return list(evaluate_batch(
+        plan,
+        pairs,
+        {"width": group["width"]},
+        group["left_to"] - group["left_from"],
+        {"measure": group["measure"], "surface": group["surface"]},
+        group["right_to"] - group["right_from"],
+        overlap_length,
+    ))
+
+
+def _same(expected:list, result:list) -> bool:
+    return len(expected) == len(result) and all(
+        (pd.isna(want) and pd.isna(got)) or want == pytest.approx(got)
+        for want, got in zip(expected, result)
+    )
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+@pytest.mark.parametrize("seed", range(10))
+def test_pair_tables_match_rows(seed):
+    group = _group(seed)
+    all_pairs = PairTable.all_pairs(len(group["left_from"]), group["right_labels"])
+    overlapping_pairs = PairTable.overlapping_pairs(
+        group["left_from"], group["left_to"], IntervalIndex(group["right_from"], group["right_to"]), group["right_labels"],
+    )
+    for plan in ALL_PLANS:
+        assert _same(_row_values(plan, group), _batch_values(plan, group, all_pairs)), plan.to_string()
+    for plan in OVERLAPPING_PLANS:
+        assert _same(_row_values(plan, group), _batch_values(plan, group, overlapping_pairs)), plan.to_string()
+
+
+def test_pair_tables_are_csr():
+    labels = np.array([10, 20, 30])
+    pairs = PairTable.all_pairs(2, labels)
+    assert pairs.offsets.tolist() == [0, 3, 6]
+    assert pairs.left_idx.tolist() == [0, 0, 0, 1, 1, 1]
+    assert pairs.labels.tolist() == [10, 20, 30, 10, 20, 30]
+
+    subset = pairs.subset(np.array([False, True, False, True, True, False]))
+    assert subset.offsets.tolist() == [0, 1, 3]
+    assert subset.right_idx.tolist() == [1, 0, 1]
+
+    index = IntervalIndex(np.array([0.0, 5.0, 10.0]), np.array([5.0, 10.0, 15.0]))
+    overlapping = PairTable.overlapping_pairs(np.array([4.0, 20.0, 5.0]), np.array([6.0, 30.0, 5.0]), index, labels)
+    assert overlapping.offsets.tolist() == [0, 2, 2, 2]
+    assert overlapping.labels.tolist() == [10, 20]
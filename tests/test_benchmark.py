@@ -0,0 +1,39 @@
+"""The benchmark network generator is reproducible and the suite records results that `report` reads back."""
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from benchmark import NetworkShape, report, road_network, run_suite
+
+
+def test_networks_are_reproducible_and_shaped():
+    shape = NetworkShape(roads=3, segments_per_road=20, overlap_density=2.0)
+    left, right = road_network(shape, seed=4)
+    assert_frame_equal(left, road_network(shape, seed=4)[0])
+    assert not left.equals(road_network(shape, seed=5)[0])
+
+    assert len(left) == 3 * 2 * 20 and len(right) == 3 * 2 * 40
+    for frame in (left, right):
+        assert frame.equals(frame.sort_values(["road", "cwy", "slk_from"], ignore_index=True))
+        assert (frame["slk_to"] > frame["slk_from"]).all()
+        # segments of one carriageway follow each other, with gaps but without overlapping
+        for _key, group in frame.groupby(["road", "cwy"]):
+            assert (group["slk_from"].to_numpy()[1:] >= group["slk_to"].to_numpy()[:-1]).all()
+
+
+def test_gaps():
+    left, _right = road_network(NetworkShape(roads=2, segments_per_road=200, gap_ratio=0.0))
+    for _key, group in left.groupby(["road", "cwy"]):
+        assert np.array_equal(group["slk_from"].to_numpy()[1:], group["slk_to"].to_numpy()[:-1])
+
+
+def test_suite_appends_results_that_report_reads(tmp_path):
+    path = tmp_path / "results.jsonl"
+    results = run_suite(scales=["tiny"], configurations=["row", "batch-auto"], repeat=1, results_path=path)
+    assert [result["configuration"] for result in results] == ["row", "batch-auto"]
+    assert all(result["seconds"] > 0 and result["peak_bytes"] > 0 for result in results)
+
+    summary = report(path)
+    assert isinstance(summary, pd.DataFrame)
+    assert list(summary.index.get_level_values("configuration")) == ["row", "batch-auto"]
+    assert (summary["runs"] == 1).all()
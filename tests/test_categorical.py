@@ -0,0 +1,71 @@
+"""String right columns that are only looked up are merged as codes and come back as the same categoricals."""
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_series_equal
+
+from merge import AST, merge_on_intervals
+from merge._categorical import category_source, decode_categories, encode_categories, encode_strings, lookup_columns
+
+overlap  = AST.length_of_overlap()
+category = AST.right_column("right_category")
+measure  = AST.right_column("right_measure")
+
+LONGEST  = category.at_index(overlap.filter(overlap > 0).index_of_max()).alias("longest")
+DOMINANT = category.filter(overlap > 0).dominant(overlap).alias("dominant")
+GROUPED  = overlap.filter(overlap > 0).groupby(category.filter(overlap > 0)).sum().index_of_max().alias("grouped")
+
+
+def test_sources_of_lookups():
+    assert category_source(LONGEST) == "right_category"
+    assert category_source(DOMINANT) == "right_category"
+    assert category_source(GROUPED) == "right_category"
+    assert category_source(measure.filter(overlap > 0).sum()) is None
+    # the result is an index of the right rows, not a value of the column
+    assert category_source(category.filter(overlap > 0).index_of_max()) is None
+
+
+def test_columns_read_other_than_by_lookup_are_not_encoded():
+    assert lookup_columns([LONGEST, DOMINANT]) == {"right_category"}
+    assert lookup_columns([LONGEST, category.isna().filter(overlap > 0).sum()]) == set()
+    # reading it to pick the row of another column's value is not a lookup of it either
+    assert "right_category" not in lookup_columns([LONGEST, measure.at_index(category.filter(overlap > 0).index_of_max())])
+
+
+def test_codes_sort_like_the_strings():
+    values = np.array(["seal", None, "asphalt", "seal", np.nan], dtype=object)
+    codes, categories = encode_strings(values)
+    assert categories.tolist() == ["asphalt", "seal"]
+    assert codes[[0, 2, 3]].tolist() == [1, 0, 1]
+    assert np.isnan(codes[[1, 4]]).all()
+    decoded = decode_categories(codes, np.zeros(5, dtype=bool), categories)
+    assert list(decoded.astype(object)) == ["seal", np.nan, "asphalt", "seal", np.nan]
+
+
+def test_only_looked_up_strings_are_encoded():
+    columns = {
+        "road": np.array(["H1", "H2"], dtype=object),
+        "right_category": np.array(["b", "a"], dtype=object),
+        "right_measure": np.array([1.0, 2.0]),
+    }
+    encoded, categories = encode_categories(columns, [LONGEST, measure.filter(overlap > 0).sum()], keep=["road"])
+    assert set(categories) == {"right_category"}
+    assert encoded["right_category"].tolist() == [1, 0]
+    assert encoded["road"] is columns["road"] and encoded["right_measure"] is columns["right_measure"]
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_encoded_lookups_give_what_string_lookups_give(network, engine):
+    left, right = network
+    lookups = [LONGEST, DOMINANT, GROUPED]
+    encoded = merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), lookups, engine=engine)
+    # a column reading the strings other than by lookup keeps them from being encoded
+    strings = merge_on_intervals(
+        left, right, ["road", "cwy"], ("slk_from", "slk_to"),
+        [*lookups, category.isna().filter(overlap > 0).sum().alias("missing")],
+        engine=engine,
+    )
+    for name in ["longest", "dominant", "grouped"]:
+        assert isinstance(encoded[name].dtype, pd.CategoricalDtype)
+        assert encoded[name].notna().any() and encoded[name].isna().any()
+        assert_series_equal(encoded[name], strings[name])
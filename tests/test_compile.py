@@ -0,0 +1,72 @@
+"""Compiled plans give what `AST.evaluate` gives, and are cached while the plan is alive."""
+import gc
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, merge_on_intervals
+from merge._compile import _compiled_plans, compile_source
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("right_measure")
+
+
+def _arguments() -> dict:
+    index = pd.Index([3, 5, 8, 9])
+    return dict(
+        left_columns      = {"left_measure": 4.0},
+        length_of_left    = 10.0,
+        right_columns     = pd.DataFrame({"right_measure": [1.0, np.nan, 3.0, 2.0], "right_category": list("abba")}, index=index),
+        length_of_right   = pd.Series([5.0, 2.0, 4.0, 4.0], index=index),
+        length_of_overlap = pd.Series([5.0, 0.0, 4.0, -1.0], index=index),
+    )
+
+
+PLANS = [
+    measure.filter(overlap > 0).sum(),
+    measure.at_index(overlap.filter(overlap > 0).index_of_max()),
+    measure.filter(overlap > 0).index_of_max(),
+    AST.right_column("right_category").filter(overlap > 0).dominant(overlap),
+    (measure * AST.fraction_of_right()).filter(~measure.isna()).sum() / AST.length_of_left(),
+    AST.left_column("left_measure") * 2 + overlap.filter(overlap > 0).sum(),
+    measure.slice_integer(slice(None, 2)).sum(),
+]
+
+
+@pytest.mark.parametrize("plan", PLANS, ids=AST.output_column_name_simple)
+def test_compiled_matches_evaluate(plan):
+    optimized = AST.optimize_columns([plan, overlap.filter(overlap > 0).sum()])
+    assert AST.compile(optimized)(**_arguments()) == AST.evaluate(optimized, **_arguments())
+
+
+def test_cached_while_the_plan_is_alive():
+    plan = AST.optimize(measure.filter(overlap > 0).sum() * 3)
+    compiled = AST.compile(plan)
+    assert AST.compile(AST.optimize(measure.filter(overlap > 0).sum() * 3)) is compiled
+    key = id(plan)
+    del plan
+    gc.collect()
+    assert key not in _compiled_plans or _compiled_plans[key][0]() is not None
+
+
+def test_deep_expressions_are_split_into_locals():
+    plan = measure.filter(overlap > 0).sum()
+    for term in range(1, 251):
+        plan = plan + AST.left_column("left_measure") * float(term)
+    source, _constants = compile_source(AST.optimize(plan))
+    assert "_step_" in source
+    assert AST.compile(AST.optimize(plan))(**_arguments()) == pytest.approx(4.0 + 4.0 * 250 * 251 / 2)
+
+
+def test_deep_expressions_merge_with_the_row_engine():
+    plan = measure.filter(overlap > 0).sum()
+    for term in range(1, 251):
+        plan = plan + AST.left_column("left_measure") * float(term)
+    left = pd.DataFrame({"road": ["H1"] * 3, "slk_from": [0, 10, 20], "slk_to": [10, 20, 30], "left_measure": [1.0, 2.0, 3.0]})
+    right = pd.DataFrame({"road": ["H1"] * 2, "slk_from": [0, 15], "slk_to": [15, 30], "right_measure": [1.0, 2.0]})
+    row   = merge_on_intervals(left, right, ["road"], ("slk_from", "slk_to"), [plan], engine="row")
+    batch = merge_on_intervals(left, right, ["road"], ("slk_from", "slk_to"), [plan], engine="batch")
+    assert_frame_equal(row, batch)
+    assert row.iloc[:, -1].tolist() == pytest.approx([1.0 + 31375, 3.0 + 62750, 2.0 + 94125])
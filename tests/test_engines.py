@@ -0,0 +1,133 @@
+"""The row and batch engines, with every way of choosing right rows, give the same frames."""
+import itertools
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, iter_merge_on_intervals, merge_on_intervals
+
+# the weighted average divides by zero for left rows without overlaps
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+overlap     = AST.length_of_overlap()
+overlapping = overlap > 0
+measure     = AST.right_column("measure")
+surface     = AST.right_column("surface")
+
+COLUMNS = [
+    measure.filter(overlapping).sum().alias("sum"),
+    measure.filter(overlapping).index_of_max().alias("index of max"),
+    measure.at_index(overlap.filter(overlapping).index_of_max()).alias("measure of longest"),
+    # only rows with a missing measure are kept for some left rows
+    measure.filter(overlapping & measure.isna()).index_of_max().alias("index of max of missing"),
+    surface.at_index(overlap.filter(overlapping).index_of_max()).alias("surface of longest"),
+    surface.filter(overlapping).dominant(overlap).alias("dominant surface"),
+    ((measure.filter(overlapping) * overlap).sum() / overlap.filter(overlapping).sum()).alias("weighted average"),
+    # reads every right row of the group, so "auto" keeps all pairs
+    measure.filter(measure > 2).sum().alias("sum of group"),
+]
+
+
+def _left() -> pd.DataFrame:
+    return pd.DataFrame(
+        columns=["road", "cwy", "slk_from", "slk_to", "left_measure"],
+        data=[
+            ["H001", "L",   0, 100, 1],
+            ["H001", "L", 100, 200, 2],
+            ["H001", "L", 200, 300, 3],
+            ["H001", "L", 500, 550, 4],  # overlaps nothing
+            ["H001", "R",   0, 100, 5],  # a join group without right rows
+            ["H002", "L", 100, 200, 6],  # every overlapping measure is missing
+            ["H003", "L",   0,  50, 7],
+        ],
+    )
+
+
+def _right() -> pd.DataFrame:
+    return pd.DataFrame(
+        columns=["road", "cwy", "slk_from", "slk_to", "measure", "surface"],
+        data=[
+            ["H001", "L",  50, 140, 1.0,    "asphalt"],
+            ["H001", "L", 140, 160, np.nan, "seal"   ],
+            ["H001", "L", 160, 250, 3.0,    "seal"   ],
+            ["H001", "L", 250, 300, 3.0,    "asphalt"],
+            ["H002", "L", 120, 180, np.nan, "gravel" ],
+            ["H002", "L", 180, 200, np.nan, None     ],
+            ["H003", "L",   0,  50, 2.0,    None     ],
+            ["H004", "L",   0, 100, 9.0,    "seal"   ],  # a join group without left rows
+        ],
+    )
+
+
+def _values(column:pd.Series) -> list:
+    """The values of `column` with every kind of missing value as None"""
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+CONFIGURATIONS = [
+    dict(engine=engine, right_rows=right_rows)
+    for engine, right_rows in itertools.product(["row", "batch"], ["all", "auto"])
+]
+
+
+@pytest.mark.parametrize("options", CONFIGURATIONS[1:], ids=lambda options: f"{options['engine']}-{options['right_rows']}")
+def test_engines_agree(options):
+    expected = merge_on_intervals(_left(), _right(), JOIN, FROM_TO, COLUMNS, **CONFIGURATIONS[0])
+    result   = merge_on_intervals(_left(), _right(), JOIN, FROM_TO, COLUMNS, **options)
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("options", CONFIGURATIONS, ids=lambda options: f"{options['engine']}-{options['right_rows']}")
+def test_expected_values(options):
+    result = merge_on_intervals(_left(), _right(), JOIN, FROM_TO, COLUMNS, **options)
+
+    assert result["sum"].tolist() == [1.0, 4.0, 6.0, 0.0, 0.0, 0.0, 2.0]
+    # missing values are skipped and ties go to the first right row; nothing left gives NA
+    assert _values(result["index of max"]) == [0, 2, 2, None, None, None, 6]
+    assert result["index of max of missing"].isna().all()
+    assert result["measure of longest"].tolist() == pytest.approx([1.0, 1.0, 3.0, np.nan, np.nan, np.nan, 2.0], nan_ok=True)
+
+    for name in ["surface of longest", "dominant surface"]:
+        assert isinstance(result[name].dtype, pd.CategoricalDtype)
+    assert _values(result["surface of longest"]) == ["asphalt", "asphalt", "seal", None, None, "gravel", None]
+    # equal total overlaps go to the smallest value
+    assert _values(result["dominant surface"])   == ["asphalt", "seal", "asphalt", None, None, "gravel", None]
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_empty_left(engine):
+    result = merge_on_intervals(_left().iloc[:0], _right(), JOIN, FROM_TO, COLUMNS, engine=engine)
+    assert len(result) == 0
+    assert list(result.columns) == [*_left().columns, *(AST.output_column_name_simple(column) for column in COLUMNS)]
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_stream_chunks_concatenate_like_merge(engine):
+    left = _left().sort_values(JOIN, kind="stable", ignore_index=True)
+    right = _right().sort_values([*JOIN, "slk_from"], kind="stable", ignore_index=True)
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, COLUMNS, engine=engine)
+
+    chunks = [left.iloc[start:start + 2] for start in range(0, len(left), 2)]
+    result = pd.concat(list(iter_merge_on_intervals(chunks, right, JOIN, FROM_TO, COLUMNS, engine=engine)))
+
+    for name in ["surface of longest", "dominant surface"]:
+        assert isinstance(result[name].dtype, pd.CategoricalDtype)
+        result[name] = result[name].cat.remove_unused_categories()
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("options", [dict(engine="row"), dict(engine="batch"), dict(engine="batch", workers=2)], ids=["row", "batch", "batch-workers"])
+def test_deep_plans(options):
+    mask = overlapping
+    for _ in range(1000):
+        mask = mask & overlapping
+    plan = measure.filter(mask).sum()
+    for _ in range(1000):
+        plan = plan + AST.left_column("left_measure")
+    result = merge_on_intervals(_left(), _right(), JOIN, FROM_TO, [plan.alias("deep"), COLUMNS[0]], **options)
+    assert result["deep"].tolist() == (result["sum"] + 1000 * result["left_measure"]).tolist()
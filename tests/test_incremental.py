@@ -0,0 +1,86 @@
+"""`IncrementalMerge.apply` gives what merging the changed right data from scratch gives."""
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, IncrementalMerge, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+CONFIGURATIONS = [dict(engine="row"), dict(engine="batch"), dict(engine="row", right_rows="all")]
+
+
+def _ids(options:dict) -> str:
+    return "-".join(options.values())
+
+
+def _changed(right:pd.DataFrame, inserted:pd.DataFrame, updated:pd.DataFrame, deleted:list) -> pd.DataFrame:
+    """`right` with the changes applied; updated rows keep their place and inserted rows come last"""
+    right = right.drop(deleted)
+    right.loc[updated.index] = updated
+    return pd.concat([right, inserted])
+
+
+@pytest.mark.parametrize("options", CONFIGURATIONS, ids=_ids)
+def test_changes_match_a_merge_from_scratch(network, columns, options):
+    left, right = network
+    incremental = IncrementalMerge(left, right, JOIN, FROM_TO, columns, **options)
+    assert_frame_equal(incremental.result, merge_on_intervals(left, right, JOIN, FROM_TO, columns, **options))
+
+    random = np.random.default_rng(0)
+    next_label = len(right)
+    for _ in range(4):
+        deleted = list(random.choice(right.index, 2, replace=False))
+        updated = right.loc[random.choice(right.index.difference(deleted), 2, replace=False)].copy()
+        updated["right_measure"] = random.integers(0, 10, len(updated)).astype(float)
+        updated["slk_to"] += 15
+        inserted = right.sample(2, random_state=next_label)
+        inserted.index = [next_label, next_label + 1]
+        inserted["slk_from"] += 7
+        next_label += 2
+
+        result = incremental.apply(inserted=inserted, updated=updated, deleted=deleted)
+        right = _changed(right, inserted, updated, deleted)
+        assert_frame_equal(result, merge_on_intervals(left, right, JOIN, FROM_TO, columns, **options))
+
+
+@pytest.mark.parametrize("options", CONFIGURATIONS, ids=_ids)
+def test_lookups_left_without_values(network, columns, options):
+    left, right = network
+    incremental = IncrementalMerge(left, right, JOIN, FROM_TO, columns, **options)
+    # the right data keeps its strings, on a road that the left data does not have
+    inserted = right.iloc[:1].assign(road="H0009")
+    inserted.index = [len(right)]
+
+    result = incremental.apply(inserted=inserted, deleted=list(right.index))
+    assert result["dominant"].isna().all()
+    assert_frame_equal(result, merge_on_intervals(left, inserted, JOIN, FROM_TO, columns, **options))
+
+
+def test_only_overlapping_left_rows_are_recomputed(network, columns):
+    left, right = network
+    overlapping_only = [column for column in columns if AST.output_column_name_simple(column) != "group"]
+    incremental = IncrementalMerge(left, right, JOIN, FROM_TO, overlapping_only)
+    changed = right.iloc[:1].copy()
+    changed["right_measure"] = 100.0
+
+    incremental.apply(updated=changed)
+    row = changed.iloc[0]
+    overlapping = (
+        (left["road"] == row["road"]) & (left["cwy"] == row["cwy"])
+        & (left["slk_from"] < row["slk_to"]) & (left["slk_to"] > row["slk_from"])
+    )
+    assert incremental.last_recomputed.tolist() == np.flatnonzero(overlapping).tolist()
+
+
+def test_unknown_and_repeated_labels_are_refused(network, columns):
+    left, right = network
+    incremental = IncrementalMerge(left, right, JOIN, FROM_TO, columns)
+    with pytest.raises(KeyError):
+        incremental.apply(deleted=[len(right) + 10])
+    with pytest.raises(ValueError):
+        incremental.apply(inserted=right.iloc[:1])
@@ -0,0 +1,59 @@
+"""`IntervalIndex` finds the same intervals as comparing against every one of them."""
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, merge_on_intervals
+from merge._interval_index import IntervalIndex
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+
+def _overlapping(starts:np.ndarray, ends:np.ndarray, start:float, end:float) -> list[int]:
+    overlap = np.minimum(ends, end) - np.maximum(starts, start)
+    return np.flatnonzero(overlap > 0).tolist()
+
+
+def _intervals(random:np.random.Generator, count:int) -> tuple[np.ndarray, np.ndarray]:
+    starts = random.integers(0, 50, count).astype(float)
+    # some empty and some reversed intervals
+    return starts, starts + random.integers(-2, 15, count)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_queries_match_brute_force(seed):
+    random = np.random.default_rng(seed)
+    starts, ends = _intervals(random, random.integers(0, 30))
+    starts[random.random(len(starts)) < 0.1] = np.nan
+    index = IntervalIndex(starts, ends)
+    query_starts, query_ends = _intervals(random, 25)
+
+    offsets, positions = index.query_many(query_starts, query_ends)
+    assert len(offsets) == len(query_starts) + 1
+    for number, (start, end) in enumerate(zip(query_starts, query_ends)):
+        expected = _overlapping(starts, ends, start, end)
+        assert index.query(start, end).tolist() == expected
+        assert positions[offsets[number]:offsets[number + 1]].tolist() == expected
+
+
+def test_touching_intervals_do_not_overlap():
+    index = IntervalIndex(np.array([0.0, 10.0]), np.array([10.0, 20.0]))
+    assert index.query(10.0, 10.0).tolist() == []
+    assert index.query(10.0, 11.0).tolist() == [1]
+    assert index.query(9.0, 11.0).tolist() == [0, 1]
+
+
+def test_overlapping_rows_give_what_all_rows_give(network):
+    left, right = network
+    overlap = AST.length_of_overlap()
+    measure = AST.right_column("right_measure")
+    columns = [
+        measure.filter(overlap > 0).sum().alias("sum"),
+        measure.at_index(overlap.filter(overlap > 0).index_of_max()).alias("longest"),
+    ]
+    for engine in ["row", "batch"]:
+        assert_frame_equal(
+            merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine, right_rows="overlapping"),
+            merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine, right_rows="all"),
+        )
@@ -0,0 +1,58 @@
+"""Join groups are found by factorized key codes and sorted offsets, like `groupby` finds them."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST, merge_on_intervals
+from merge._merge import distinct_keys, factorize_join_keys, group_offsets, lookup_join_keys
+
+LEFT = {
+    "road": np.array(["H1", "H2", "H1", None, "H3", "H2"], dtype=object),
+    "cwy" : np.array([1, 1, 2, 1, 1, 1]),
+}
+RIGHT = {
+    "road": np.array(["H2", "H1", "H4", "H1"], dtype=object),
+    "cwy" : np.array([1, 2, 1, 1]),
+}
+
+
+def test_codes_are_shared_dense_and_skip_missing_keys():
+    (left, right), count = factorize_join_keys([LEFT, RIGHT], ["road", "cwy"])
+    assert count == 5
+    assert sorted(set(left.tolist()) | set(right.tolist())) == [-1, 0, 1, 2, 3, 4]
+    assert left[3] == -1
+    # the same key gets the same code on both sides, and only then
+    keys = [(road, cwy) for side in (LEFT, RIGHT) for road, cwy in zip(side["road"], side["cwy"])]
+    codes = [*left.tolist(), *right.tolist()]
+    for key, code in zip(keys, codes):
+        for other_key, other_code in zip(keys, codes):
+            if code >= 0 and other_code >= 0:
+                assert (key == other_key) == (code == other_code)
+
+
+def test_offsets_slice_each_group_in_order():
+    (codes,), count = factorize_join_keys([LEFT], ["road", "cwy"])
+    order, offsets = group_offsets(codes, count)
+    assert offsets[-1] == len(order) == 5
+    for group in range(count):
+        positions = order[offsets[group]:offsets[group + 1]]
+        assert positions.tolist() == sorted(np.flatnonzero(codes == group).tolist())
+
+
+def test_keys_are_looked_up_by_value():
+    (codes,), _count = factorize_join_keys([LEFT], ["road", "cwy"])
+    keys = distinct_keys(LEFT, codes, ["road", "cwy"])
+    assert list(zip(keys["road"], keys["cwy"])) == [("H1", 1), ("H2", 1), ("H1", 2), ("H3", 1)]
+    rows = lookup_join_keys(keys, {**RIGHT, "road": np.array(["H2", "H1", "H4", None], dtype=object)}, ["road", "cwy"])
+    # a key the left data lacks gets one past the last key, and a missing key gets -1
+    assert rows.tolist() == [1, 2, 4, -1]
+
+
+def test_rows_with_missing_keys_join_nothing():
+    left = pd.DataFrame({"road": ["H1", None, "H1"], "slk_from": [0, 0, 5], "slk_to": [10, 10, 15]})
+    right = pd.DataFrame({"road": ["H1", None], "slk_from": [0, 0], "slk_to": [20, 20], "measure": [1.0, 100.0]})
+    column = AST.right_column("measure").filter(AST.length_of_overlap() > 0).sum().alias("sum")
+    for engine in ["row", "batch"]:
+        result = merge_on_intervals(left, right, ["road"], ("slk_from", "slk_to"), [column], engine=engine)
+        # like `groupby`, which drops missing keys, the left row is not evaluated at all
+        assert result["sum"].tolist() == pytest.approx([1.0, np.nan, 1.0], nan_ok=True)
@@ -0,0 +1,40 @@
+"""Merging several right datasets in one pass gives what separate merges give."""
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, merge_many_on_intervals, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_one_pass_equals_separate_merges(network, columns, engine):
+    left, right = network
+    # a second dataset with other rows, and a road the left data does not have
+    other = right.iloc[::2].copy()
+    other.loc[other.index[0], "road"] = "H9999"
+    overlap = AST.length_of_overlap()
+    other_columns = [
+        AST.right_column("right_measure").filter(overlap > 0).sum().alias("sum"),
+        AST.right_column("right_category").filter(overlap > 0).dominant(overlap).alias("dominant"),
+    ]
+    result = merge_many_on_intervals(
+        left,
+        {"first": (right, columns), "second": (other, other_columns)},
+        JOIN, FROM_TO, engine=engine,
+    )
+    first  = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine)
+    second = merge_on_intervals(left, other, JOIN, FROM_TO, other_columns, engine=engine)
+    # names may repeat across sources, and both are kept
+    assert list(result.columns) == [*left.columns, "sum", "weighted", "longest", "dominant", "group", "sum", "dominant"]
+    assert_frame_equal(result, pd.concat([first, second.drop(columns=left.columns)], axis="columns"))
+
+
+def test_options_are_checked(network, columns):
+    left, right = network
+    with pytest.raises(ValueError):
+        merge_many_on_intervals(left, {"first": (right, columns)}, JOIN, FROM_TO, engine="fast")
@@ -0,0 +1,37 @@
+"""Dicts of NumPy arrays merge like the DataFrames they hold."""
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+def _arrays(frame:pd.DataFrame) -> dict[str, np.ndarray]:
+    return {name: frame[name].to_numpy(dtype=object if frame[name].dtype.kind not in "biuf" else None) for name in frame.columns}
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_arrays_merge_like_frames(network, columns, engine):
+    left, right = network
+    columns = [*columns, AST.right_column("right_measure").filter(AST.length_of_overlap() > 0).index_of_max().alias("index")]
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine)
+    for left_data, right_data in [(_arrays(left), right), (left, _arrays(right)), (_arrays(left), _arrays(right))]:
+        result = merge_on_intervals(left_data, right_data, JOIN, FROM_TO, columns, engine=engine)
+        # the left columns come back as the arrays they were given
+        assert_frame_equal(result.drop(columns=left.columns), expected.drop(columns=left.columns))
+        assert list(result.columns) == list(expected.columns)
+
+
+def test_bad_columns_are_refused(network, columns):
+    left, right = network
+    arrays = _arrays(right)
+    with pytest.raises(ValueError, match="one dimensional"):
+        merge_on_intervals(left, {**arrays, "right_measure": arrays["right_measure"].reshape(-1, 1)}, JOIN, FROM_TO, columns)
+    with pytest.raises(ValueError, match="same length"):
+        merge_on_intervals(left, {**arrays, "right_measure": arrays["right_measure"][:-1]}, JOIN, FROM_TO, columns)
@@ -0,0 +1,93 @@
+"""`AST.optimize_columns` computes subtrees shared between columns once and keeps every column's value."""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST, MergeProfile, merge_on_intervals
+
+overlap     = AST.length_of_overlap()
+overlapping = overlap > 0
+measure     = AST.right_column("measure")
+
+COLUMNS = [
+    measure.filter(overlapping).sum(),
+    (measure.filter(overlapping) * overlap).sum() / overlap.filter(overlapping).sum(),
+    measure.at_index(overlap.filter(overlapping).index_of_max()),
+    AST.left_column("width") * measure.filter(overlapping).sum(),
+    AST.right_column("surface").filter(overlapping).dominant(overlap),
+]
+
+
+def _occurrences(plan:AST) -> Counter:
+    """How many times each node occurs in `plan` written out as a tree"""
+    counts:Counter = Counter()
+    stack = [plan]
+    while stack:
+        node = stack.pop()
+        counts[id(node)] += 1
+        stack.extend(child for child in node.children if isinstance(child, AST))
+    return counts
+
+
+def test_shared_subtrees_are_declared_once():
+    plan = AST.optimize_columns(COLUMNS)
+    assert plan.action == "execute"
+    *declarations, outputs = plan.children
+    assert outputs.action == "outputs"
+    assert declarations and all(declaration.action == "declare" for declaration in declarations)
+
+    nodes = {id(node): node for node in AST._post_order(plan)}
+    repeated = [nodes[key] for key, count in _occurrences(plan).items() if count > 1]
+    # only references and leaves without children are left repeated
+    assert all(node.action == "refer" or not node.children for node in repeated)
+
+    # every reference comes after its declaration
+    declared:set[str] = set()
+    for statement in plan.children:
+        for node in AST._post_order(statement):
+            if node.action == "refer":
+                assert node.children[0] in declared
+        if statement.action == "declare":
+            declared.add(statement.children[0])
+
+
+def test_outputs_keep_their_names():
+    assert AST.output_names(AST.optimize_columns(COLUMNS, ["a", "b", "c", "d", "e"])) == ["a", "b", "c", "d", "e"]
+    assert AST.output_names(AST.optimize_columns(COLUMNS)) == [AST.output_column_name_simple(column) for column in COLUMNS]
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+@pytest.mark.parametrize("seed", range(5))
+def test_outputs_have_the_values_of_the_columns(seed):
+    random = np.random.default_rng(seed)
+    count = random.integers(0, 6)
+    index = pd.Index(random.choice(50, count, replace=False))
+    arguments = dict(
+        left_columns      = {"width": 2.0},
+        length_of_left    = 10.0,
+        right_columns     = pd.DataFrame({
+            "measure": np.where(random.random(count) < 0.2, np.nan, random.random(count)),
+            "surface": random.choice(np.array(["asphalt", "seal"], dtype=object), count),
+        }, index=index),
+        length_of_right   = pd.Series(random.integers(1, 10, count).astype(float), index=index),
+        length_of_overlap = pd.Series(random.integers(-2, 5, count).astype(float), index=index),
+    )
+    result = AST.evaluate(AST.optimize_columns(COLUMNS), **arguments)
+    for column, value in zip(COLUMNS, result):
+        expected = AST.evaluate(column, **arguments)
+        assert (pd.isna(expected) and pd.isna(value)) or expected == pytest.approx(value)
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+def test_shared_subtrees_are_computed_once_per_left_row(network):
+    left, right = network
+    columns = [
+        AST.right_column("right_measure").filter(overlapping).sum(),
+        AST.right_column("right_measure").filter(overlapping).index_of_max(),
+    ]
+    profile = MergeProfile()
+    merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, profile=profile)
+    calls = {stats.node.action: stats.calls for stats in profile.nodes.values() if stats.node.action in ("filter", "sum", "index_of_max")}
+    assert calls == {"filter": len(left), "sum": len(left), "index_of_max": len(left)}
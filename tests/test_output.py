@@ -0,0 +1,61 @@
+"""Output columns are typed from the plan, and fall back to objects when the data does not fit."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST, merge_on_intervals
+from merge._output import OutputColumn
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("right_measure")
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_merge_columns_get_the_dtype_of_their_plan(network, engine):
+    left, right = network
+    columns = [
+        (AST.left_column("left_measure") * 2).alias("int"),
+        measure.filter(overlap > 0).sum().alias("float"),
+        (measure.filter(overlap > 0).sum() > 1).alias("bool"),
+        # left rows on a road the right data lacks have no label
+        measure.filter(overlap > 0).index_of_max().alias("label"),
+    ]
+    result = merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, engine=engine)
+    assert result["int"  ].dtype == np.int64
+    assert result["float"].dtype == np.float64
+    assert result["bool" ].dtype == bool
+    assert result["label"].dtype == pd.Int64Dtype()
+    assert result["label"].isna().any() and result["label"].notna().any()
+
+
+def test_missing_values_make_nullable_arrays():
+    integers = OutputColumn(np.dtype(np.int64), 3)
+    integers.fill(np.array([0, 2]), np.array([4, 5]))
+    assert isinstance(integers.result(), pd.arrays.IntegerArray)
+    assert pd.Series(integers.result()).tolist() == [4, pd.NA, 5]
+
+    booleans = OutputColumn(np.dtype(bool), 2)
+    booleans.fill(np.array([1]), np.array([True]))
+    assert isinstance(booleans.result(), pd.arrays.BooleanArray)
+
+    complete = OutputColumn(np.dtype(np.int64), 2)
+    complete.fill(np.array([0, 1]), np.array([1, 2]))
+    assert isinstance(complete.result(), np.ndarray)
+
+
+def test_values_that_do_not_fit_keep_the_column_as_objects():
+    column = OutputColumn(np.dtype(np.int64), 3)
+    column.fill(np.array([0]), np.array([1]))
+    column.fill(np.array([1, 2]), np.array([1.5, np.nan]))
+    assert pd.Series(column.result()).tolist() == pytest.approx([1, 1.5, np.nan], nan_ok=True)
+
+    column = OutputColumn(np.dtype(np.float64), 2)
+    column.fill(np.array([0, 1]), np.array(["a", "b"], dtype=object))
+    assert list(column.result()) == ["a", "b"]
+
+
+def test_floats_filled_again_do_not_keep_older_values():
+    column = OutputColumn(np.dtype(np.float64), 2)
+    column.fill(np.array([0, 1]), np.array([1.0, 2.0]))
+    column.fill(np.array([0, 1]), np.array([np.nan, 3], dtype=object))
+    assert column.result().tolist() == pytest.approx([np.nan, 3.0], nan_ok=True)
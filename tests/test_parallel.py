@@ -0,0 +1,77 @@
+"""Worker processes give the same result as the serial merge, and shared memory is always released."""
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import merge_on_intervals
+from merge import _parallel
+from merge._parallel import SharedFrame, balance
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_workers_match_serial(network, columns, engine):
+    left, right = network
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine)
+    assert_frame_equal(merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine, workers=2), expected)
+
+
+def test_balance():
+    buckets = balance([10, 1, 1, 1, 7, 2], 3)
+    assert sorted(item for bucket in buckets for item in bucket) == list(range(6))
+    # the largest item gets a bucket of its own
+    assert max(sum([10, 1, 1, 1, 7, 2][item] for item in bucket) for bucket in buckets) == 10
+    assert balance([3], 4) == [[0]]
+
+
+_SharedMemory = shared_memory.SharedMemory
+
+
+class _FailingSharedMemory:
+    """Creates real blocks until `limit` have been made, then fails like a full /dev/shm"""
+    created:list[shared_memory.SharedMemory] = []
+    limit = 0
+
+    def __new__(cls, *arguments, create=False, **keywords):
+        if create and len(cls.created) >= cls.limit:
+            raise OSError(28, "No space left on device")
+        block = _SharedMemory(*arguments, create=create, **keywords)
+        if create:
+            cls.created.append(block)
+        return block
+
+
+@pytest.mark.parametrize("limit", [1, 2, 4])
+def test_blocks_are_released_when_sharing_fails(monkeypatch, limit):
+    _FailingSharedMemory.created = []
+    _FailingSharedMemory.limit = limit
+    monkeypatch.setattr(_parallel.shared_memory, "SharedMemory", _FailingSharedMemory)
+    left  = {"a": np.arange(4.0), "b": np.array(list("wxyz"), dtype=object)}
+    right = {"c": np.arange(3), "d": np.arange(3.0), "e": np.ones(3, dtype=bool)}
+
+    with pytest.raises(OSError):
+        _parallel.evaluate_groups_parallel(left, right, [], [], FROM_TO, "row", "all", workers=1)
+
+    monkeypatch.undo()
+    assert len(_FailingSharedMemory.created) == limit
+    for block in _FailingSharedMemory.created:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=block.name)
+
+
+def test_shared_frame_round_trip():
+    frame = SharedFrame({"number": np.array([1.5, np.nan]), "text": np.array(["a", None], dtype=object)})
+    try:
+        attached = _parallel._AttachedFrame(frame.columns)
+        group = attached.take(np.array([1, 0]))
+        assert group.columns["number"][1] == 1.5 and np.isnan(group.columns["number"][0])
+        assert group.columns["text"][1] == "a" and group.columns["text"][0] != group.columns["text"][0]
+        del attached, group
+    finally:
+        frame.release()
@@ -0,0 +1,68 @@
+"""`MergeProfile` times every node and phase without changing the result of a merge."""
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, MergeProfile, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("measure")
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_profiled_merges_give_the_same_result(network, columns, engine):
+    left, right = network
+    profile = MergeProfile()
+    result = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine, profile=profile)
+    assert_frame_equal(result, merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine))
+
+    assert {"projection", "groupby", "overlap", "evaluation", "output"} <= set(profile.phases)
+    assert profile.plans and profile.nodes
+    assert all(stats.calls > 0 and stats.seconds >= 0 for stats in profile.nodes.values())
+    assert 0 < profile.pairs_overlapping <= profile.pairs_examined
+
+
+def test_nodes_are_timed_inclusive_of_their_children():
+    profile = MergeProfile()
+    plan = (measure.filter(overlap > 0) * 2).sum()
+    right = pd.DataFrame({"measure": [1.0, 2.0]})
+    lengths = pd.Series([1.0, 0.0])
+    assert AST.evaluate(plan, {}, 1.0, right, lengths, lengths, profile=profile) == 2.0
+
+    stats = {id(node): profile.nodes[id(node)] for node in AST._post_order(plan)}
+    assert all(each.calls == 1 for each in stats.values())
+    for node in AST._post_order(plan):
+        for child in node.children:
+            if isinstance(child, AST):
+                assert stats[id(child)].seconds <= stats[id(node)].seconds
+
+
+def test_nodes_that_raise_are_still_recorded():
+    profile = MergeProfile()
+    plan = AST.right_column("missing").sum() + 1
+    with pytest.raises(KeyError):
+        AST.evaluate(plan, {}, 1.0, pd.DataFrame({"measure": [1.0]}), pd.Series([1.0]), pd.Series([1.0]), profile=profile)
+    assert {stats.node.action for stats in profile.nodes.values()} == {"+", "sum", "right_column"}
+
+
+def test_report(network, columns):
+    left, right = network
+    profile = MergeProfile()
+    merge_on_intervals(left, right, JOIN, FROM_TO, columns, profile=profile)
+    report = profile.report()
+    assert "⟨execute⟩" in report and " ms × " in report
+    assert "phases:" in report and "evaluation" in report
+    assert f"examined    {profile.pairs_examined}" in report
+    # nodes that never ran are marked
+    assert "(not run)" in MergeProfile().annotation(measure)
+
+
+def test_profile_is_refused_with_workers(network, columns):
+    left, right = network
+    with pytest.raises(ValueError, match="profile"):
+        merge_on_intervals(left, right, JOIN, FROM_TO, columns, profile=MergeProfile(), workers=2)
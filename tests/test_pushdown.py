@@ -0,0 +1,63 @@
+"""`required_bound` finds the overlap predicate every column applies, and applying it in pair generation keeps the result."""
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, merge_on_intervals
+from merge._pushdown import OverlapBound, mask_bound, required_bound
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("right_measure")
+surface = AST.right_column("right_category")
+
+
+@pytest.mark.parametrize(("columns", "expected"), [
+    ([measure.filter(overlap > 0).sum()],                                OverlapBound(0.0)),
+    ([measure.filter(overlap >= 2).sum()],                               OverlapBound(2.0, inclusive=True)),
+    ([measure.filter(5 < overlap).sum()],                                OverlapBound(5.0)),
+    ([measure.filter((overlap > 1) & (overlap > 3)).sum()],              OverlapBound(3.0)),
+    ([measure.filter(overlap > 1).sum(), measure.filter(overlap > 3).sum()], OverlapBound(1.0)),
+    ([(measure.filter(overlap > 0) * overlap).sum()],                    OverlapBound(0.0)),
+    ([measure.at_index(overlap.filter(overlap > 0).index_of_max())],     OverlapBound(0.0)),
+    ([surface.filter(overlap > 0).dominant(overlap)],                    OverlapBound(0.0)),
+    # nothing reads the right rows
+    ([AST.left_column("left_measure") * 2],                              OverlapBound(0.0)),
+    # these read every right row of the join group
+    ([measure.sum()],                                                    None),
+    ([measure.filter(measure > 5).sum()],                                None),
+    ([measure.filter(overlap > 0).sum(), measure.filter(measure > 5).sum()], None),
+    ([measure.filter(overlap > float("nan")).sum()],                     None),
+])
+def test_required_bound(columns, expected):
+    assert required_bound(columns) == expected
+
+
+def test_mask_bound():
+    assert mask_bound(overlap > 0) == OverlapBound(0.0)
+    assert mask_bound(0 <= overlap) == OverlapBound(0.0, inclusive=True)
+    assert mask_bound(measure > 0) is None
+    assert mask_bound((measure > 0) & (overlap >= 4) & (overlap > 4)) == OverlapBound(4.0)
+    assert mask_bound((measure > 0) | (overlap > 4)) is None
+
+
+def test_bounds():
+    assert OverlapBound(1.0).implies(OverlapBound(0.0))
+    assert OverlapBound(1.0).implies(OverlapBound(1.0, inclusive=True))
+    assert not OverlapBound(1.0, inclusive=True).implies(OverlapBound(1.0))
+    assert OverlapBound(0.0).overlapping_only
+    assert not OverlapBound(-1.0).overlapping_only
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+@pytest.mark.parametrize("engine", ["row", "batch"])
+@pytest.mark.parametrize("mask", [overlap > 0, overlap >= 20, overlap > -5], ids=["overlapping", "long", "negative"])
+def test_pushed_down_bounds_keep_the_result(network, engine, mask):
+    left, right = network
+    columns = [
+        measure.filter(mask).sum().alias("sum"),
+        measure.at_index(overlap.filter(mask).index_of_max()).alias("longest"),
+        surface.filter(mask).dominant(overlap).alias("dominant"),
+    ]
+    assert_frame_equal(
+        merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, engine=engine, right_rows="auto"),
+        merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, engine=engine, right_rows="all"),
+    )
@@ -0,0 +1,140 @@
+"""Every rule of `merge._rewrite` keeps the value of random plans on random right rows."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST
+from merge._rewrite import RULES, equivalent, rewrite_plan
+from merge._types import infer_types
+
+overlap     = AST.length_of_overlap()
+overlapping = overlap > 0
+
+
+class _PlanMaker:
+    """Random well typed plans over the right columns `x`, `y` (floats), `i` (integers) and `c` (strings)"""
+
+    def __init__(self, seed:int) -> None:
+        self.random = np.random.default_rng(seed)
+
+    def choose(self, options:list):
+        return options[self.random.integers(len(options))]
+
+    def number(self):
+        return self.choose([0, 1, 2, 0.5, -1.5, True])
+
+    def vector(self, depth:int=0) -> AST:
+        leaves = [
+            AST.right_column("x"), AST.right_column("y"), AST.right_column("i"),
+            overlap, AST.length_of_right(), AST.fraction_of_right(), AST.fraction_of_left(),
+            AST.length_of_right() / overlap, AST.fraction_of_right() * overlap,
+        ]
+        if depth > 2 or self.random.random() < 0.3:
+            return self.choose(leaves)
+        operation = self.choose(["+", "-", "*", "/"])
+        shape = self.random.integers(5)
+        if shape == 0:
+            return AST(operation, (self.vector(depth + 1), self.number()))
+        if shape == 1:
+            return AST(operation, (self.number(), self.vector(depth + 1)))
+        if shape == 2:
+            return AST(operation, (self.vector(depth + 1), self.vector(depth + 1)))
+        if shape == 3:
+            # constants to fold
+            return AST(operation, (self.vector(depth + 1), AST(self.choose(["+", "-", "*"]), (self.number(), self.number()))))
+        return self.choose([AST("neg", (self.vector(depth + 1),)), self.vector(depth + 1).astype("float64")])
+
+    def mask(self) -> AST:
+        masks = [
+            overlapping,
+            overlap >= 1.5,
+            self.vector(2) > self.number(),
+            ~AST.right_column("x").isna(),
+        ]
+        mask = self.choose(masks)
+        if self.random.random() < 0.3:
+            mask = mask & self.choose(masks)
+        return mask
+
+    def filtered(self) -> AST:
+        vector = self.vector()
+        for _ in range(self.random.integers(1, 3)):
+            vector = vector.filter(self.mask())
+        return vector
+
+    def plan(self) -> AST:
+        shape = self.random.integers(7)
+        if shape == 0:
+            return self.filtered().sum()
+        if shape == 1:
+            mask = self.mask()
+            return (self.vector().filter(mask) * self.vector().filter(mask)).sum()
+        if shape == 2:
+            return (self.vector() * self.vector()).filter(self.mask()).sum()
+        if shape == 3:
+            return self.vector().at_index(self.filtered().index_of_max())
+        if shape == 4:
+            return AST.right_column("c").at_index(self.filtered().index_of_max())
+        if shape == 5:
+            mask = self.mask()
+            return self.vector().filter(mask).groupby(AST.right_column("c").filter(mask)).sum().index_of_max()
+        return self.filtered().sum() / self.filtered().sum()
+
+    def arguments(self) -> dict:
+        count = self.random.integers(0, 7)
+        index = pd.Index(self.random.choice(100, count, replace=False))
+        series = lambda values: pd.Series(values, index=index)
+        overlaps = np.where(self.random.random(count) < 0.4, 0.0, self.random.integers(1, 10, count).astype(float))
+        return dict(
+            left_columns      = {},
+            length_of_left    = 7.0,
+            right_columns     = {
+                "x": series(np.where(self.random.random(count) < 0.2, np.nan, self.random.random(count))),
+                "y": series(self.random.integers(0, 4, count) / 2),
+                "i": series(self.random.integers(-3, 4, count)),
+                "c": series(self.random.choice(["a", "b", "c"], count).astype(object)),
+            },
+            length_of_right   = series(overlaps + self.random.integers(0, 5, count)),
+            length_of_overlap = series(overlaps),
+        )
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_rules_keep_values(seed):
+    maker = _PlanMaker(seed)
+    plan = maker.plan()
+    infer_types(plan)
+    for _ in range(5):
+        arguments = maker.arguments()
+        assert equivalent(plan, **arguments), plan.to_string()
+        for name, rule in RULES:
+            assert equivalent(plan, rewrite_plan(plan, [(name, rule)]), **arguments), f"{name}:{plan.to_string()}"
+
+
+@pytest.mark.parametrize(("plan", "action"), [
+    ((AST.right_column("x") * AST.right_column("y")).filter(overlapping).sum(), "masked_dot"),
+    (AST.right_column("x").at_index(overlap.filter(overlapping).index_of_max()), "value_at_max"),
+    (overlap.groupby(AST.right_column("c")).sum().index_of_max(), "dominant"),
+    (AST.right_column("x").filter(overlapping).filter(overlap > 2), "filter"),
+])
+def test_rules_apply(plan, action):
+    rewritten = rewrite_plan(plan)
+    assert rewritten is not plan
+    assert rewritten.action == action
+    assert AST.optimize(plan, rewrite=False) is not AST.optimize(plan)
+
+
+def test_constants_fold_with_their_sign():
+    plan = AST.right_column("x") * (AST("neg", (0.0,)) * 1)
+    folded = rewrite_plan(plan)
+    assert folded is AST.right_column("x") * -0.0
+    assert folded is not AST.right_column("x") * 0.0
+
+
+def test_deep_plans():
+    plan = AST.right_column("x").filter(overlapping).sum()
+    for _ in range(3000):
+        plan = plan + AST.left_column("y")
+    infer_types(plan)
+    assert rewrite_plan(plan) is plan
+    assert AST.optimize_columns([plan, plan * 2]).action == "execute"
@@ -0,0 +1,64 @@
+"""A right dataset prepared once, saved and mapped back, merges like the data it was built from."""
+import json
+
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import AST, RightIndex, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_saved_indexes_merge_like_the_right_data(network, columns, tmp_path, engine):
+    left, right = network
+    RightIndex.build(right, JOIN, FROM_TO).save(tmp_path)
+    index = RightIndex.open(tmp_path)
+    assert isinstance(index.order, np.memmap)
+    assert "right_category" in index.categories
+    # a column that reads the strings other than by lookup decodes them
+    missing = AST.right_column("right_category").isna().filter(AST.length_of_overlap() > 0).sum().alias("missing")
+    assert_frame_equal(
+        merge_on_intervals(left, index, JOIN, FROM_TO, [*columns, missing], engine=engine),
+        merge_on_intervals(left, right, JOIN, FROM_TO, [*columns, missing], engine=engine),
+    )
+
+
+def test_built_indexes_keep_only_the_columns_asked_for(network):
+    _left, right = network
+    index = RightIndex.build(right, JOIN, FROM_TO, columns=["right_measure"])
+    assert "right_category" not in index.columns
+    assert index.row_count == len(right)
+    # groups are the rows of each join key, sorted
+    for group, key in enumerate(zip(*(index.keys[name] for name in JOIN))):
+        rows = index.order[index.offsets[group]:index.offsets[group + 1]]
+        assert (right.loc[rows, JOIN].apply(tuple, axis="columns") == key).all()
+    with pytest.raises(Exception, match="no column 'right_category'"):
+        index.columns_for([AST.right_column("right_category").sum()])
+
+
+def test_indexes_are_checked(network, columns, tmp_path):
+    left, right = network
+    index = RightIndex.build(right, JOIN, FROM_TO)
+    with pytest.raises(ValueError, match="joins on"):
+        merge_on_intervals(left, index, ["road"], FROM_TO, columns)
+    with pytest.raises(Exception, match="Python objects other than strings"):
+        RightIndex.build(right.assign(right_measure=[object()] * len(right)), JOIN, FROM_TO)
+
+    index.save(tmp_path)
+    manifest = json.loads((tmp_path / "index.json").read_text(encoding="utf-8"))
+    (tmp_path / "index.json").write_text(json.dumps({**manifest, "version": 0}), encoding="utf-8")
+    with pytest.raises(Exception, match="version 0"):
+        RightIndex.open(tmp_path)
+
+
+def test_copy_on_write_leaves_the_files(network, tmp_path):
+    _left, right = network
+    RightIndex.build(right, JOIN, FROM_TO).save(tmp_path)
+    index = RightIndex.open(tmp_path, mmap_mode="c")
+    index.columns["right_measure"][:] = 0
+    assert not (RightIndex.open(tmp_path).columns["right_measure"] == 0).all()
@@ -0,0 +1,91 @@
+"""Plan steps run on a thread pool as soon as the declarations they refer to are done."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pandas.testing import assert_frame_equal
+
+import merge._group
+from merge import AST, MergeProfile, merge_on_intervals
+from merge._schedule import plan_graph, run_graph
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+overlap = AST.length_of_overlap()
+
+
+def test_graph_of_named_outputs():
+    plan = AST.optimize_columns([
+        AST.right_column("a").filter(overlap > 0).sum(),
+        AST.right_column("b").filter(overlap > 0).sum(),
+        AST.left_column("c") * 2,
+    ])
+    graph = plan_graph(plan)
+    assert graph.outputs == ["output 0", "output 1", "output 2"]
+    steps = {step.name: step for step in graph.steps}
+    declared = [step.name for step in graph.steps if not step.name.startswith("output")]
+    # both sums depend on the shared mask, the left column on nothing
+    assert steps["output 0"].depends and steps["output 1"].depends
+    assert steps["output 2"].depends == ()
+    assert all(name in declared for step in graph.steps for name in step.depends)
+
+
+def test_graph_of_a_single_result():
+    graph = plan_graph(AST.right_column("a").sum())
+    assert graph.outputs is None
+    assert [step.name for step in graph.steps] == ["result"]
+
+
+def test_graphs_refuse_references_before_declarations():
+    with pytest.raises(Exception, match="before they are declared"):
+        plan_graph(AST.execute((AST.declare("a", AST.refer("b")), AST.refer("a"))))
+    with pytest.raises(Exception, match="Expected only declarations"):
+        plan_graph(AST.execute((AST.right_column("a"), AST.refer("a"))))
+
+
+def test_independent_steps_run_at_the_same_time():
+    plan = AST.execute((
+        AST.declare("x", AST.left_column("x")),
+        AST.declare("y", AST.left_column("y")),
+        AST.refer("x") + AST.refer("y"),
+    ))
+    # each of the two declarations waits for the other to start
+    barrier = threading.Barrier(2, timeout=10)
+    context:dict = {}
+
+    def evaluate(node):
+        if node.action == "left_column":
+            barrier.wait()
+            return {"x": 1, "y": 2}[node.children[0]]
+        return context["x"] + context["y"]
+
+    with ThreadPoolExecutor(2) as executor:
+        assert run_graph(plan_graph(plan), evaluate, context, executor) == 3
+
+
+def test_errors_are_raised():
+    plan = AST.optimize_columns([AST.left_column("x"), AST.left_column("y")])
+
+    def evaluate(node):
+        raise KeyError(node.children[0])
+
+    with ThreadPoolExecutor(2) as executor, pytest.raises(KeyError):
+        run_graph(plan_graph(plan), evaluate, {}, executor)
+
+
+@pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+def test_threaded_merges_give_the_same_result(network, columns, monkeypatch):
+    left, right = network
+    # run every group on the threads, however small
+    monkeypatch.setattr(merge._group, "THREADED_MIN_PAIRS", 0)
+    assert_frame_equal(
+        merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine="batch", threads=4),
+        merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine="batch"),
+    )
+
+
+def test_threads_are_refused_with_profile(network, columns):
+    left, right = network
+    with pytest.raises(ValueError, match="threads"):
+        merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine="batch", threads=2, profile=MergeProfile())
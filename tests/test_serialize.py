@@ -0,0 +1,93 @@
+"""Plans survive `AST.to_json`/`AST.from_json` and the on-disk `PlanCache` unchanged."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST, PlanCache
+from merge._serialize import plan_hash
+
+overlap     = AST.length_of_overlap()
+overlapping = overlap > 0
+measure     = AST.right_column("measure")
+
+PLANS = [
+    measure.filter(overlapping).sum(),
+    measure.at_index(overlap.filter(overlapping).index_of_max()),
+    AST.right_column("surface").filter(overlap >= 2.5).dominant(overlap),
+    (AST.left_column("width") * 1 + True - 1.0).alias("width"),
+    measure.slice_integer(slice(1, None, 2)).sum(),
+    measure * -0.0,
+    measure * 0.0,
+    measure * float("nan") + float("inf"),
+    measure.astype("float32").filter(overlapping).sum(),
+]
+
+
+@pytest.mark.parametrize("plan", PLANS, ids=AST.output_column_name_simple)
+def test_round_trip_gives_the_same_node(plan):
+    assert AST.from_json(AST.to_json(plan)) is plan
+
+
+@pytest.mark.parametrize("plan", PLANS, ids=AST.output_column_name_simple)
+def test_optimized_plans_round_trip(plan):
+    optimized = AST.optimize_columns([plan, plan + 1, measure.filter(overlapping).sum()])
+    assert AST.from_json(AST.to_json(optimized)) is optimized
+
+
+def test_literals_keep_their_type():
+    one, one_float, true, zero, negative_zero = (
+        AST.from_json(AST.to_json(AST.left_column("x") + value)).children[1]  # type: ignore[union-attr]
+        for value in (1, 1.0, True, 0.0, -0.0)
+    )
+    assert type(one) is int and type(one_float) is float and type(true) is bool
+    assert np.copysign(1, zero) == 1 and np.copysign(1, negative_zero) == -1
+
+
+def test_text_and_hash_are_stable():
+    plan = AST.optimize(PLANS[1])
+    text = AST.to_json(plan)
+    assert json.loads(text)["version"] == 1
+    assert AST.to_json(AST.from_json(text)) == text
+    assert plan_hash(plan) == plan_hash(AST.from_json(text))
+    assert plan_hash(measure * 0.0) != plan_hash(measure * -0.0)
+
+
+def test_unknown_versions_are_refused():
+    document = json.loads(AST.to_json(PLANS[0]))
+    document["version"] = 0
+    with pytest.raises(Exception, match="version"):
+        AST.from_json(json.dumps(document))
+
+
+def test_plan_cache_stores_only_plans(tmp_path):
+    columns = [measure.filter(overlapping).sum(), measure.at_index(overlap.filter(overlapping).index_of_max())]
+    expected = AST.optimize_columns(columns)
+
+    assert PlanCache(tmp_path).optimize_columns(columns) is expected
+    files = [path.name for path in tmp_path.iterdir()]
+    assert files and all(name.endswith(".plan.json") for name in files)
+
+    # another cache on the same directory reads the plan back
+    assert PlanCache(tmp_path).optimize_columns(columns) is expected
+
+    compiled = PlanCache(tmp_path).compile(expected)
+    right = pd.DataFrame({"measure": [1.0, 5.0, 3.0]}, index=[10, 11, 12])
+    result = compiled(
+        left_columns      = {},
+        length_of_left    = 10.0,
+        right_columns     = right,
+        length_of_right   = pd.Series([4.0, 2.0, 6.0], index=right.index),
+        length_of_overlap = pd.Series([4.0, 0.0, 6.0], index=right.index),
+    )
+    assert result == (4.0, 3.0)
+    assert [path.name for path in tmp_path.iterdir()] == files
+
+
+def test_plan_cache_ignores_damaged_files(tmp_path):
+    plan = PLANS[0]
+    PlanCache(tmp_path).optimize(plan)
+    for path in tmp_path.iterdir():
+        path.write_text("{not json")
+    assert PlanCache(tmp_path).optimize(plan) is AST.optimize(plan)
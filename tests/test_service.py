@@ -0,0 +1,95 @@
+"""`MergeService` in process and over its socket gives what `merge_on_intervals` gives."""
+import threading
+
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import MergeClient, MergeService, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+def _without_unused_categories(frame:pd.DataFrame) -> pd.DataFrame:
+    return frame.apply(lambda column: column.cat.remove_unused_categories() if isinstance(column.dtype, pd.CategoricalDtype) else column)
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start serving a service on a socket in `tmp_path`; stops it afterwards"""
+    started:list[tuple[MergeService, threading.Thread]] = []
+
+    def start(service:MergeService) -> str:
+        path = str(tmp_path / "merge.sock")
+        thread = threading.Thread(target=service.serve_forever, args=(path,))
+        thread.start()
+        while service.server is None:
+            threading.Event().wait(0.01)
+        started.append((service, thread))
+        return path
+
+    yield start
+    for service, thread in started:
+        service.shutdown()
+        thread.join()
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_in_process(network, columns, engine):
+    left, right = network
+    service = MergeService()
+    service.add_dataset("condition", right, JOIN, FROM_TO)
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine)
+    assert_frame_equal(service.merge("condition", left, columns, engine=engine), expected)
+
+
+def test_over_socket_in_batches(network, columns, serve):
+    left, right = network
+    service = MergeService(batch_window=0.05)
+    service.add_dataset("condition", right, JOIN, FROM_TO)
+    path = serve(service)
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns)
+
+    results:dict[int, pd.DataFrame] = {}
+    def request(part:int) -> None:
+        with MergeClient(path) as client:
+            results[part] = client.merge("condition", left.iloc[part::4], columns)
+    threads = [threading.Thread(target=request, args=(part,)) for part in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for part in range(4):
+        assert_frame_equal(results[part], _without_unused_categories(expected.iloc[part::4].reset_index(drop=True)))
+
+
+def test_same_columns_on_datasets_with_other_interval_columns(network, columns, serve):
+    left, right = network
+    renamed = right.rename(columns={"slk_from":"start", "slk_to":"end"})
+    service = MergeService()
+    service.add_dataset("a", right,   JOIN, FROM_TO)
+    service.add_dataset("b", renamed, JOIN, ("start", "end"))
+    path = serve(service)
+
+    with MergeClient(path) as client:
+        first  = client.merge("a", left, columns)
+        second = client.merge("b", left.rename(columns={"slk_from":"start", "slk_to":"end"}), columns)
+    assert_frame_equal(first, merge_on_intervals(left, right, JOIN, FROM_TO, columns))
+    assert_frame_equal(second.rename(columns={"start":"slk_from", "end":"slk_to"}), first)
+
+
+def test_errors_are_sent_back(network, columns, serve):
+    left, right = network
+    service = MergeService()
+    service.add_dataset("condition", right, JOIN, FROM_TO)
+    path = serve(service)
+    with MergeClient(path) as client:
+        with pytest.raises(Exception, match="missing"):
+            client.merge("missing", left, columns)
+        # the connection is still usable
+        assert client.describe() == {"condition": {"join_left_on": JOIN, "from_to": list(FROM_TO)}}
+        assert len(client.merge("condition", left.iloc[:3], columns)) == 3
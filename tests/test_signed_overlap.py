@@ -0,0 +1,71 @@
+"""The overlap matrix in blocks under a memory cap, and the batch engine over tiles of left rows."""
+import numpy as np
+import pytest
+from pandas.testing import assert_frame_equal
+
+import merge._group
+from merge import merge_on_intervals
+from util.signed_overlap import block_shape, coordinates, overlap, overlap_blocks, overlapping_pairs
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+def _intervals(rng:np.random.Generator, count:int, dtype) -> tuple[np.ndarray, np.ndarray]:
+    start = rng.integers(0, 1000, count)
+    return start.astype(dtype), (start + rng.integers(1, 100, count)).astype(dtype)
+
+
+@pytest.mark.parametrize("dtype", [np.int64, np.float64])
+@pytest.mark.parametrize("max_bytes", [1, 200, 64 * 2**20])
+def test_blocks_cover_the_matrix(dtype, max_bytes):
+    rng = np.random.default_rng(1)
+    a, b = _intervals(rng, 37, dtype)
+    x, y = _intervals(rng, 23, dtype)
+    expected = overlap(a, b, x, y)
+    seen = np.zeros(expected.shape, dtype=int)
+    for rows, columns, block in overlap_blocks(a, b, x, y, max_bytes):
+        assert 2 * block.nbytes <= max(max_bytes, 2 * block.itemsize)
+        np.testing.assert_array_equal(block, expected[rows, columns])
+        seen[rows, columns] += 1
+    assert (seen == 1).all()
+
+
+def test_pairs_are_the_positive_overlaps():
+    rng = np.random.default_rng(2)
+    a, b = _intervals(rng, 40, np.int64)
+    x, y = _intervals(rng, 30, np.int64)
+    expected = overlap(a, b, x, y)
+    found = [np.concatenate(part) for part in zip(*overlapping_pairs(a, b, x, y, max_bytes=300))]
+    row, column, lengths = found
+    assert len(row) == (expected > 0).sum()
+    np.testing.assert_array_equal(lengths, expected[row, column])
+    assert len(set(zip(row.tolist(), column.tolist()))) == len(row)
+
+
+def test_small_integers_are_computed_in_int32():
+    small = np.array([0, 2**30 - 1], dtype=np.int64)
+    assert all(array.dtype == np.int32 for array in coordinates(small, small))
+    # a single coordinate out of range, or a float, keeps every array as it was
+    assert coordinates(small, np.array([2**30]))[0].dtype == np.int64
+    assert coordinates(small, np.array([-2**30 - 1]))[0].dtype == np.int64
+    assert coordinates(small, np.array([1.0]))[0].dtype == np.int64
+    assert coordinates(small, np.array([], dtype=np.int64))[0].dtype == np.int32
+    _rows, _columns, block = next(overlap_blocks(small - 5, small, small - 5, small))
+    assert block.dtype == np.int32
+
+
+def test_block_shape():
+    assert block_shape(10, 10, 8, 2**20) == (10, 10)
+    assert block_shape(10, 10, 8, 16 * 25) == (2, 10)
+    assert block_shape(10, 100, 8, 16 * 25) == (1, 25)
+    assert block_shape(10, 10, 8, 1) == (1, 1)
+
+
+@pytest.mark.parametrize("right_rows", ["all", "auto"])
+def test_tiled_groups_give_the_same_result(network, columns, monkeypatch, right_rows):
+    left, right = network
+    untiled = merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, engine="batch", right_rows=right_rows)
+    # a few left rows per tile
+    monkeypatch.setattr(merge._group, "MAX_BATCH_PAIRS", 10)
+    tiled = merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), columns, engine="batch", right_rows=right_rows)
+    assert_frame_equal(tiled, untiled)
@@ -0,0 +1,66 @@
+"""`iter_merge_on_intervals` yields chunks that concatenate into what `merge_on_intervals` gives."""
+import pandas as pd
+import pytest
+from pandas.testing import assert_frame_equal
+
+from merge import iter_merge_on_intervals, merge_on_intervals
+
+JOIN    = ["road", "cwy"]
+FROM_TO = ("slk_from", "slk_to")
+
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+
+def _sorted(frame:pd.DataFrame) -> pd.DataFrame:
+    return frame.sort_values([*JOIN, "slk_from"], kind="stable", ignore_index=True)
+
+
+def _chunks(frame:pd.DataFrame, size:int) -> list[pd.DataFrame]:
+    return [frame.iloc[start:start + size] for start in range(0, len(frame), size)]
+
+
+def _lookups_as_objects(frame:pd.DataFrame) -> pd.DataFrame:
+    """`frame` with the lookup columns as objects and every kind of missing value as None"""
+    frame = frame.copy()
+    for name in ["longest", "dominant"]:
+        frame[name] = frame[name].astype(object).where(frame[name].notna(), None)
+    return frame
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+@pytest.mark.parametrize("size", [1, 3, 50])
+def test_chunks_of_right_data_frame(network, columns, engine, size):
+    left, right = map(_sorted, network)
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns, engine=engine)
+    chunks = list(iter_merge_on_intervals(_chunks(left, size), right, JOIN, FROM_TO, columns, engine=engine))
+
+    # join groups that span several left chunks are yielded once they are complete
+    assert all(len(chunk) for chunk in chunks)
+    result = pd.concat(chunks)
+    assert isinstance(result["dominant"].dtype, pd.CategoricalDtype)
+    result["dominant"] = result["dominant"].cat.remove_unused_categories()
+    assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("size", [2, 7])
+def test_chunks_of_right_data(network, columns, size):
+    left, right = map(_sorted, network)
+    expected = merge_on_intervals(left, right, JOIN, FROM_TO, columns)
+    result = pd.concat(list(iter_merge_on_intervals(_chunks(left, 5), _chunks(right, size), JOIN, FROM_TO, columns)))
+    # each chunk only has the categories it uses, so the lookups concatenate into objects
+    assert_frame_equal(_lookups_as_objects(result), _lookups_as_objects(expected))
+
+
+def test_no_right_chunks(network, columns):
+    left, right = map(_sorted, network)
+    result = pd.concat(list(iter_merge_on_intervals(_chunks(left, 4), [], JOIN, FROM_TO, columns)))
+    expected = merge_on_intervals(left, right.iloc[:0], JOIN, FROM_TO, columns)
+    assert_frame_equal(_lookups_as_objects(result), _lookups_as_objects(expected))
+
+
+def test_unsorted_data_is_refused(network, columns):
+    left, right = map(_sorted, network)
+    with pytest.raises(ValueError, match="left data must be sorted"):
+        list(iter_merge_on_intervals(_chunks(left[::-1], 4), right, JOIN, FROM_TO, columns))
+    with pytest.raises(ValueError, match="right data must be sorted"):
+        list(iter_merge_on_intervals(_chunks(left, 4), _chunks(right[::-1], 4), JOIN, FROM_TO, columns))
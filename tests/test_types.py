@@ -0,0 +1,73 @@
+"""`infer_types` labels plans before evaluation and refuses plans that cannot work."""
+import numpy as np
+import pytest
+
+from merge import AST, merge_on_intervals
+from merge._types import PlanTypeError, infer_types, plan_type
+
+overlap  = AST.length_of_overlap()
+measure  = AST.right_column("measure")
+surface  = AST.right_column("surface")
+width    = AST.left_column("width")
+
+DTYPES = dict(
+    left_dtypes  = {"width": np.dtype(np.int64), "day": np.dtype("datetime64[ns]")},
+    right_dtypes = {"measure": np.dtype(np.float64), "surface": np.dtype(object)},
+)
+
+
+@pytest.mark.parametrize(("plan", "expected"), [
+    (width * 2,                                                    "scalar[int64]"),
+    (width / 2,                                                    "scalar[float64?]"),
+    (measure,                                                      "vector[float64?]"),
+    (overlap > 0,                                                  "vector[bool]"),
+    (measure.filter(overlap > 0).sum(),                            "reduced[float64]"),
+    (measure.filter(overlap > 0).sum() > 1,                        "reduced[bool]"),
+    (measure.filter(overlap > 0).index_of_max(),                   "reduced[int64?]"),
+    (measure.at_index(overlap.filter(overlap > 0).index_of_max()), "reduced[float64?]"),
+    (surface.filter(overlap > 0).dominant(overlap),                "reduced[object?]"),
+])
+def test_types(plan, expected):
+    assert str(plan_type(plan, **DTYPES)) == expected
+
+
+def test_output_dtypes_are_only_given_for_numbers_per_row():
+    assert plan_type(measure.filter(overlap > 0).sum(), **DTYPES).output_dtype == np.float64
+    assert plan_type(measure, **DTYPES).output_dtype is None
+    assert plan_type(surface.filter(overlap > 0).dominant(overlap), **DTYPES).output_dtype is None
+
+
+def test_plans_with_named_outputs_are_typed_per_output():
+    plan = AST.optimize_columns([width * 2, measure.filter(overlap > 0).sum()])
+    assert plan_type(plan, **DTYPES).kind == "outputs"
+    types = infer_types(plan, **DTYPES)
+    outputs = plan.children[-1]
+    assert [str(types[id(output)]) for output in outputs.children] == ["scalar[int64]", "reduced[float64]"]
+
+
+@pytest.mark.parametrize(("plan", "message"), [
+    (width.filter(overlap > 0),                          "Unable to filter a scalar"),
+    (measure.filter(measure),                            "mask must be a boolean Series"),
+    (width.sum(),                                        "Unable to sum a scalar"),
+    (measure.filter(overlap > 0).index_of_max().sum(),   "Unable to sum a reduced"),
+    (AST.refer("missing"),                               "before it is declared"),
+    (AST.left_column("day") + measure,                   "Cannot apply \\+"),
+    (surface.filter(overlap > 0).dominant(surface),      "Weights must be numeric"),
+])
+def test_plans_that_cannot_work_are_refused(plan, message):
+    with pytest.raises(PlanTypeError, match=message):
+        infer_types(plan, **DTYPES)
+
+
+def test_merges_refuse_such_plans_before_evaluating(network):
+    left, right = network
+    for engine in ["row", "batch"]:
+        with pytest.raises(PlanTypeError, match="Unable to sum a scalar"):
+            merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), [AST.left_column("left_measure").sum()], engine=engine)
+
+
+def test_deep_plans_are_typed():
+    plan = measure.filter(overlap > 0).sum()
+    for _ in range(5000):
+        plan = plan + width
+    assert str(plan_type(plan, **DTYPES)) == "reduced[float64]"
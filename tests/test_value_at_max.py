@@ -0,0 +1,69 @@
+"""The fused `value_at_max` gives what `at_index(...index_of_max())` gives, ties and missing values included."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from merge import AST, merge_on_intervals
+from merge._ast import _value_at_max
+from merge._rewrite import rewrite_plan
+
+overlap = AST.length_of_overlap()
+measure = AST.right_column("measure")
+
+LONGEST = measure.at_index(overlap.filter(overlap > 0).index_of_max())
+
+
+def _evaluate(plan:AST, measures:list, overlaps:list, index:list):
+    return AST.evaluate(
+        plan, {}, 10.0,
+        pd.DataFrame({"measure": measures}, index=index),
+        pd.Series(10.0, index=index),
+        pd.Series(overlaps, index=index, dtype=float),
+    )
+
+
+def test_the_rewrite_fuses_the_lookup():
+    assert rewrite_plan(LONGEST).action == "value_at_max"
+
+
+@pytest.mark.parametrize(("measures", "overlaps", "expected"), [
+    ([1.0, 2.0, 3.0],    [1, 3, 2],           2.0),
+    # ties go to the first right row
+    ([1.0, 2.0, 3.0],    [3, 1, 3],           1.0),
+    # missing keys are skipped
+    ([1.0, 2.0, 3.0],    [np.nan, 1, np.nan], 2.0),
+    # the value at the chosen row may be missing itself
+    ([np.nan, 2.0, 3.0], [5, 1, 2],           np.nan),
+    # nothing is kept
+    ([1.0, 2.0],         [0, -1],             pd.NA),
+    ([],                 [],                  pd.NA),
+])
+def test_fused_and_unfused_agree(measures, overlaps, expected):
+    index = [30, 10, 20][:len(measures)]
+    for plan in (LONGEST, rewrite_plan(LONGEST)):
+        result = _evaluate(plan, measures, overlaps, index)
+        assert (pd.isna(expected) and pd.isna(result)) or result == expected
+
+
+def test_keys_that_are_not_numbers():
+    series = pd.Series([1.0, 2.0, 3.0])
+    assert _value_at_max(series, pd.Series(["b", "c", "c"], dtype=object)) == 2.0
+    assert _value_at_max(series, pd.Series(["b", None, "a"], dtype=object), pd.Series([False, True, True])) == 3.0
+
+
+@pytest.mark.parametrize("engine", ["row", "batch"])
+def test_merges_keep_the_value_of_the_longest_overlap(network, engine):
+    left, right = network
+    column = AST.right_column("right_measure").at_index(overlap.filter(overlap > 0).index_of_max()).alias("longest")
+    result = merge_on_intervals(left, right, ["road", "cwy"], ("slk_from", "slk_to"), [column], engine=engine)
+
+    for row, value in zip(left.itertuples(), result["longest"]):
+        group = right[(right["road"] == row.road) & (right["cwy"] == row.cwy)]
+        lengths = np.minimum(group["slk_to"], row.slk_to) - np.maximum(group["slk_from"], row.slk_from)
+        lengths = lengths[lengths > 0]
+        if lengths.empty:
+            assert pd.isna(value)
+        else:
+            # the first right row, in the order of the right data, with the longest overlap
+            expected = group.loc[lengths.idxmax(), "right_measure"]
+            assert (pd.isna(expected) and pd.isna(value)) or value == expected
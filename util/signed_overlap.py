@@ -1,9 +1,85 @@
+from typing import Iterator
+
 import numpy as np
 from numpy import typing as npt
 
+# coordinates within this range can be subtracted from each other in int32 without overflow
+_INT32_LIMIT = 2**30
+
+
 def overlap(a:npt.NDArray, b:npt.NDArray, x:npt.NDArray, y:npt.NDArray):
     """Compute the signed distance between lists of intervals"""
     overlap_min = np.maximum(a, x.reshape(-1,1))
     overlap_max = np.minimum(b, y.reshape(-1,1))
     signed_overlap_len = overlap_max - overlap_min
-    return signed_overlap_len
\ No newline at end of file
+    return signed_overlap_len
+
+
+def coordinates(*arrays:npt.NDArray) -> list[npt.NDArray]:
+    """The arrays as int32 when they all hold integers small enough, otherwise unchanged.
+
+    Whole-metre SLKs fit easily, and int32 halves the memory and the time of
+    every block compared to int64 or float64.
+    """
+    arrays_ = [np.asarray(array) for array in arrays]
+    if not all(np.issubdtype(array.dtype, np.integer) for array in arrays_):
+        return arrays_
+    non_empty = [array for array in arrays_ if len(array)]
+    if non_empty and (
+           min(array.min() for array in non_empty) <  -_INT32_LIMIT
+        or max(array.max() for array in non_empty) >=  _INT32_LIMIT
+    ):
+        return arrays_
+    return [array.astype(np.int32, copy=False) for array in arrays_]
+
+
+def block_shape(rows:int, columns:int, itemsize:int, max_bytes:int) -> tuple[int, int]:
+    """Rows and columns of the largest block whose two working arrays fit in `max_bytes`"""
+    items = max(max_bytes // (2 * itemsize), 1)
+    block_columns = max(min(columns, items), 1)
+    block_rows    = max(min(rows, items // block_columns), 1)
+    return block_rows, block_columns
+
+
+def overlap_blocks(
+    a         :npt.NDArray,
+    b         :npt.NDArray,
+    x         :npt.NDArray,
+    y         :npt.NDArray,
+    max_bytes :int = 64 * 2**20,
+) -> Iterator[tuple[slice, slice, npt.NDArray]]:
+    """`overlap(a, b, x, y)` one block at a time, without holding the whole matrix.
+
+    Yields `(rows, columns, block)` where `block` equals
+    `overlap(a, b, x, y)[rows, columns]`. Each block and its intermediate
+    array together stay within `max_bytes`. Integer coordinates that fit are
+    computed in int32.
+    """
+    a, b, x, y = coordinates(a, b, x, y)
+    itemsize = np.result_type(a, b, x, y).itemsize
+    block_rows, block_columns = block_shape(len(x), len(a), itemsize, max_bytes)
+    for row_start in range(0, len(x), block_rows):
+        rows = slice(row_start, row_start + block_rows)
+        for column_start in range(0, len(a), block_columns):
+            columns = slice(column_start, column_start + block_columns)
+            block = np.maximum(a[columns], x[rows].reshape(-1,1))
+            np.subtract(np.minimum(b[columns], y[rows].reshape(-1,1)), block, out=block)
+            yield rows, columns, block
+
+
+def overlapping_pairs(
+    a         :npt.NDArray,
+    b         :npt.NDArray,
+    x         :npt.NDArray,
+    y         :npt.NDArray,
+    max_bytes :int = 64 * 2**20,
+) -> Iterator[tuple[npt.NDArray, npt.NDArray, npt.NDArray]]:
+    """The pairs that overlap by more than zero, one block of `overlap_blocks` at a time.
+
+    Yields `(row_positions, column_positions, lengths)`: positions into `x`
+    and `a`, and the overlap of each pair, in row-major order within each
+    block.
+    """
+    for rows, columns, block in overlap_blocks(a, b, x, y, max_bytes):
+        block_row, block_column = np.nonzero(block > 0)
+        yield block_row + rows.start, block_column + columns.start, block[block_row, block_column]